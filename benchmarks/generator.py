@@ -0,0 +1,403 @@
+"""Deterministic generator of synthetic catalogues to benchmark the mappings with."""
+import random
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import List, NamedTuple
+
+from django.contrib.sites.models import Site
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.partner import PartnerModelToResource
+from oscar_odin.resources.catalogue import (
+    CategoryResource,
+    ProductClassResource,
+    ProductImageResource,
+    ProductResource,
+)
+from oscar_odin.resources.partner import PartnerResource, StockRecordResource
+
+Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+ProductCategory = get_model("catalogue", "ProductCategory")
+ProductClass = get_model("catalogue", "ProductClass")
+ProductImage = get_model("catalogue", "ProductImage")
+AttributeOption = get_model("catalogue", "AttributeOption")
+AttributeOptionGroup = get_model("catalogue", "AttributeOptionGroup")
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+Order = get_model("order", "Order")
+Line = get_model("order", "Line")
+LinePrice = get_model("order", "LinePrice")
+
+
+class CatalogueShape(NamedTuple):
+    """The size and shape of a generated catalogue."""
+
+    standalone_products: int = 100
+    parent_products: int = 10
+    variants_per_parent: int = 3
+    product_classes: int = 2
+    # The amount of attributes of every attribute type, per product class.
+    attributes_per_type: int = 1
+    images_per_product: int = 2
+    partners: int = 2
+    # The amount of partners that have a stock record for a product.
+    stockrecords_per_product: int = 2
+    categories: int = 20
+    categories_per_product: int = 2
+    orders: int = 20
+    lines_per_order: int = 3
+    seed: int = 42
+
+    @property
+    def products(self) -> int:
+        return self.standalone_products + self.parent_products * (
+            1 + self.variants_per_parent
+        )
+
+
+SHAPES = {
+    "small": CatalogueShape(),
+    "medium": CatalogueShape(
+        standalone_products=1000,
+        parent_products=100,
+        variants_per_parent=4,
+        product_classes=4,
+        attributes_per_type=2,
+        partners=4,
+        categories=100,
+        orders=200,
+    ),
+    "large": CatalogueShape(
+        standalone_products=10000,
+        parent_products=1000,
+        variants_per_parent=5,
+        product_classes=8,
+        attributes_per_type=2,
+        images_per_product=3,
+        partners=8,
+        stockrecords_per_product=3,
+        categories=500,
+        categories_per_product=3,
+        orders=2000,
+        lines_per_order=4,
+    ),
+}
+
+# Entity attributes are left out, their values are mapped with a json method that
+# none of the Oscar models have.
+ATTRIBUTE_TYPES = [
+    ProductAttribute.TEXT,
+    ProductAttribute.INTEGER,
+    ProductAttribute.BOOLEAN,
+    ProductAttribute.FLOAT,
+    ProductAttribute.RICHTEXT,
+    ProductAttribute.DATE,
+    ProductAttribute.DATETIME,
+    ProductAttribute.OPTION,
+    ProductAttribute.MULTI_OPTION,
+    ProductAttribute.FILE,
+    ProductAttribute.IMAGE,
+]
+
+
+def set_attribute_value(value, attribute, rng: random.Random, options):
+    """Set a random value of the type of the attribute on an attribute value."""
+    attribute_type = attribute.type
+    if attribute_type == ProductAttribute.TEXT:
+        value.value_text = f"text {rng.randrange(1000)}"
+    elif attribute_type == ProductAttribute.RICHTEXT:
+        value.value_richtext = f"<p>text {rng.randrange(1000)}</p>"
+    elif attribute_type == ProductAttribute.INTEGER:
+        value.value_integer = rng.randrange(1000)
+    elif attribute_type == ProductAttribute.BOOLEAN:
+        value.value_boolean = rng.random() < 0.5
+    elif attribute_type == ProductAttribute.FLOAT:
+        value.value_float = round(rng.uniform(0, 100), 2)
+    elif attribute_type == ProductAttribute.DATE:
+        value.value_date = date(2020, 1, 1 + rng.randrange(28))
+    elif attribute_type == ProductAttribute.DATETIME:
+        value.value_datetime = datetime(
+            2020, 1, 1 + rng.randrange(28), tzinfo=timezone.utc
+        )
+    elif attribute_type == ProductAttribute.OPTION:
+        value.value_option = rng.choice(options)
+    elif attribute_type == ProductAttribute.FILE:
+        value.value_file = f"benchmark/files/{rng.randrange(1000)}.pdf"
+    elif attribute_type == ProductAttribute.IMAGE:
+        value.value_image = f"benchmark/images/{rng.randrange(1000)}.jpg"
+
+
+def generate_catalogue(shape: CatalogueShape):
+    """
+    Create a catalogue of the given shape in the database. The same shape (and seed)
+    always creates the same catalogue, so the results of runs can be compared.
+    """
+    rng = random.Random(shape.seed)
+
+    partners = Partner.objects.bulk_create(
+        [
+            Partner(name=f"Partner {index}", code=f"partner-{index}")
+            for index in range(shape.partners)
+        ]
+    )
+
+    categories = []
+    for index in range(shape.categories):
+        name = f"Category {index}"
+        if categories and index % 4:
+            category = rng.choice(categories).add_child(name=name, code=f"cat-{index}")
+        else:
+            category = Category.add_root(name=name, code=f"cat-{index}")
+        categories.append(category)
+
+    option_group = AttributeOptionGroup.objects.create(name="Benchmark options")
+    options = AttributeOption.objects.bulk_create(
+        [
+            AttributeOption(group=option_group, option=f"Option {index}")
+            for index in range(10)
+        ]
+    )
+
+    product_classes = ProductClass.objects.bulk_create(
+        [
+            ProductClass(name=f"Class {index}", slug=f"class-{index}", track_stock=True)
+            for index in range(shape.product_classes)
+        ]
+    )
+    attributes = {}
+    for product_class in product_classes:
+        attributes[product_class.pk] = ProductAttribute.objects.bulk_create(
+            [
+                ProductAttribute(
+                    product_class=product_class,
+                    name=f"{attribute_type} {index}",
+                    code=f"{attribute_type}_{index}",
+                    type=attribute_type,
+                    option_group=option_group
+                    if attribute_type
+                    in (ProductAttribute.OPTION, ProductAttribute.MULTI_OPTION)
+                    else None,
+                )
+                for attribute_type in ATTRIBUTE_TYPES
+                for index in range(shape.attributes_per_type)
+            ]
+        )
+
+    products = []
+    for index in range(shape.standalone_products + shape.parent_products):
+        is_parent = index >= shape.standalone_products
+        products.append(
+            Product(
+                structure=Product.PARENT if is_parent else Product.STANDALONE,
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                upc=f"upc-{index}",
+                description=f"Description of product {index}",
+                product_class=rng.choice(product_classes),
+                is_public=rng.random() < 0.95,
+            )
+        )
+    products = Product.objects.bulk_create(products)
+
+    children = Product.objects.bulk_create(
+        [
+            Product(
+                structure=Product.CHILD,
+                parent=parent,
+                title=f"{parent.title} variant {index}" if index % 2 else "",
+                slug=f"{parent.slug}-{index}",
+                upc=f"{parent.upc}-{index}",
+                is_public=True,
+            )
+            for parent in products
+            if parent.is_parent
+            for index in range(shape.variants_per_parent)
+        ]
+    )
+
+    # Attribute values, images and categories of the products that are not variants.
+    attribute_values, multi_options, images, product_categories = [], [], [], []
+    for product in products:
+        for attribute in attributes[product.product_class_id]:
+            value = ProductAttributeValue(product=product, attribute=attribute)
+            set_attribute_value(value, attribute, rng, options)
+            attribute_values.append(value)
+            if attribute.type == ProductAttribute.MULTI_OPTION:
+                multi_options.append((value, rng.sample(options, 2)))
+        for index in range(shape.images_per_product):
+            images.append(
+                ProductImage(
+                    product=product,
+                    original=f"benchmark/products/{product.upc}-{index}.jpg",
+                    code=f"{product.upc}-{index}",
+                    display_order=index,
+                )
+            )
+        for category in rng.sample(categories, shape.categories_per_product):
+            product_categories.append(
+                ProductCategory(product=product, category=category)
+            )
+    ProductAttributeValue.objects.bulk_create(attribute_values)
+    ProductAttributeValue.value_multi_option.through.objects.bulk_create(
+        [
+            ProductAttributeValue.value_multi_option.through(
+                productattributevalue=value, attributeoption=option
+            )
+            for value, value_options in multi_options
+            for option in value_options
+        ]
+    )
+    ProductImage.objects.bulk_create(images)
+    ProductCategory.objects.bulk_create(product_categories)
+
+    stockrecords = StockRecord.objects.bulk_create(
+        [
+            StockRecord(
+                product=product,
+                partner=partner,
+                partner_sku=f"{product.upc}-{partner.code}",
+                price=Decimal(rng.randrange(100, 10000)) / 100,
+                price_currency="EUR",
+                num_in_stock=rng.randrange(100),
+            )
+            for product in [*products, *children]
+            if not product.is_parent
+            for partner in rng.sample(partners, shape.stockrecords_per_product)
+        ]
+    )
+
+    generate_orders(shape, rng, stockrecords)
+
+
+def generate_orders(shape: CatalogueShape, rng: random.Random, stockrecords):
+    site = Site.objects.get_current()
+    orders = Order.objects.bulk_create(
+        [
+            Order(
+                number=f"{100000 + index}",
+                site=site,
+                currency="EUR",
+                total_incl_tax=Decimal("0.00"),
+                total_excl_tax=Decimal("0.00"),
+                guest_email=f"customer-{index}@example.com",
+                date_placed=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            )
+            for index in range(shape.orders)
+        ]
+    )
+
+    lines = []
+    for order in orders:
+        for stockrecord in rng.sample(stockrecords, shape.lines_per_order):
+            quantity = rng.randrange(1, 4)
+            line_price = stockrecord.price * quantity
+            lines.append(
+                Line(
+                    order=order,
+                    partner=stockrecord.partner,
+                    partner_name=stockrecord.partner.name,
+                    partner_sku=stockrecord.partner_sku,
+                    stockrecord=stockrecord,
+                    product=stockrecord.product,
+                    title=stockrecord.product.title,
+                    upc=stockrecord.product.upc,
+                    quantity=quantity,
+                    line_price_incl_tax=line_price,
+                    line_price_excl_tax=line_price,
+                    line_price_before_discounts_incl_tax=line_price,
+                    line_price_before_discounts_excl_tax=line_price,
+                    unit_price_incl_tax=stockrecord.price,
+                    unit_price_excl_tax=stockrecord.price,
+                    num_allocated=0,
+                )
+            )
+    lines = Line.objects.bulk_create(lines)
+    LinePrice.objects.bulk_create(
+        [
+            LinePrice(
+                order=line.order,
+                line=line,
+                quantity=line.quantity,
+                price_incl_tax=line.unit_price_incl_tax,
+                price_excl_tax=line.unit_price_excl_tax,
+            )
+            for line in lines
+        ]
+    )
+
+
+def generate_product_resources(
+    shape: CatalogueShape, prefix: str = "import", version: int = 0
+) -> List[ProductResource]:
+    """
+    Return resources of standalone products to store with products_to_db, they refer
+    to the product classes, categories and partners of the generated catalogue. A
+    higher version changes the prices and titles, and drops an image and category.
+    """
+    rng = random.Random(shape.seed + version)
+    partners = list(
+        PartnerModelToResource.apply(
+            Partner.objects.filter(code__startswith="partner-").order_by("pk")
+        )
+    )
+    images_per_product = max(shape.images_per_product - version, 0)
+    categories_per_product = max(shape.categories_per_product - version, 0)
+
+    resources = []
+    for index in range(shape.standalone_products):
+        upc = f"{prefix}-{index}"
+        resources.append(
+            ProductResource(
+                upc=upc,
+                title=f"Imported product {index} v{version}",
+                slug=f"{prefix}-product-{index}",
+                description=f"Description of imported product {index}",
+                structure=Product.STANDALONE,
+                is_discountable=True,
+                product_class=ProductClassResource(
+                    slug=f"class-{index % shape.product_classes}"
+                ),
+                images=[
+                    ProductImageResource(
+                        code=f"{upc}-{image_index}",
+                        caption=f"Image {image_index}",
+                        display_order=image_index,
+                        original=f"benchmark/imports/{upc}-{image_index}.jpg",
+                    )
+                    for image_index in range(images_per_product)
+                ],
+                categories=[
+                    CategoryResource(code=f"cat-{category_index}")
+                    for category_index in rng.sample(
+                        range(shape.categories), categories_per_product
+                    )
+                ],
+                stockrecords=[
+                    StockRecordResource(
+                        partner_sku=f"{upc}-{partner.code}",
+                        partner=partner,
+                        price=Decimal(rng.randrange(100, 10000)) / 100,
+                        currency="EUR",
+                        num_in_stock=rng.randrange(100),
+                    )
+                    for partner in rng.sample(partners, shape.stockrecords_per_product)
+                ],
+                attributes={
+                    f"{ProductAttribute.TEXT}_0": f"text {rng.randrange(1000)}",
+                    f"{ProductAttribute.INTEGER}_0": rng.randrange(1000),
+                },
+            )
+        )
+    return resources
+
+
+def generate_partner_resources(shape: CatalogueShape) -> List[PartnerResource]:
+    """Return resources of new partners to store with resources_to_db."""
+    return [
+        PartnerResource(name=f"Imported partner {index}", code=f"imported-{index}")
+        for index in range(shape.standalone_products)
+    ]
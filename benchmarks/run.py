@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+Benchmark the product and order mappings on a generated catalogue.
+
+Every benchmark is timed ``--repeat`` times, and run once more to count the queries
+and record the peak memory (tracemalloc slows the run down, so that run isn't
+timed). The results are written as JSON, pass the results of an earlier run with
+``--compare`` to print the differences.
+
+Usage::
+
+    python benchmarks/run.py --shape medium --output results.json
+    python benchmarks/run.py --shape medium --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def setup_django():
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "tests"))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_settings")
+    django.setup()
+
+
+def get_benchmarks(shape):
+    # pylint: disable=import-outside-toplevel
+    from oscar.core.loading import get_model
+
+    from oscar_odin.mappings.constants import MODEL_IDENTIFIERS_MAPPING
+    from oscar_odin.mappings.helpers import (
+        product_queryset_to_resources,
+        products_to_db,
+    )
+    from oscar_odin.mappings.order import order_to_resource
+    from oscar_odin.mappings.partner import PartnerToModel
+    from oscar_odin.mappings.resources import resources_to_db
+
+    from benchmarks.generator import (
+        generate_partner_resources,
+        generate_product_resources,
+    )
+
+    Product = get_model("catalogue", "Product")
+    Order = get_model("order", "Order")
+
+    def product_resources(include_children=False):
+        return lambda: product_queryset_to_resources(
+            Product.objects.all(), include_children=include_children
+        )
+
+    def import_products(version, existing=None, **kwargs):
+        # Setup of every run, the resources are not part of the measurement.
+        def setup():
+            if existing is not None:
+                products_to_db(generate_product_resources(shape, version=existing))
+            return generate_product_resources(shape, version=version)
+
+        def run(resources):
+            _, errors = products_to_db(resources, **kwargs)
+            if errors:
+                raise RuntimeError(f"products_to_db failed: {errors[:5]}")
+
+        return setup, run
+
+    def import_partners():
+        def run(resources):
+            resources_to_db(
+                resources,
+                ["Partner.name"],
+                MODEL_IDENTIFIERS_MAPPING,
+                model_mapper=PartnerToModel,
+            )
+
+        return lambda: generate_partner_resources(shape), run
+
+    # name: (setup, run, amount of objects)
+    return {
+        "product_queryset_to_resources": (
+            None,
+            product_resources(),
+            shape.products,
+        ),
+        "product_queryset_to_resources[include_children]": (
+            None,
+            product_resources(include_children=True),
+            shape.products,
+        ),
+        "order_to_resource": (
+            None,
+            lambda: order_to_resource(list(Order.objects.all())),
+            shape.orders,
+        ),
+        "products_to_db[create]": (
+            *import_products(0),
+            shape.standalone_products,
+        ),
+        "products_to_db[update]": (
+            *import_products(1, existing=0),
+            shape.standalone_products,
+        ),
+        "products_to_db[delete_related]": (
+            *import_products(1, existing=0, delete_related=True),
+            shape.standalone_products,
+        ),
+        "products_to_db[skip_unchanged]": (
+            *import_products(0, existing=0, skip_unchanged=True),
+            shape.standalone_products,
+        ),
+        "products_to_db[upsert]": (
+            *import_products(1, existing=0, upsert=True),
+            shape.standalone_products,
+        ),
+        "resources_to_db[partners]": (
+            *import_partners(),
+            shape.standalone_products,
+        ),
+    }
+
+
+class QueryCounter:
+    """Count the queries, without the limit of the queries log of connections."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_once(setup, run, measure):
+    """Run a benchmark in a transaction that is rolled back afterwards."""
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection, transaction
+
+    with transaction.atomic():
+        args = (setup(),) if setup is not None else ()
+        if measure:
+            counter = QueryCounter()
+            tracemalloc.start()
+            with connection.execute_wrapper(counter):
+                run(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result = {"queries": counter.count, "peak_memory": peak}
+        else:
+            start = time.perf_counter()
+            run(*args)
+            result = {"duration": time.perf_counter() - start}
+        transaction.set_rollback(True)
+    return result
+
+
+def run_benchmarks(shape, repeat, only=None, stream=sys.stderr):
+    results = []
+    for name, (setup, run, objects) in get_benchmarks(shape).items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+
+        durations = [
+            run_once(setup, run, measure=False)["duration"] for _ in range(repeat)
+        ]
+        measured = run_once(setup, run, measure=True)
+        result = {
+            "name": name,
+            "objects": objects,
+            "durations": durations,
+            "min": min(durations),
+            "median": statistics.median(durations),
+            **measured,
+        }
+        results.append(result)
+        print(
+            f"{name:<50} {result['median'] * 1000:>10.1f} ms "
+            f"{result['queries']:>7} queries {result['peak_memory'] / 2**20:>8.1f} MiB",
+            file=stream,
+        )
+    return results
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_metadata(shape_name, shape, repeat):
+    # pylint: disable=import-outside-toplevel
+    import oscar
+    from django.db import connection
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": get_git_revision(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "oscar": oscar.get_version(),
+        "database": connection.vendor,
+        "shape_name": shape_name,
+        "shape": shape._asdict(),
+        "repeat": repeat,
+    }
+
+
+def compare(results, baseline):
+    """Print the change of the median duration and queries against a baseline run."""
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    for result in results:
+        other = baseline_results.get(result["name"])
+        if other is None:
+            continue
+        print(
+            f"{result['name']:<50} "
+            f"{result['median'] / other['median']:>6.2f}x time "
+            f"{result['queries'] - other['queries']:>+7} queries "
+            f"{result['peak_memory'] / other['peak_memory']:>6.2f}x memory"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--shape", default="small", help="small, medium or large")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--only", action="append", help="Only run benchmarks that contain this name"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results in this JSON file")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    # pylint: disable=import-outside-toplevel
+    from django.test.utils import get_runner
+    from django.conf import settings
+
+    from benchmarks.generator import SHAPES, generate_catalogue
+
+    shape = SHAPES[args.shape]
+    if args.seed is not None:
+        shape = shape._replace(seed=args.seed)
+
+    # The test runner creates a separate database and turns off DEBUG (and with it
+    # the logging of all queries).
+    runner = get_runner(settings)(verbosity=0)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        generate_catalogue(shape)
+        output = {
+            "meta": get_metadata(args.shape, shape, args.repeat),
+            "results": run_benchmarks(shape, args.repeat, args.only),
+        }
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as results_file:
+            json.dump(output, results_file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            compare(output["results"], json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
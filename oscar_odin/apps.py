@@ -14,6 +14,28 @@ class OscarOdinAppConfig(OscarConfig):
         """Hook that Django apps have been loaded."""
 
         # Register the default prefetches for the product queryset
-        from oscar_odin.mappings.prefetching.prefetch import register_default_prefetches
+        from oscar_odin.mappings.prefetching.prefetch import (
+            register_default_order_prefetches,
+            register_default_prefetches,
+        )
 
         register_default_prefetches()
+        register_default_order_prefetches()
+
+        # Invalidate cached product resources when products change
+        from oscar_odin.mappings.cache import connect_product_resource_cache_signals
+
+        connect_product_resource_cache_signals()
+
+        # Forget cached primary keys of objects that change outside of imports
+        from oscar_odin.mappings.identifiers import connect_identifier_cache_signals
+
+        connect_identifier_cache_signals()
+
+        # Touch products when related objects without a timestamp change
+        from oscar_odin.settings import TRACK_PRODUCT_CHANGES
+
+        if TRACK_PRODUCT_CHANGES:
+            from oscar_odin.mappings.changes import connect_product_changes_signals
+
+            connect_product_changes_signals()
@@ -37,7 +37,7 @@ class BillingAddressToResource(OscarBaseMapping):
     @odin.assign_field
     def country(self) -> CountryResource:
         """Map country."""
-        return CountryToResource.apply(self.source.country)
+        return CountryToResource.apply(self.source.country, context=self.context)
 
 
 class ShippingAddressToResource(OscarBaseMapping):
@@ -49,4 +49,4 @@ class ShippingAddressToResource(OscarBaseMapping):
     @odin.assign_field
     def country(self) -> CountryResource:
         """Map country."""
-        return CountryToResource.apply(self.source.country)
+        return CountryToResource.apply(self.source.country, context=self.context)
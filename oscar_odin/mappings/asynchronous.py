@@ -0,0 +1,231 @@
+"""
+Async entry points of the product and order mappings.
+
+The mappings run in a bounded executor (see ``ASYNC_MAPPING_WORKERS``), not in
+Django's thread sensitive sync thread. Queries a mapping does itself, eg; for
+relations that aren't prefetched, use the database connection of the executor
+thread, so they run outside of a transaction the caller has open and don't see its
+uncommitted changes. Set ``ASYNC_MAPPING_WORKERS = 0`` to map in the thread
+sensitive sync thread instead.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional, Union
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AbstractUser
+from django.db import close_old_connections
+from django.db.models import QuerySet
+from django.http import HttpRequest
+from odin.mapping import ImmediateResult
+
+from oscar.core.loading import get_class, get_classes, get_model
+
+from ..settings import ASYNC_MAPPING_WORKERS, PRODUCTS_TO_RESOURCES_CHUNK_SIZE
+from ..utils import achunked_queryset
+
+__all__ = (
+    "aproduct_queryset_to_resources",
+    "aproduct_queryset_to_resources_iterator",
+    "aorder_to_resource",
+    "aorder_queryset_to_resources",
+)
+
+OrderModel = get_model("order", "Order")
+
+ProductResource = get_class("oscar_odin.resources.catalogue", "ProductResource")
+OrderResource = get_class("oscar_odin.resources.order", "OrderResource")
+
+ProductToResource = get_class("oscar_odin.mappings.catalogue", "ProductToResource")
+OrderToResource = get_class("oscar_odin.mappings.order", "OrderToResource")
+product_to_resource_with_strategy = get_class(
+    "oscar_odin.mappings.helpers", "product_to_resource_with_strategy"
+)
+prefetch_order_queryset, prefetch_product_queryset = get_classes(
+    "oscar_odin.mappings.prefetching.prefetch",
+    ["prefetch_order_queryset", "prefetch_product_queryset"],
+)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_mapping_executor() -> Optional[ThreadPoolExecutor]:
+    """
+    Return the executor the async entry points map in. It's bounded by
+    ``ASYNC_MAPPING_WORKERS``, so concurrent requests can't exhaust the thread pool
+    that Django uses for sync_to_async. When ``ASYNC_MAPPING_WORKERS`` is 0, None is
+    returned and the mapping runs in Django's (thread sensitive) sync thread.
+    """
+    global _executor  # pylint: disable=global-statement
+    if not ASYNC_MAPPING_WORKERS:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=ASYNC_MAPPING_WORKERS,
+                thread_name_prefix="oscar_odin_mapping",
+            )
+        return _executor
+
+
+def close_connections_after(func):
+    """Close the database connections a mapping opened in an executor thread."""
+
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapper
+
+
+async def run_mapping(func, *args, **kwargs):
+    """
+    Run a (CPU bound) mapping function in the mapping executor. The queries of the
+    function use the connection of the executor thread, not the one of the caller.
+    """
+    executor = get_mapping_executor()
+    if executor is None:
+        return await sync_to_async(func)(*args, **kwargs)
+    return await sync_to_async(
+        close_connections_after(func), thread_sensitive=False, executor=executor
+    )(*args, **kwargs)
+
+
+def get_stock_strategy(request=None, user=None, **kwargs):
+    selector_type = get_class("partner.strategy", "Selector")
+    return selector_type().strategy(request=request, user=user, **kwargs)
+
+
+def map_products(products, stock_strategy, include_children, product_mapper, context):
+    return list(
+        product_to_resource_with_strategy(
+            products,
+            stock_strategy,
+            include_children,
+            product_mapper=product_mapper,
+            context=context,
+        )
+    )
+
+
+async def aproduct_queryset_to_resources_iterator(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    chunk_size: int = PRODUCTS_TO_RESOURCES_CHUNK_SIZE,
+    **kwargs,
+) -> AsyncIterator[ProductResource]:
+    """Async variant of ``product_queryset_to_resources_iterator``.
+
+    The chunks (and their prefetches) are fetched with the async ORM, the mapping
+    runs in the bounded mapping executor, so queries of the mapping itself run
+    outside of a transaction of the caller.
+
+    :param queryset: A queryset of product models.
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param chunk_size: The amount of products to fetch and map at once.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    stock_strategy = await run_mapping(get_stock_strategy, request, user, **kwargs)
+
+    queryset = prefetch_product_queryset(queryset, include_children, product_mapper)
+
+    # Related objects shared between products are mapped once for all chunks.
+    context = {"identity_map": {}}
+    async for chunk in achunked_queryset(queryset, chunk_size):
+        for resource in await run_mapping(
+            map_products,
+            chunk,
+            stock_strategy,
+            include_children,
+            product_mapper,
+            context,
+        ):
+            yield resource
+
+
+async def aproduct_queryset_to_resources(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    chunk_size: int = PRODUCTS_TO_RESOURCES_CHUNK_SIZE,
+    **kwargs,
+) -> List[ProductResource]:
+    """Async variant of ``product_queryset_to_resources``.
+
+    The resources are returned in primary key order, any ordering on the queryset
+    is ignored (see ``aproduct_queryset_to_resources_iterator``).
+
+    :param queryset: A queryset of product models.
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param chunk_size: The amount of products to fetch and map at once.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    return [
+        resource
+        async for resource in aproduct_queryset_to_resources_iterator(
+            queryset,
+            request,
+            user,
+            include_children,
+            product_mapper,
+            chunk_size,
+            **kwargs,
+        )
+    ]
+
+
+def map_orders(orders, request=None):
+    context = {"stock_strategy": get_stock_strategy(request)}
+    if isinstance(orders, OrderModel):
+        return OrderToResource.apply(orders, context=context)
+    return list(
+        OrderToResource.apply(orders, context=context, mapping_result=ImmediateResult)
+    )
+
+
+async def aorder_to_resource(
+    order: Union[OrderModel, List[OrderModel]],
+    request: Optional[HttpRequest] = None,
+) -> Union[OrderResource, List[OrderResource]]:
+    """Async variant of ``order_to_resource``, the mapping runs in the mapping executor.
+
+    The relations of the orders that aren't prefetched are fetched in the executor,
+    outside of a transaction of the caller.
+
+    :param order: A single order model or a list of order models.
+    :param request: The current HTTP request
+    """
+    return await run_mapping(map_orders, order, request)
+
+
+async def aorder_queryset_to_resources(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    chunk_size: int = PRODUCTS_TO_RESOURCES_CHUNK_SIZE,
+) -> List[OrderResource]:
+    """Async variant of ``order_queryset_to_resources``.
+
+    The orders are fetched in chunks with the async ORM, with the prefetches of the
+    order_prefetch_registry, and mapped in the mapping executor. The resources are
+    returned in primary key order.
+
+    :param queryset: A queryset of order models.
+    :param request: The current HTTP request
+    :param chunk_size: The amount of orders to fetch and map at once.
+    """
+    resources = []
+    async for chunk in achunked_queryset(prefetch_order_queryset(queryset), chunk_size):
+        resources.extend(await run_mapping(map_orders, chunk, request))
+    return resources
@@ -0,0 +1,450 @@
+"""Cache of mapped product resources."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from odin.codecs import dict_codec
+
+from oscar.apps.partner.strategy import Default as DefaultStrategy
+from oscar.core.loading import get_class, get_model
+
+from .prefetching.prefetch import prefetch_product_queryset
+from ..utils import chunked
+from ..settings import (
+    PRODUCT_RESOURCE_CACHE_BACKEND,
+    PRODUCT_RESOURCE_CACHE_SIZE,
+    PRODUCT_RESOURCE_CACHE_TIMEOUT,
+)
+
+__all__ = (
+    "ProductResourceCache",
+    "product_resource_cache",
+    "invalidate_product_resources",
+    "connect_product_resource_cache_signals",
+)
+
+ProductModel = get_model("catalogue", "Product")
+ProductCategoryModel = get_model("catalogue", "ProductCategory")
+ProductImageModel = get_model("catalogue", "ProductImage")
+ProductAttributeValueModel = get_model("catalogue", "ProductAttributeValue")
+StockRecordModel = get_model("partner", "StockRecord")
+
+ProductToResource = get_class("oscar_odin.mappings.catalogue", "ProductToResource")
+resource_to_primitive = get_class("oscar_odin.mappings.common", "resource_to_primitive")
+
+KEY_PREFIX = "oscar_odin:product_resource"
+
+
+def get_stock_strategy_identity(stock_strategy: DefaultStrategy) -> str:
+    """
+    Return the identity of a stock strategy, used as part of the cache key.
+
+    By default this is the class of the strategy. Strategies of which the prices
+    depend on the request or user should define a ``cache_key`` attribute that
+    identifies the prices they return (eg; the customer group of the user).
+    """
+    cache_key = getattr(stock_strategy, "cache_key", None)
+    if cache_key is not None:
+        return str(cache_key)
+    strategy_type = type(stock_strategy)
+    return f"{strategy_type.__module__}.{strategy_type.__qualname__}"
+
+
+def get_affected_product_ids(product_id, parent_id=None, is_parent=None) -> Set[int]:
+    """
+    Return the ids of all products of which the resource changes when the product
+    with the given id changes; the product itself, its parent (which includes its
+    children) and its children (which include the parent's attributes).
+    """
+    if product_id is None:
+        return set()
+
+    if is_parent is False:
+        return {product_id, parent_id} - {None}
+
+    product_ids = {product_id}
+    for pk, product_parent_id in ProductModel.objects.filter(
+        Q(pk=product_id) | Q(parent_id=product_id)
+    ).values_list("pk", "parent_id"):
+        product_ids.add(pk)
+        if pk == product_id and product_parent_id is not None:
+            product_ids.add(product_parent_id)
+    return product_ids
+
+
+class ProductResourceCache:
+    """
+    Two tier cache of mapped product resources.
+
+    The first tier is an in-process LRU cache of resources, the optional second
+    tier is a Django cache (``PRODUCT_RESOURCE_CACHE_BACKEND``) that stores the
+    resources as dictionaries, so it can be shared between processes.
+
+    Entries are keyed by the product pk and date_updated, the identity of the stock
+    strategy, the mapper class and the mapping options. Changes that don't update
+    the product itself (stock records, images, attribute values and categories) are
+    handled by ``invalidate``, which is connected to the post_save and post_delete
+    signals of those models (see ``connect_product_resource_cache_signals``) and
+    called by ``resources_to_db`` for the products it saves.
+
+    Entries of both tiers expire after ``timeout`` seconds, so changes that are not
+    invalidated in this process (eg; made by another process without a shared second
+    tier, or by bulk writes) are picked up eventually.
+
+    Cached resources are shared between callers and should be treated as read only.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = PRODUCT_RESOURCE_CACHE_SIZE,
+        cache_alias: Optional[str] = PRODUCT_RESOURCE_CACHE_BACKEND,
+        timeout: Optional[int] = PRODUCT_RESOURCE_CACHE_TIMEOUT,
+    ):
+        self.maxsize = maxsize
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        # Cache key to the resource and the time it expires.
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._keys_by_product: Dict[int, Set[str]] = {}
+        self._product_by_key: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def backend(self):
+        """The Django cache used as second tier, if any."""
+        if self.cache_alias is None:
+            return None
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def get_version_key(product_id) -> str:
+        return f"{KEY_PREFIX}:version:{product_id}"
+
+    def get_versions(self, product_ids: Iterable[int]) -> Dict[int, Any]:
+        """
+        Return the version of every product in the second tier. The version is
+        changed when a product is invalidated, which makes the old entries of the
+        product unreachable for all processes.
+        """
+        backend = self.backend
+        if backend is None:
+            return {}
+
+        version_keys = {self.get_version_key(pk): pk for pk in product_ids}
+        versions = backend.get_many(list(version_keys))
+        return {version_keys[key]: version for key, version in versions.items()}
+
+    def get_key(
+        self,
+        product,
+        stock_strategy: DefaultStrategy,
+        product_mapper=ProductToResource,
+        include_children: bool = False,
+        primitive: bool = False,
+        version: Any = 0,
+    ) -> str:
+        """Return the cache key of the resource of a product."""
+        date_updated = product.date_updated.isoformat() if product.date_updated else ""
+        return ":".join(
+            [
+                KEY_PREFIX,
+                str(product.pk),
+                str(version),
+                date_updated,
+                get_stock_strategy_identity(stock_strategy),
+                f"{product_mapper.__module__}.{product_mapper.__qualname__}",
+                str(int(include_children)),
+                str(int(primitive)),
+            ]
+        )
+
+    def get_many(
+        self, keys: Dict[str, int], product_mapper, primitive: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Return the cached resources of the keys that are in either tier.
+
+        :param keys: A dictionary of cache key to product id.
+        """
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires is not None and expires <= now:
+                    self._remove_local(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+
+        backend = self.backend
+        missing = [key for key in keys if key not in found]
+        if backend is not None and missing:
+            for key, value in backend.get_many(missing).items():
+                if not primitive:
+                    value = dict_codec.load(
+                        value, resource=product_mapper.to_obj, full_clean=False
+                    )
+                found[key] = value
+                self._set_local(key, keys[key], value)
+        return found
+
+    def set_many(
+        self, keys: Dict[str, int], values: Dict[str, Any], primitive: bool = False
+    ):
+        """
+        Store resources in both tiers.
+
+        :param keys: A dictionary of cache key to product id.
+        :param values: A dictionary of cache key to resource.
+        """
+        for key, value in values.items():
+            self._set_local(key, keys[key], value)
+
+        backend = self.backend
+        if backend is not None and values:
+            backend.set_many(
+                {
+                    key: value if primitive else resource_to_primitive(value)
+                    for key, value in values.items()
+                },
+                timeout=self.timeout,
+            )
+
+    def _set_local(self, key: str, product_id: int, value):
+        if self.maxsize <= 0:
+            return
+
+        expires = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            self._product_by_key[key] = product_id
+            self._keys_by_product.setdefault(product_id, set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._remove_local(next(iter(self._entries)))
+
+    def _remove_local(self, key: str):
+        self._entries.pop(key, None)
+        product_id = self._product_by_key.pop(key, None)
+        product_keys = self._keys_by_product.get(product_id)
+        if product_keys is not None:
+            product_keys.discard(key)
+            if not product_keys:
+                del self._keys_by_product[product_id]
+
+    def map(
+        self,
+        products,
+        stock_strategy: DefaultStrategy,
+        include_children: bool = False,
+        product_mapper=ProductToResource,
+        primitive: bool = False,
+    ):
+        """
+        Map a product or a list of products to resources, using the cached resources
+        where possible. Products that are not cached are mapped together in one batch.
+
+        :param products: A single product model or iterable of product models.
+        :param stock_strategy: The stock strategy to resolve prices with.
+        :param include_children: Include children of parent products.
+        :param product_mapper: The mapping to use.
+        :param primitive: Map the products to dictionaries instead of resources.
+        """
+        if isinstance(products, ProductModel):
+            return self.map(
+                [products], stock_strategy, include_children, product_mapper, primitive
+            )[0]
+
+        products = list(products)
+        versions = self.get_versions(product.pk for product in products)
+        keys = [
+            self.get_key(
+                product,
+                stock_strategy,
+                product_mapper,
+                include_children,
+                primitive,
+                versions.get(product.pk, 0),
+            )
+            for product in products
+        ]
+        product_ids = {key: product.pk for key, product in zip(keys, products)}
+        found = self.get_many(product_ids, product_mapper, primitive)
+
+        missing = {}
+        for product, key in zip(products, keys):
+            if key not in found:
+                missing.setdefault(key, product)
+
+        with self._lock:
+            self.hits += len(products) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            missing_products = list(missing.values())
+            if not all(
+                hasattr(product, "_prefetched_objects_cache")
+                for product in missing_products
+            ):
+                # Fetch the products that aren't prefetched again with the prefetches
+                # of the mapping, rather than querying the related objects per product.
+                queryset = prefetch_product_queryset(
+                    ProductModel.objects.filter(
+                        pk__in=[product.pk for product in missing_products]
+                    ),
+                    include_children,
+                    product_mapper,
+                )
+                prefetched = {product.pk: product for product in queryset}
+                missing_products = [
+                    prefetched.get(product.pk, product) for product in missing_products
+                ]
+
+            mapped = product_mapper.apply(
+                missing_products,
+                context={
+                    "stock_strategy": stock_strategy,
+                    "include_children": include_children,
+                    "primitive": primitive,
+                },
+            )
+            values = dict(zip(missing, mapped))
+            self.set_many(product_ids, values, primitive)
+            found.update(values)
+
+        return [found[key] for key in keys]
+
+    def invalidate(self, product_ids: Iterable[int]):
+        """Remove the cached resources of the products from both tiers."""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+
+        with self._lock:
+            for product_id in product_ids:
+                for key in self._keys_by_product.pop(product_id, ()):
+                    self._entries.pop(key, None)
+                    self._product_by_key.pop(key, None)
+
+        backend = self.backend
+        if backend is not None:
+            version = time.time_ns()
+            backend.set_many(
+                {self.get_version_key(pk): version for pk in product_ids},
+                timeout=None,
+            )
+
+    def clear(self):
+        """Empty the in-process tier and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_product.clear()
+            self._product_by_key.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def has_entries(self) -> bool:
+        """Return whether there could be anything to invalidate."""
+        return bool(self._entries) or self.cache_alias is not None
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit and miss counters and the size of the in-process tier."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+product_resource_cache = ProductResourceCache()
+
+
+def invalidate_product_resources(product_ids: Iterable[int]):
+    """
+    Invalidate the cached resources of the products, and of their parents and
+    children, eg; after bulk writes that don't send signals.
+    """
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if not product_ids or not product_resource_cache.has_entries():
+        return
+
+    affected_ids = set(product_ids)
+    for chunk in chunked(list(product_ids)):
+        for pk, parent_id in ProductModel.objects.filter(
+            Q(pk__in=chunk) | Q(parent_id__in=chunk)
+        ).values_list("pk", "parent_id"):
+            affected_ids.update((pk, parent_id))
+    affected_ids.discard(None)
+    product_resource_cache.invalidate(affected_ids)
+
+
+# pylint: disable=unused-argument
+def invalidate_product_resource_cache(sender, instance, **kwargs):
+    """Invalidate the cached resources of the product a saved or deleted object belongs to."""
+    if not product_resource_cache.has_entries():
+        return
+
+    if isinstance(instance, ProductModel):
+        product_ids = get_affected_product_ids(
+            instance.pk, instance.parent_id, instance.is_parent
+        )
+    else:
+        product_ids = get_affected_product_ids(instance.product_id)
+
+    product_resource_cache.invalidate(product_ids)
+
+
+def invalidate_product_resources_of_categories(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Invalidate the cached resources of the products of which categories were added
+    or removed with the categories relation, which doesn't send save or delete signals.
+    """
+    if not product_resource_cache.has_entries():
+        return
+
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_product_resources([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        invalidate_product_resources(pk_set or ())
+    elif action == "pre_clear":
+        # The products are gone from the relation after it's cleared.
+        invalidate_product_resources(
+            sender.objects.filter(category=instance).values_list(
+                "product_id", flat=True
+            )
+        )
+
+
+def connect_product_resource_cache_signals():
+    """Invalidate the product resource cache when products or their related objects change."""
+    for model in (
+        ProductModel,
+        StockRecordModel,
+        ProductImageModel,
+        ProductAttributeValueModel,
+        ProductCategoryModel,
+    ):
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_product_resource_cache,
+                sender=model,
+                dispatch_uid=(
+                    f"oscar_odin_product_resource_cache_{model._meta.label}_"
+                    f"{'save' if signal is post_save else 'delete'}"
+                ),
+            )
+    m2m_changed.connect(
+        invalidate_product_resources_of_categories,
+        sender=ProductModel.categories.through,
+        dispatch_uid="oscar_odin_product_resource_cache_categories",
+    )
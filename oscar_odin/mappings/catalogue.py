@@ -6,14 +6,27 @@ import logging
 from decimal import Decimal
 from typing import Any, Dict, List, Optional, Tuple
 
+from django.db.models import Prefetch, prefetch_related_objects
 from django.db.models.fields.files import ImageFieldFile
 from odin.mapping import ImmediateResult
-from oscar.apps.partner.strategy import Default as DefaultStrategy
+from oscar.apps.partner.strategy import (
+    Default as DefaultStrategy,
+    Structured,
+    UseFirstStockRecord,
+)
 from oscar.core.loading import get_class, get_classes, get_model
 
 from datetime import datetime
 
 from . import constants
+from .prefetching.planner import requires_prefetch
+from .prefetching.prefetch import (
+    prefetch_attribute_values,
+    prefetch_browsable_categories,
+    prefetch_product_queryset,
+    prefetch_public_children_stockrecords,
+)
+from .storage import storage_url_cache
 
 logger = logging.getLogger(__name__)
 
@@ -29,12 +42,14 @@ ProductImageModel = get_model("catalogue", "ProductImage")
 CategoryModel = get_model("catalogue", "Category")
 ProductClassModel = get_model("catalogue", "ProductClass")
 ProductModel = get_model("catalogue", "Product")
+ProductAttributeModel = get_model("catalogue", "ProductAttribute")
+AttributeOptionModel = get_model("catalogue", "AttributeOption")
 StockRecordModel = get_model("partner", "StockRecord")
 
 # mappings
 ModelMapping = get_class("oscar_odin.mappings.model_mapper", "ModelMapping")
-map_queryset, OscarBaseMapping = get_classes(
-    "oscar_odin.mappings.common", ["map_queryset", "OscarBaseMapping"]
+map_queryset, map_shared, OscarBaseMapping = get_classes(
+    "oscar_odin.mappings.common", ["map_queryset", "map_shared", "OscarBaseMapping"]
 )
 StockRecordToModel = get_class("oscar_odin.mappings.partner", "StockRecordToModel")
 
@@ -59,6 +74,241 @@ StockRecordToModel = get_class("oscar_odin.mappings.partner", "StockRecordToMode
 )
 
 
+def fetch_purchase_info(product, stock_strategy: DefaultStrategy):
+    """Fetch the purchase info of a single product using the stock strategy."""
+    if product.is_parent:
+        return stock_strategy.fetch_for_parent(product)
+    return stock_strategy.fetch_for_product(product)
+
+
+def purchase_info_to_stock_price(price_info) -> Tuple[Decimal, str, int, bool]:
+    """Decompose a purchase info into price, currency, availability and is_available_to_buy."""
+    return (
+        getattr(price_info.price, "incl_tax", Decimal(0)),
+        getattr(price_info.price, "currency", ""),
+        getattr(price_info.availability, "num_available", 0),
+        price_info.availability.is_available_to_buy,
+    )
+
+
+def uses_first_stockrecord(stock_strategy: DefaultStrategy) -> bool:
+    """
+    Return whether the strategy selects the stock records like Oscar's default
+    strategy; the first stock record of a product and of every public child.
+    """
+    strategy_type = type(stock_strategy)
+    return (
+        isinstance(stock_strategy, Structured)
+        and strategy_type.select_stockrecord is UseFirstStockRecord.select_stockrecord
+        and strategy_type.select_children_stockrecords
+        is Structured.select_children_stockrecords
+    )
+
+
+def fetch_first_stockrecord_purchase_infos(stock_strategy: DefaultStrategy, products):
+    """
+    Fetch the purchase infos of a batch of products for strategies that use the
+    first stock record (see ``uses_first_stockrecord``).
+
+    The stock records of the products, and the public children with their stock
+    records of the parents, that are not prefetched yet are prefetched for the whole
+    batch. The strategy then prices every product from the prefetched stock records
+    without querying.
+    """
+    prefetch_related_objects(
+        [
+            product
+            for product in products
+            if not product.is_parent
+            and "stockrecords" not in getattr(product, "_prefetched_objects_cache", {})
+        ],
+        "stockrecords",
+    )
+    prefetch_related_objects(
+        [
+            product
+            for product in products
+            if product.is_parent and not hasattr(product, "_prefetched_public_children")
+        ],
+        Prefetch(
+            "children",
+            queryset=ProductModel.objects.public().prefetch_related("stockrecords"),
+            to_attr="_prefetched_public_children",
+        ),
+    )
+
+    purchase_infos = {}
+    for product in products:
+        if product.is_parent:
+            purchase_infos[product.pk] = stock_strategy.fetch_for_parent(product)
+        else:
+            stockrecords = product.stockrecords.all()
+            purchase_infos[product.pk] = stock_strategy.fetch_for_product(
+                product, stockrecords[0] if stockrecords else None
+            )
+    return purchase_infos
+
+
+def get_stock_prices(
+    products, stock_strategy: DefaultStrategy, known_prices=None
+) -> Dict[int, Tuple[Decimal, str, int, bool]]:
+    """
+    Resolve the stock prices of a list of products in one pass.
+
+    Returns a dictionary of product pk to a (price, currency, availability,
+    is_available_to_buy) tuple. Every product is only resolved once, products
+    that are already in ``known_prices`` are skipped.
+
+    Strategies that can resolve the purchase info of many products at once can
+    implement a ``fetch_for_products(products)`` method that returns a dictionary
+    of product pk to ``PurchaseInfo``, it's used instead of calling
+    ``fetch_for_product`` / ``fetch_for_parent`` for every product. Strategies that
+    select the first stock record, like Oscar's default strategy, are resolved in
+    batch by ``fetch_first_stockrecord_purchase_infos``.
+    """
+    known_prices = known_prices or {}
+    products = [
+        product
+        for product in products
+        if product.pk is not None and product.pk not in known_prices
+    ]
+    if not products:
+        return {}
+
+    fetch_for_products = getattr(stock_strategy, "fetch_for_products", None)
+    if fetch_for_products is not None:
+        purchase_infos = fetch_for_products(products)
+    elif uses_first_stockrecord(stock_strategy):
+        purchase_infos = fetch_first_stockrecord_purchase_infos(
+            stock_strategy, products
+        )
+    else:
+        purchase_infos = {}
+        for product in products:
+            if product.pk not in purchase_infos:
+                purchase_infos[product.pk] = fetch_purchase_info(
+                    product, stock_strategy
+                )
+
+    return {
+        pk: purchase_info_to_stock_price(price_info)
+        for pk, price_info in purchase_infos.items()
+    }
+
+
+def option_value_to_native_type(item):
+    """Convert an option attribute value to the option."""
+    return item.value_option.option
+
+
+def multi_option_value_to_native_type(item):
+    """Convert a multi option attribute value to a list of options."""
+    return [value.option for value in item.value_multi_option.all()]
+
+
+def file_value_to_native_type(item):
+    """Convert a file or image attribute value to the URL of the file."""
+    return storage_url_cache.get_url(item.value)
+
+
+def entity_value_to_native_type(item):
+    """Convert an entity attribute value using the json method of the entity."""
+    value = item.value
+    if value is None:
+        return None
+
+    if hasattr(value, "json"):
+        return value.json()
+
+    logger.error("%s has no json method, can not convert to json", repr(value))
+    return None
+
+
+def attribute_value_to_native_type(item):
+    """Return the value as stored on ProductAttributeValue in the correct type."""
+    return item.value
+
+
+def convert_attribute_value(converter, item):
+    """Convert the attribute value with the converter, or to text when that fails."""
+    try:
+        return converter(item)
+    except AttributeError:
+        return item.value_as_text
+
+
+ATTRIBUTE_VALUE_CONVERTERS = {
+    ProductAttributeModel.OPTION: option_value_to_native_type,
+    ProductAttributeModel.MULTI_OPTION: multi_option_value_to_native_type,
+    ProductAttributeModel.FILE: file_value_to_native_type,
+    ProductAttributeModel.IMAGE: file_value_to_native_type,
+    ProductAttributeModel.ENTITY: entity_value_to_native_type,
+}
+
+
+def get_prefetched_attribute_values(products) -> list:
+    """
+    Return the attribute values of all products that had their attribute values
+    prefetched (see ProductQuerySet.prefetch_attribute_values), without any queries.
+    """
+    attribute_values = []
+    for product in products:
+        attribute_values.extend(getattr(product, "_prefetched_attribute_values", ()))
+        if product.is_child:
+            attribute_values.extend(
+                getattr(product.parent, "_prefetched_parent_attribute_values", ())
+            )
+    return attribute_values
+
+
+def get_prefetched_files(products, attribute_values) -> list:
+    """
+    Return the image files of all products and their categories, and the files of the
+    attribute values, that are prefetched already, without any queries.
+    """
+    files = []
+    for product in products:
+        prefetched = getattr(product, "_prefetched_objects_cache", {})
+        if "images" in prefetched:
+            files.extend(image.original for image in prefetched["images"])
+        for category in getattr(product, "_prefetched_browsable_categories", ()):
+            files.append(category.image)
+
+    for item in attribute_values:
+        if item.attribute.type in (
+            ProductAttributeModel.FILE,
+            ProductAttributeModel.IMAGE,
+        ):
+            files.append(item.value)
+    return files
+
+
+def prefetch_attribute_options(attribute_values):
+    """
+    Fetch the options of all option and multi option attribute values at once,
+    instead of one query per attribute value. Values of which the options are
+    already fetched are skipped.
+    """
+    option_values, multi_option_values = [], []
+    for item in attribute_values:
+        obj_type = item.attribute.type
+        if obj_type == ProductAttributeModel.OPTION:
+            option_values.append(item)
+        elif obj_type == ProductAttributeModel.MULTI_OPTION:
+            multi_option_values.append(item)
+
+    if option_values:
+        prefetch_related_objects(option_values, "value_option")
+    if multi_option_values:
+        prefetch_related_objects(
+            multi_option_values,
+            Prefetch(
+                "value_multi_option",
+                queryset=AttributeOptionModel.objects.select_related("group"),
+            ),
+        )
+
+
 class ProductImageToResource(OscarBaseMapping):
     """Map from an image model to a resource."""
 
@@ -70,7 +320,7 @@ class ProductImageToResource(OscarBaseMapping):
         """Convert value into a pure URL."""
         # Need URL prefix here
         try:
-            return value.url
+            return storage_url_cache.get_url(value)
         except ValueError:
             return None
 
@@ -105,7 +355,7 @@ class CategoryToResource(OscarBaseMapping):
         """Convert value into a pure URL."""
         # Need URL prefix here
         if value:
-            return value.url
+            return storage_url_cache.get_url(value)
 
 
 class CategoryToModel(OscarBaseMapping):
@@ -166,108 +416,189 @@ class ProductToResource(OscarBaseMapping):
     to_obj = ProductResource
 
     @odin.assign_field
+    @requires_prefetch(select_related=("parent",), fields=("title",))
     def title(self) -> str:
         """Map title field."""
         return self.source.get_title()
 
     @odin.assign_field
+    @requires_prefetch(select_related=("parent",), fields=("meta_title", "title"))
     def meta_title(self) -> str:
         """Map meta title field."""
         return self.source.get_meta_title()
 
     @odin.assign_field(to_list=True)
+    @requires_prefetch("images", "parent__images", mapping=ProductImageToResource)
     def images(self) -> List[ProductImageResource]:
         """Map related image."""
         items = self.source.get_all_images()
         return map_queryset(ProductImageToResource, items, context=self.context)
 
     @odin.assign_field(to_list=True)
+    @requires_prefetch(prefetch_browsable_categories, mapping=CategoryToResource)
     def categories(self):
         """Map related categories."""
         items = self.source.get_categories()
         # Note: categories are prefetched with the 'to_attr' method, this means it's a list and not a queryset.
-        return list(
-            CategoryToResource.apply(
-                items, context=self.context, mapping_result=ImmediateResult
-            )
-        )
+        return map_shared(CategoryToResource, list(items), context=self.context)
 
     @odin.assign_field
+    @requires_prefetch(
+        select_related=("product_class", "parent__product_class"),
+        mapping=ProductClassToResource,
+    )
     def product_class(self) -> str:
         """Map product class."""
         item = self.source.get_product_class()
-        return ProductClassToResource.apply(item, context=self.context)
+        return map_shared(ProductClassToResource, item, context=self.context)
 
-    @staticmethod
-    def _attribute_value_to_native_type(item):
+    @classmethod
+    def get_attribute_value_converter(cls, attribute):
+        """
+        Return the function that converts values of the attribute to a native type.
+
+        This is called once per attribute for every batch of products, override it
+        to customise the conversion of specific attributes.
+        """
+        return ATTRIBUTE_VALUE_CONVERTERS.get(
+            attribute.type, attribute_value_to_native_type
+        )
+
+    @classmethod
+    def _attribute_value_to_native_type(cls, item):
         """Handle ProductAttributeValue to native type conversion."""
-        try:
-            obj_type = item.attribute.type
-            if obj_type == item.attribute.OPTION:
-                return item.value.option
-
-            elif obj_type == item.attribute.MULTI_OPTION:
-                return [value.option for value in item.value]
-
-            elif obj_type == item.attribute.FILE:
-                return item.value.url
-
-            elif obj_type == item.attribute.IMAGE:
-                return item.value.url
-
-            elif obj_type == item.attribute.ENTITY and item.value is not None:
-                if hasattr(item.value, "json"):
-                    return item.value.json()
-                else:
-                    logger.error(
-                        "%s has no json method, can not convert to json",
-                        repr(item.value),
-                    )
-                    return None
-
-            # return the value as stored on ProductAttributeValue in the correct type
-            return item.value
-        except AttributeError:
-            return item.value_as_text
+        return convert_attribute_value(
+            cls.get_attribute_value_converter(item.attribute), item
+        )
 
     @odin.assign_field
+    @requires_prefetch(prefetch_attribute_values)
     def attributes(self) -> Dict[str, Any]:
         """Map attributes."""
-        attribute_value_to_native_type = self._attribute_value_to_native_type
-        return {
-            item.attribute.code: attribute_value_to_native_type(item)
-            for item in self.source.get_attribute_values()
-        }
+        to_native_type = self._attribute_value_to_native_type
+        if (
+            getattr(to_native_type, "__func__", to_native_type)
+            is not ProductToResource._attribute_value_to_native_type.__func__
+        ):
+            # The conversion is overridden, it's done the overridden way.
+            return {
+                item.attribute.code: to_native_type(item)
+                for item in self.source.get_attribute_values()
+            }
+
+        converters = self.context.setdefault("attribute_converters", {})
+        attributes = {}
+        for item in self.source.get_attribute_values():
+            attribute = item.attribute
+            key = (type(self), attribute.pk, attribute.type)
+            converter = converters.get(key)
+            if converter is None:
+                converter = converters[key] = self.get_attribute_value_converter(
+                    attribute
+                )
+            attributes[attribute.code] = convert_attribute_value(converter, item)
+        return attributes
 
     @odin.assign_field
+    @requires_prefetch(children=True)
     def children(self) -> Tuple[Optional[List[ProductResource]]]:
         """Children of parent products."""
 
         if self.context.get("include_children", False) and self.source.is_parent:
+            children_resources = self.context.get("children_resources", {})
+            if self.source.pk in children_resources:
+                return (children_resources[self.source.pk],)
+
             # Return a tuple as an optional list causes problems.
             return (
-                map_queryset(
-                    ProductToResource, self.source.children, context=self.context
-                ),
+                map_queryset(type(self), self.source.children, context=self.context),
             )
         return (None,)
 
+    @classmethod
+    def prepare_children(cls, sources, context):
+        """
+        Map the children of all parents in the batch together in one batch. Children
+        that are not prefetched with their parents are fetched in one query, with the
+        same prefetches as top level products.
+        """
+        children_resources = context.setdefault("children_resources", {})
+        parents = [
+            product
+            for product in sources
+            if product.is_parent
+            and product.pk is not None
+            and product.pk not in children_resources
+        ]
+        if not parents:
+            return
+
+        if all(
+            "children" in getattr(parent, "_prefetched_objects_cache", {})
+            for parent in parents
+        ):
+            children = [child for parent in parents for child in parent.children.all()]
+        else:
+            children = list(
+                prefetch_product_queryset(
+                    ProductModel.objects.filter(parent__in=parents),
+                    product_mapper=cls,
+                    fields=cls.get_projection(context),
+                )
+            )
+        resources = cls.apply(children, context=context, mapping_result=ImmediateResult)
+
+        for parent in parents:
+            children_resources[parent.pk] = []
+        for child, resource in zip(children, resources):
+            children_resources[child.parent_id].append(resource)
+
+    @classmethod
+    def prepare_batch(cls, sources, context):
+        """Resolve the stock prices, attribute options and file URLs of all products in the batch before mapping."""
+        stock_strategy = context.get("stock_strategy")
+        if stock_strategy is not None and cls.maps_field(
+            context, "price", "currency", "availability", "is_available_to_buy"
+        ):
+            stock_prices = context.setdefault("stock_prices", {})
+            stock_prices.update(get_stock_prices(sources, stock_strategy, stock_prices))
+
+        attribute_values = []
+        if cls.maps_field(context, "attributes"):
+            attribute_values = get_prefetched_attribute_values(sources)
+            prefetch_attribute_options(attribute_values)
+        storage_url_cache.resolve_many(get_prefetched_files(sources, attribute_values))
+
+        if context.get("primitive", False) and cls.maps_field(
+            context, "recommended_products"
+        ):
+            # The recommended products manager is passed on as is, it's only evaluated
+            # when creating a primitive, so prefetch it for the whole batch.
+            prefetch_related_objects(sources, "recommended_products")
+
+        if context.get("include_children", False) and cls.maps_field(
+            context, "children"
+        ):
+            cls.prepare_children(sources, context)
+
+    @requires_prefetch(
+        "stockrecords",
+        prefetch_public_children_stockrecords,
+        # The availability policy reads the product class (eg; track_stock)
+        select_related=("product_class", "parent__product_class"),
+    )
     @odin.assign_field(
         to_field=("price", "currency", "availability", "is_available_to_buy")
     )
     def map_stock_price(self) -> Tuple[Decimal, str, int, bool]:
         """Resolve stock price using strategy and decompose into price/currency/availability."""
-        stock_strategy: DefaultStrategy = self.context["stock_strategy"]
+        stock_prices = self.context.get("stock_prices")
+        if stock_prices is not None and self.source.pk in stock_prices:
+            return stock_prices[self.source.pk]
 
-        if self.source.is_parent:
-            price_info = stock_strategy.fetch_for_parent(self.source)
-        else:
-            price_info = stock_strategy.fetch_for_product(self.source)
-        return (
-            getattr(price_info.price, "incl_tax", Decimal(0)),
-            getattr(price_info.price, "currency", ""),
-            getattr(price_info.availability, "num_available", 0),
-            price_info.availability.is_available_to_buy,
+        stock_strategy: DefaultStrategy = self.context["stock_strategy"]
+        return purchase_info_to_stock_price(
+            fetch_purchase_info(self.source, stock_strategy)
         )
 
 
@@ -0,0 +1,142 @@
+"""Detection of the products that changed since a watermark."""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from django.db.models import Q, QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from oscar.core.loading import get_model
+
+__all__ = (
+    "ChangedProducts",
+    "get_changed_products",
+    "touch_products",
+    "connect_product_changes_signals",
+)
+
+ProductModel = get_model("catalogue", "Product")
+ProductCategoryModel = get_model("catalogue", "ProductCategory")
+ProductImageModel = get_model("catalogue", "ProductImage")
+ProductAttributeValueModel = get_model("catalogue", "ProductAttributeValue")
+StockRecordModel = get_model("partner", "StockRecord")
+
+
+class ChangedProducts(NamedTuple):
+    """The products that changed since a watermark, and the watermark of the next run."""
+
+    queryset: QuerySet
+    watermark: datetime
+
+
+def get_changed_since_filter(since: datetime) -> Q:
+    """
+    Return the filter of products that changed themselves since the watermark; the
+    product was updated (or touched, see ``touch_products``), one of its stock records
+    was updated or an image was added.
+    """
+    return (
+        Q(date_updated__gt=since)
+        | Q(
+            pk__in=StockRecordModel.objects.filter(date_updated__gt=since).values(
+                "product_id"
+            )
+        )
+        | Q(
+            pk__in=ProductImageModel.objects.filter(date_created__gt=since).values(
+                "product_id"
+            )
+        )
+    )
+
+
+def get_changed_products(
+    queryset: QuerySet, since: Optional[datetime] = None
+) -> ChangedProducts:
+    """
+    Filter a product queryset on the products that changed since the watermark.
+
+    Products are included when they changed themselves, when one of their children
+    changed (the children are part of the parent's resource) or when their parent
+    changed (children inherit the title, images and attributes of their parent).
+
+    Attribute values and category links have no timestamps, their changes are found
+    through the date_updated of the product, which is touched when they're saved or
+    deleted if ``TRACK_PRODUCT_CHANGES`` is set (see
+    ``connect_product_changes_signals``), and by ``products_to_db``. Other changes
+    that don't send signals (eg; bulk_create, queryset.update) are only found when
+    they set the date_updated of the product or stock record.
+
+    The watermark is taken before the products are queried, so changes that are made
+    while exporting are exported again by the next run, rather than missed.
+
+    :param queryset: A queryset of product models.
+    :param since: The watermark of the previous run, None returns all products.
+    :return: The changed products and the watermark to pass to the next run.
+    """
+    watermark = timezone.now()
+    if since is None:
+        return ChangedProducts(queryset, watermark)
+
+    changed = ProductModel.objects.filter(get_changed_since_filter(since))
+    queryset = queryset.filter(
+        Q(pk__in=changed.values("pk"))
+        | Q(pk__in=changed.filter(parent__isnull=False).values("parent_id"))
+        | Q(parent__in=changed.filter(parent__isnull=True).values("pk"))
+    )
+    return ChangedProducts(queryset, watermark)
+
+
+def touch_products(product_ids):
+    """Set the date_updated of the products to now, so they're found as changed."""
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if product_ids:
+        ProductModel.objects.filter(pk__in=product_ids).update(
+            date_updated=timezone.now()
+        )
+
+
+# pylint: disable=unused-argument
+def touch_product_of_instance(sender, instance, raw=False, **kwargs):
+    """Touch the product a saved or deleted related object belongs to."""
+    if not raw:
+        touch_products([instance.product_id])
+
+
+# pylint: disable=unused-argument
+def touch_products_of_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """Touch the products of which categories were added or removed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        touch_products(pk_set or ())
+    else:
+        touch_products([instance.pk])
+
+
+def connect_product_changes_signals():
+    """
+    Touch products when related objects without an update timestamp change, and
+    when stock records are deleted, so ``get_changed_products`` finds them.
+    """
+    for model in (ProductImageModel, ProductAttributeValueModel, ProductCategoryModel):
+        for signal in (post_save, post_delete):
+            signal.connect(
+                touch_product_of_instance,
+                sender=model,
+                dispatch_uid=(
+                    f"oscar_odin_product_changes_{model._meta.label}_"
+                    f"{'save' if signal is post_save else 'delete'}"
+                ),
+            )
+
+    post_delete.connect(
+        touch_product_of_instance,
+        sender=StockRecordModel,
+        dispatch_uid=f"oscar_odin_product_changes_{StockRecordModel._meta.label}_delete",
+    )
+    m2m_changed.connect(
+        touch_products_of_categories,
+        sender=ProductModel.categories.through,
+        dispatch_uid="oscar_odin_product_changes_categories",
+    )
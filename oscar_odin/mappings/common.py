@@ -1,20 +1,44 @@
 """Common code between mappings."""
-from typing import Any, Dict, Optional, Type, Iterable
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Iterable,
+)
+from contextvars import ContextVar
 from operator import attrgetter
 
+from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import QuerySet, Model
 from django.db.models.manager import BaseManager
 
 import odin
 from odin.exceptions import MappingExecutionError
 from odin.fields import NotProvided
+from odin.fields.composite import CompositeField
 from odin.mapping import (
+    FieldMapping,
     ImmediateResult,
     MappingBase,
     MappingMeta,
     force_tuple,
     EMPTY_LIST,
 )
+from odin.resources import ResourceBase
+from odin.utils import getmeta
+
+from .instrumentation import current_query_recorder, sampled_query_recorder
+
+# Set while an OscarBaseMapping is applied, mappings applied meanwhile are nested.
+mapping_in_progress: ContextVar[bool] = ContextVar(
+    "oscar_odin_mapping_in_progress", default=False
+)
 
 
 def map_queryset(
@@ -45,15 +69,431 @@ def map_queryset(
     )
 
 
+def map_shared(
+    mapping: Type[odin.Mapping],
+    sources,
+    *,
+    context: Dict[str, Any],
+):
+    """Map related objects that are shared between many source objects.
+
+    Every related object (eg; a category or product class) is mapped once per mapping
+    run, the resource is kept in the identity map of the context and reused for all
+    objects that refer to it. The resources are shared and should be treated as read only.
+
+    :param mapping: The mapping type to use.
+    :param sources: A model instance or a list of model instances.
+    :param context: The context of the mapping run.
+    :return: The resource or a list of resources.
+    """
+    if sources is None:
+        return mapping.apply(sources, context=context)
+    if not isinstance(sources, (list, tuple)):
+        return map_shared(mapping, [sources], context=context)[0]
+
+    identity_map = context.setdefault("identity_map", {})
+    primitive = context.get("primitive", False)
+    keys = [
+        (mapping, type(source), source.pk, primitive) if source.pk is not None else None
+        for source in sources
+    ]
+
+    missing = {}
+    for key, source in zip(keys, sources):
+        if key is not None and key not in identity_map:
+            missing.setdefault(key, source)
+    if missing:
+        identity_map.update(
+            zip(
+                missing,
+                mapping.apply(
+                    list(missing.values()),
+                    context=context,
+                    mapping_result=ImmediateResult,
+                ),
+            )
+        )
+
+    return [
+        identity_map[key] if key is not None else mapping.apply(source, context=context)
+        for key, source in zip(keys, sources)
+    ]
+
+
+def model_to_primitive(resource_type, instance) -> Dict[str, Any]:
+    """
+    Shallowly convert a model instance into a dictionary with the fields of a resource type.
+
+    Only the scalar fields of the resource are read from the instance, so no related objects are fetched.
+    """
+    primitive = {}
+    for field in getmeta(resource_type).fields:
+        value = None
+        if not isinstance(field, CompositeField):
+            value = getattr(instance, field.attname, field.get_default())
+            if isinstance(value, (Model, BaseManager)):
+                value = None
+        primitive[field.name] = field.prepare(value)
+    return primitive
+
+
+def resource_to_primitive(resource: ResourceBase) -> Dict[str, Any]:
+    """
+    Convert a resource into a dictionary, like dumping it with the dict codec does.
+
+    Unlike the dict codec, model instances and related managers that were passed on
+    to the resource as is are converted too, so the result can always be serialized.
+    """
+    primitive = {}
+    for field in getmeta(resource).fields:
+        value = field.value_from_object(resource)
+        if isinstance(field, CompositeField):
+            primitive[field.name] = composite_to_primitive(field, value)
+        else:
+            primitive[field.name] = field.prepare(value)
+    return primitive
+
+
+def composite_to_primitive(field, value):
+    """
+    Convert the value of a composite field into plain dictionaries and lists.
+
+    Values mapped in primitive mode are already dictionaries, but mapping rules can
+    also return resources, model instances or related managers that are passed on as is.
+    """
+    if value is None or isinstance(value, (dict, str, bytes)):
+        return value
+    if isinstance(value, ResourceBase):
+        return resource_to_primitive(value)
+    if isinstance(value, Model):
+        return model_to_primitive(field.of, value)
+    if isinstance(value, BaseManager):
+        value = value.all()
+    if isinstance(value, Iterable):
+        return [composite_to_primitive(field, item) for item in value]
+    return value
+
+
+class CompiledMappingRule(NamedTuple):
+    """A mapping rule compiled into a function that applies it to a source object."""
+
+    rule: FieldMapping
+    to_fields: Tuple[str, ...]
+    execute: Callable[[MappingBase, Any, Dict[str, Any]], None]
+
+
+def compile_getter(field_name: str) -> Callable[[Any], Any]:
+    """
+    Compile a getter for a (possibly nested, eg; "shipping_address.line4") field name.
+
+    One to one and foreign key relations that are not set raise a RelatedObjectDoesNotExist
+    error when accessed, the getter returns None for those instead.
+    """
+    getter = attrgetter(field_name)
+
+    def get_value(source):
+        try:
+            return getter(source)
+        except AttributeError as e:
+            # RelatedObjectDoesNotExist is both an AttributeError and an ObjectDoesNotExist
+            if isinstance(e, ObjectDoesNotExist):
+                return None
+            raise
+
+    return get_value
+
+
+def compile_action(mapping_type, mapping_rule: FieldMapping):
+    """
+    Compile the action of a mapping rule into a function that accepts the mapping
+    instance and the from values. Returns None when the from values are passed on as is.
+    """
+    action, bind = mapping_rule.action, mapping_rule.bind
+
+    if action is None:
+        return None
+
+    if isinstance(action, str):
+        name = action
+        if (
+            name == "default_action"
+            and getattr(mapping_type, name) is MappingBase.default_action
+        ):
+            return None
+
+        if bind:
+            return lambda mapping, from_values: getattr(mapping, name)(
+                mapping, *from_values
+            )
+        return lambda mapping, from_values: getattr(mapping, name)(*from_values)
+
+    if bind:
+        return lambda mapping, from_values: action(mapping, *from_values)
+    return lambda mapping, from_values: action(*from_values)
+
+
+def compile_mapping_rule(mapping_type, mapping_rule: FieldMapping):
+    """
+    Compile a mapping rule into a function that applies the rule to a source object
+    and writes the result into a dictionary of field values.
+
+    Everything that only depends on the rule (getters, action lookup, the amount of
+    target fields) is resolved once, so applying the rule to an object doesn't build
+    any closures or intermediate dictionaries.
+    """
+    from_fields, _, to_fields, to_list, _, skip_if_none = mapping_rule
+    call = compile_action(mapping_type, mapping_rule)
+    getters = (
+        None
+        if from_fields is None
+        else tuple(compile_getter(field_name) for field_name in from_fields)
+    )
+
+    # The most common rule; a field that is copied from the source as is.
+    if (
+        call is None
+        and getters is not None
+        and len(getters) == 1
+        and len(to_fields) == 1
+        and not to_list
+    ):
+        (get_value,) = getters
+        (to_field,) = to_fields
+
+        # pylint: disable=unused-argument
+        def copy_value(mapping, source, values):
+            value = get_value(source)
+            if value is not None or not skip_if_none:
+                values[to_field] = value
+
+        return CompiledMappingRule(mapping_rule, to_fields, copy_value)
+
+    num_to_fields = len(to_fields)
+
+    def execute(mapping, source, values):
+        if getters is None:
+            from_values = EMPTY_LIST
+        else:
+            from_values = tuple([get_value(source) for get_value in getters])
+
+        if call is None:
+            to_values = from_values
+        else:
+            try:
+                to_values = call(mapping, from_values)
+            except TypeError as ex:
+                raise MappingExecutionError(
+                    f"{ex} applying rule {mapping_rule}"
+                ) from ex
+
+        if to_list:
+            # Dictionaries are single values, they are what mappings return in primitive mode.
+            if isinstance(to_values, Iterable) and not isinstance(to_values, dict):
+                to_values = (list(to_values),)
+            else:
+                to_values = (to_values,)
+        else:
+            to_values = force_tuple(to_values)
+
+        if len(to_values) != num_to_fields:
+            raise MappingExecutionError(
+                f"Rule expects {num_to_fields} fields ({len(to_values)} returned) "
+                f"applying rule {mapping_rule}. The `to_list` option might need to be specified"
+            )
+
+        for to_field, value in zip(to_fields, to_values):
+            if value is not None or not skip_if_none:
+                values[to_field] = value
+
+    return CompiledMappingRule(mapping_rule, to_fields, execute)
+
+
 class NonRegisterableMappingMeta(MappingMeta):
     def __new__(mcs, name, bases, attrs):
         attrs["register_mapping"] = attrs.get("register_mapping", False)
-        return super().__new__(mcs, name, bases, attrs)
+        mapping_type = super().__new__(mcs, name, bases, attrs)
+        mcs.compile_mapping_rules(mapping_type)
+        return mapping_type
+
+    @staticmethod
+    def compile_mapping_rules(mapping_type):
+        """Compile the mapping rules of the mapping type, so they are ready to be applied."""
+        # pylint: disable=protected-access
+        mapping_type._compiled_rules = [
+            compile_mapping_rule(mapping_type, mapping_rule)
+            for mapping_rule in mapping_type._mapping_rules or ()
+        ]
+        # The compiled rules by the id of their rule, for _apply_rule.
+        mapping_type._compiled_rules_by_rule = {
+            id(compiled_rule.rule): compiled_rule
+            for compiled_rule in mapping_type._compiled_rules
+        }
+
+
+class MappedObjects:
+    """Stands in for a mapping in a mapping result of objects that are mapped already."""
+
+    def __init__(self, to_obj):
+        self.to_obj = to_obj
+
+    # pylint: disable=unused-argument
+    def apply(self, source_obj, context, *mapping_options):
+        return source_obj
 
 
 class OscarBaseMapping(MappingBase, metaclass=NonRegisterableMappingMeta):
     register_mapping = False
 
+    _compiled_rules: Sequence[CompiledMappingRule] = ()
+    _compiled_rules_by_rule: Dict[int, CompiledMappingRule] = {}
+
+    @classmethod
+    def apply(
+        cls,
+        source_obj,
+        context=None,
+        allow_subclass: bool = False,
+        mapping_result=None,
+    ):
+        """
+        Apply the mapping to a single source object or an iterable of source objects.
+
+        When an iterable is passed, it's evaluated and handed to ``prepare_batch`` before
+        any of the objects is mapped.
+        """
+        if context is None:
+            context = {}
+
+        if mapping_in_progress.get():
+            return cls.apply_batch(source_obj, context, allow_subclass, mapping_result)
+
+        token = mapping_in_progress.set(True)
+        try:
+            # The objects of a lazy mapping result are applied one by one while the
+            # result is iterated (see odin's MappingResult), they are part of the run.
+            recorder = None if context.get("_loop_idx") else sampled_query_recorder()
+            if recorder is None:
+                return cls.apply_batch(
+                    source_obj, context, allow_subclass, mapping_result
+                )
+            with recorder:
+                return cls.apply_recorded(
+                    source_obj, context, allow_subclass, mapping_result
+                )
+        finally:
+            mapping_in_progress.reset(token)
+
+    @classmethod
+    def apply_recorded(cls, source_obj, context, allow_subclass, mapping_result):
+        """
+        Apply the mapping of a sampled run. Iterables are mapped immediately, so all
+        queries are done while the recorder is active, and returned as the type of
+        mapping result the caller asked for.
+        """
+        mapping_result = mapping_result or cls.default_mapping_result
+        if not hasattr(source_obj, "__iter__") or mapping_result is ImmediateResult:
+            return cls.apply_batch(source_obj, context, allow_subclass, mapping_result)
+
+        mapped = cls.apply_batch(source_obj, context, allow_subclass, ImmediateResult)
+        return mapping_result(list(mapped), MappedObjects(cls.to_obj), context)
+
+    @classmethod
+    def apply_batch(cls, source_obj, context, allow_subclass, mapping_result):
+        """Prepare the batch of an iterable and apply the mapping."""
+        if hasattr(source_obj, "__iter__"):
+            if not isinstance(source_obj, (list, tuple)):
+                source_obj = list(source_obj)
+
+            recorder = current_query_recorder.get()
+            if recorder is not None:
+                recorder.enter_rule(cls, "<batch>", source_obj)
+                try:
+                    cls.prepare_batch(source_obj, context)
+                finally:
+                    recorder.exit_rule()
+            else:
+                cls.prepare_batch(source_obj, context)
+
+        return super().apply(
+            source_obj,
+            context=context,
+            allow_subclass=allow_subclass,
+            mapping_result=mapping_result,
+        )
+
+    @classmethod
+    def get_projection(cls, context) -> Optional[FrozenSet[str]]:
+        """Return the fields the mapping is projected on in this context, or None for all fields."""
+        projections = context.get("projections")
+        return projections.get(cls) if projections else None
+
+    @classmethod
+    def maps_field(cls, context, *field_names: str) -> bool:
+        """Return whether any of the fields is mapped in this context."""
+        fields = cls.get_projection(context)
+        return fields is None or not fields.isdisjoint(field_names)
+
+    @classmethod
+    def get_projected_rules(
+        cls, fields: Optional[FrozenSet[str]]
+    ) -> Sequence[CompiledMappingRule]:
+        """
+        Return the compiled rules that map any of the fields, the rules of the other
+        fields are skipped, so they're left to the defaults of the to_obj.
+        """
+        if fields is None:
+            return cls._compiled_rules
+
+        projected_rules = cls.__dict__.get("_projected_rules")
+        if projected_rules is None:
+            projected_rules = cls._projected_rules = {}
+
+        rules = projected_rules.get(fields)
+        if rules is None:
+            rules = projected_rules[fields] = [
+                compiled_rule
+                for compiled_rule in cls._compiled_rules
+                if not fields.isdisjoint(compiled_rule.to_fields)
+            ]
+        return rules
+
+    @classmethod
+    def get_projection_fields(cls, fields: Iterable[str]) -> FrozenSet[str]:
+        """Return the fields of a projection, a ValueError is raised for unknown fields."""
+        fields = frozenset(fields)
+        unknown_fields = fields - {field.name for field in getmeta(cls.to_obj).fields}
+        if unknown_fields:
+            raise ValueError(
+                f"{cls.to_obj.__name__} has no field(s) {', '.join(sorted(unknown_fields))}"
+            )
+        return fields
+
+    @classmethod
+    def project(cls, fields: Iterable[str], context=None) -> Dict[str, Any]:
+        """
+        Return a copy of the context in which the mapping only maps the given fields of
+        the to_obj. Mappings of related objects still map all their fields.
+
+        :param fields: The names of the fields to map.
+        :param context: The context to project.
+        :return: The projected context.
+        """
+        context = dict(context or {})
+        context["projections"] = {
+            **context.get("projections", {}),
+            cls: cls.get_projection_fields(fields),
+        }
+        return context
+
+    @classmethod
+    def prepare_batch(cls, sources, context):
+        """
+        Hook that is called once with all source objects of a batch before they are mapped.
+
+        Mappings can override this to resolve data for the whole batch at once and store
+        it in the context, so the mapping rules only have to look it up per object.
+        """
+
     def create_object(self, **field_values):
         """
         When subclassing a mapping and resource sometimes the overidden map will somehow result in the values being None
@@ -84,64 +524,107 @@ class OscarBaseMapping(MappingBase, metaclass=NonRegisterableMappingMeta):
             obj.extra_attrs({"model_instance": self.source})
         return obj
 
-    def _apply_rule(self, mapping_rule):
-        from_fields, action, to_fields, to_list, bind, skip_if_none = mapping_rule
+    def convert(self, **field_values):
+        """Convert the source into a destination object using the compiled mapping rules."""
+        values = field_values
 
-        if from_fields is None:
-            from_values = EMPTY_LIST
-        else:
-            # THIS IS THE ONLY CODE CHANGED COMPARED TO THE ORIGINAL METHOD.
-            # IT REPLACES GETATTR WITH ATTRGETTER TO ALLOW NESTED FIELD ACCESS (eg; from_field=("shipping_address.line4"))
-            # IT ALSO RETURNS NONE FOR ONE TO ONE FIELDS THAT RAISE RelatedObjectDoesNotExist ERRORS
-            from_values = []
-            for f in from_fields:
-                try:
-                    from_values.append(attrgetter(f)(self.source))
-                except Exception as e:  # pylint: disable=broad-exception-caught
-                    if "RelatedObjectDoesNotExist" in str(type(e)):
-                        from_values.append(None)
-                    else:
-                        raise
-            from_values = tuple(from_values)
-
-        if action is None:
-            to_values = from_values
+        source = self.source
+        compiled_rules = self._compiled_rules
+        if "projections" in self.context:
+            compiled_rules = self.get_projected_rules(self.get_projection(self.context))
+
+        recorder = current_query_recorder.get()
+        if type(self)._apply_rule is not OscarBaseMapping._apply_rule:
+            # The mapping changes how rules are applied, so they're applied its way.
+            self.convert_uncompiled(recorder, values, compiled_rules)
+        elif recorder is not None:
+            self.convert_recorded(recorder, values, compiled_rules)
+        elif self.ignore_not_provided:
+            for compiled_rule in compiled_rules:
+                result = {}
+                compiled_rule.execute(self, source, result)
+                values.update((k, v) for k, v in result.items() if v is not NotProvided)
         else:
-            if isinstance(action, str):
-                action = getattr(self, action)
+            for compiled_rule in compiled_rules:
+                compiled_rule.execute(self, source, values)
+
+        if self.context.get("primitive", False):
+            return self.create_primitive(**values)
+
+        return self.create_object(**values)
 
+    def convert_recorded(self, recorder, values, compiled_rules=None):
+        """Apply the compiled mapping rules while the queries of each rule are recorded."""
+        source = self.source
+        mapping_type = type(self)
+        if compiled_rules is None:
+            compiled_rules = self._compiled_rules
+        for compiled_rule in compiled_rules:
+            result = {} if self.ignore_not_provided else values
+            recorder.enter_rule(mapping_type, ",".join(compiled_rule.to_fields), source)
             try:
-                if bind:
-                    to_values = action(self, *from_values)
-                else:
-                    to_values = action(*from_values)
-            except TypeError as ex:
-                raise MappingExecutionError(
-                    f"{ex} applying rule {mapping_rule}"
-                ) from ex
+                compiled_rule.execute(self, source, result)
+            finally:
+                recorder.exit_rule()
 
-        if to_list:
-            if isinstance(to_values, Iterable):
-                to_values = (list(to_values),)
+            if self.ignore_not_provided:
+                values.update((k, v) for k, v in result.items() if v is not NotProvided)
+
+    def convert_uncompiled(self, recorder, values, compiled_rules):
+        """Apply the mapping rules one by one with ``_apply_rule``, for mappings that override it."""
+        mapping_type = type(self)
+        for compiled_rule in compiled_rules:
+            if recorder is not None:
+                recorder.enter_rule(
+                    mapping_type, ",".join(compiled_rule.to_fields), self.source
+                )
+            try:
+                values.update(self._apply_rule(compiled_rule.rule))
+            finally:
+                if recorder is not None:
+                    recorder.exit_rule()
+
+    @classmethod
+    def get_primitive_fields(cls):
+        """Return (name, field, is_composite) for every field of the to_obj, cached per mapping."""
+        primitive_fields = cls.__dict__.get("_primitive_fields")
+        if primitive_fields is None:
+            primitive_fields = cls._primitive_fields = [
+                (field.name, field, isinstance(field, CompositeField))
+                for field in getmeta(cls.to_obj).fields
+            ]
+        return primitive_fields
+
+    def create_primitive(self, **field_values) -> Dict[str, Any]:
+        """
+        Create a plain dictionary of the field values, instead of a to_obj resource.
+
+        The result is the same as dumping the resource with the dict codec, but without
+        creating the resource (and its nested resources) first.
+        """
+        primitive = {}
+        for name, field, is_composite in self.get_primitive_fields():
+            if name in field_values:
+                value = field_values[name]
             else:
-                to_values = (to_values,)
-        else:
-            to_values = force_tuple(to_values)
+                value = field.get_default()
 
-        if len(to_fields) != len(to_values):
-            raise MappingExecutionError(
-                f"Rule expects {len(to_fields)} fields ({len(to_values)} returned) "
-                f"applying rule {mapping_rule}. The `to_list` option might need to be specified"
-            )
+            if is_composite:
+                primitive[name] = composite_to_primitive(field, value)
+            else:
+                primitive[name] = field.prepare(value)
 
-        if skip_if_none:
-            result = {
-                f: to_values[i]
-                for i, f in enumerate(to_fields)
-                if to_values[i] is not None
-            }
-        else:
-            result = {f: to_values[i] for i, f in enumerate(to_fields)}
+        return primitive
+
+    def _apply_rule(self, mapping_rule):
+        # Compared to the original method, this allows nested field access (eg; from_field=("shipping_address.line4"))
+        # and returns None for one to one fields that raise RelatedObjectDoesNotExist errors.
+        compiled_rule = self._compiled_rules_by_rule.get(id(mapping_rule))
+        if compiled_rule is None or compiled_rule.rule is not mapping_rule:
+            compiled_rule = compile_mapping_rule(type(self), mapping_rule)
+
+        result = {}
+        compiled_rule.execute(self, self.source, result)
 
         if self.ignore_not_provided:
             return {k: v for k, v in result.items() if v is not NotProvided}
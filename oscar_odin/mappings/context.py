@@ -1,16 +1,19 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 from operator import attrgetter
 
-from django.db import transaction
-from django.db.models import Q
-from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q, QuerySet, UniqueConstraint
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 
 from oscar.core.loading import get_model
 from oscar.apps.catalogue.product_attributes import QuerysetCache
 
 from ..utils import ErrorLog, in_bulk, chunked
 from ..exceptions import OscarOdinException
+from .cache import invalidate_product_resources
+from .changes import touch_products
 from .constants import MODEL_IDENTIFIERS_MAPPING
+from .validation import get_batch_validator
 
 Product = get_model("catalogue", "Product")
 ProductClass = get_model("catalogue", "ProductClass")
@@ -18,7 +21,9 @@ ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
 ProductAttribute = get_model("catalogue", "ProductAttribute")
 
 
-def separate_instances_to_create_and_update(Model, instances, identifier_mapping):
+def separate_instances_to_create_and_update(
+    Model, instances, identifier_mapping, identifier_cache=None
+):
     instances_to_create = []
     instances_to_update = []
     identifiying_keys = []
@@ -26,17 +31,28 @@ def separate_instances_to_create_and_update(Model, instances, identifier_mapping
     identifiers = identifier_mapping.get(Model, {})
 
     if identifiers and instances:
-        # pylint: disable=protected-access
-        id_mapping = in_bulk(Model._default_manager, instances, identifiers)
-
         get_key_values = attrgetter(*identifiers)
+        keys = []
         for instance in instances:
             key = get_key_values(instance)
             identifiying_keys.append(key)
-
-            if not isinstance(key, tuple):
-                key = (key,)
-
+            keys.append(key if isinstance(key, tuple) else (key,))
+
+        # Only query the keys that are not cached.
+        id_mapping = {}
+        if identifier_cache is not None:
+            id_mapping = identifier_cache.get_many(Model, keys)
+        unseen_instances = [
+            instance for instance, key in zip(instances, keys) if key not in id_mapping
+        ]
+        if unseen_instances:
+            # pylint: disable=protected-access
+            found = in_bulk(Model._default_manager, unseen_instances, identifiers)
+            if identifier_cache is not None:
+                identifier_cache.set_many(Model, found)
+            id_mapping.update(found)
+
+        for instance, key in zip(instances, keys):
             if key in id_mapping:
                 instance.pk = id_mapping[key]
                 # pylint: disable=protected-access
@@ -51,6 +67,51 @@ def separate_instances_to_create_and_update(Model, instances, identifier_mapping
         return instances, [], []
 
 
+def group_instances_by_changed_fields(Model, instances, fields):
+    """
+    Compare the instances to the current values in the database, and return a
+    dictionary of the changed fields to the instances of which those fields changed.
+    Instances that didn't change are left out.
+
+    The values are compared as they would be saved (``get_db_prep_save``), so eg;
+    ``10`` and ``Decimal("10.00")`` are equal for a decimal field.
+    """
+    # pylint: disable=protected-access
+    model_fields = [Model._meta.get_field(name) for name in fields]
+    attnames = [field.attname for field in model_fields]
+    connection = connections[Model._base_manager.db]
+
+    def prep(field, value):
+        try:
+            return field.get_db_prep_save(value, connection)
+        except (TypeError, ValueError, ValidationError):
+            return value
+
+    current_values = {}
+    for pk_chunk in chunked([instance.pk for instance in instances]):
+        for pk, *values in Model._base_manager.filter(pk__in=pk_chunk).values_list(
+            "pk", *attnames
+        ):
+            current_values[pk] = values
+
+    groups = defaultdict(list)
+    for instance in instances:
+        values = current_values.get(instance.pk)
+        if values is None:
+            # Deleted in the meantime, let bulk_update deal with it.
+            groups[frozenset(fields)].append(instance)
+            continue
+        changed_fields = frozenset(
+            field.name
+            for field, current_value in zip(model_fields, values)
+            if prep(field, getattr(instance, field.attname))
+            != prep(field, current_value)
+        )
+        if changed_fields:
+            groups[changed_fields].append(instance)
+    return groups
+
+
 class ModelMapperContext(dict):
     foreign_key_items = None
     many_to_many_items = None
@@ -63,11 +124,23 @@ class ModelMapperContext(dict):
     errors = None
     delete_related = False
     clean_instances = True
+    identifier_cache = None
+    skip_unchanged = False
+    upsert = False
+    counts = None
 
     update_related_models_same_type = True
 
     def __init__(
-        self, Model, *args, delete_related=False, error_identifiers=None, **kwargs
+        self,
+        Model,
+        *args,
+        delete_related=False,
+        error_identifiers=None,
+        identifier_cache=None,
+        skip_unchanged=False,
+        upsert=False,
+        **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self.foreign_key_items = defaultdict(list)
@@ -79,6 +152,10 @@ class ModelMapperContext(dict):
         self.attribute_data = []
         self.errors = ErrorLog(identifiers=error_identifiers)
         self.delete_related = delete_related
+        self.identifier_cache = identifier_cache
+        self.skip_unchanged = skip_unchanged
+        self.upsert = upsert
+        self.counts = defaultdict(Counter)
         self.Model = Model
 
     def __bool__(self):
@@ -115,8 +192,6 @@ class ModelMapperContext(dict):
     def validate_instances(self, instances, validate_unique=True, fields=None):
         if not instances:
             return instances
-        validated_instances = []
-        identities = []
         exclude = ()
         if fields:
             all_fields = instances[0]._meta.fields
@@ -124,22 +199,42 @@ class ModelMapperContext(dict):
 
         identifiers = self.identifier_mapping.get(instances[0].__class__)
 
+        unique_instances = []
+        identities = set()
         for instance in instances:
             identity = self.get_identity(instance, identifiers)
             if identifiers is None or identity not in identities:
                 if identifiers is not None:
-                    identities.append(identity)
-                if self.clean_instances:
-                    try:
-                        instance = self.prepare_instance_for_validation(instance)
-                        instance.full_clean(
-                            validate_unique=validate_unique, exclude=exclude
-                        )
-                        validated_instances.append(instance)
-                    except ValidationError as e:
-                        self.errors.add_error(e, instance)
-                else:
-                    validated_instances.append(instance)
+                    identities.add(identity)
+                unique_instances.append(instance)
+
+        if not self.clean_instances:
+            return unique_instances
+
+        prepared_instances = []
+        for instance in unique_instances:
+            try:
+                prepared_instances.append(
+                    self.prepare_instance_for_validation(instance)
+                )
+            except ValidationError as e:
+                self.errors.add_error(e, instance)
+
+        if not prepared_instances:
+            return []
+
+        validator = get_batch_validator(
+            prepared_instances[0].__class__, frozenset(exclude)
+        )
+        validated_instances = []
+        for instance, error in zip(
+            prepared_instances,
+            validator.validate(prepared_instances, validate_unique=validate_unique),
+        ):
+            if error is None:
+                validated_instances.append(instance)
+            else:
+                self.errors.add_error(error, instance)
 
         return validated_instances
 
@@ -167,7 +262,7 @@ class ModelMapperContext(dict):
             if f.startswith(modelname)
         ] or None
 
-    def get_create_and_update_relations(self, related_instance_items):
+    def get_create_and_update_relations(self, related_instance_items, upserted=()):
         to_create = defaultdict(list)
         to_update = defaultdict(list)
         identities = defaultdict(list)
@@ -177,12 +272,24 @@ class ModelMapperContext(dict):
             for _, instances in related_instance_items[relation]:
                 all_instances.extend(instances)
 
+            if relation in upserted:
+                # Saved already, only the identities are needed.
+                identifiers = self.identifier_mapping.get(relation.related_model)
+                identities[relation].extend(
+                    self.get_identity(instance, identifiers)
+                    for instance in all_instances
+                )
+                continue
+
             (
                 instances_to_create,
                 instances_to_update,
                 identifying_keys,
             ) = separate_instances_to_create_and_update(
-                relation.related_model, all_instances, self.identifier_mapping
+                relation.related_model,
+                all_instances,
+                self.identifier_mapping,
+                self.identifier_cache,
             )
 
             to_create[relation].extend(instances_to_create)
@@ -210,7 +317,10 @@ class ModelMapperContext(dict):
                 instances_to_update,
                 _,
             ) = separate_instances_to_create_and_update(
-                relation.related_model, instances, self.identifier_mapping
+                relation.related_model,
+                instances,
+                self.identifier_mapping,
+                self.identifier_cache,
             )
 
             to_create[relation].extend(instances_to_create)
@@ -242,12 +352,165 @@ class ModelMapperContext(dict):
             if instance.pk is None and identity in pk_identity_map:
                 instance.pk = pk_identity_map[identity]
 
+    def cache_created_instances(self, Model, instances):
+        """Cache the primary keys of created instances for the next chunks."""
+        if self.identifier_cache is None or not self.identifier_cache.caches(Model):
+            return
+        identifiers = self.identifier_mapping.get(Model)
+        if not identifiers:
+            return
+        get_key_values = attrgetter(*identifiers)
+        pks = {}
+        for instance in instances:
+            key = get_key_values(instance)
+            pks[key if isinstance(key, tuple) else (key,)] = instance.pk
+        self.identifier_cache.set_many(Model, pks)
+
+    def record_changes(self, Model, instances):
+        """
+        Hook that is called with the instances that are written, or the queryset of
+        the objects that are about to be deleted.
+        """
+
+    def bulk_create(self, Model, instances):
+        Model.objects.bulk_create(instances)
+        self.record_changes(Model, instances)
+        # pylint: disable=protected-access
+        self.counts[Model._meta.label]["created"] += len(instances)
+
+    def bulk_update(self, Model, instances, fields):
+        """
+        Update the fields of the instances. With ``skip_unchanged``, only the
+        instances that changed are updated, grouped by the fields that changed.
+        """
+        # pylint: disable=protected-access
+        counts = self.counts[Model._meta.label]
+        if not self.skip_unchanged or not instances:
+            Model.objects.bulk_update(instances, fields=fields)
+            self.record_changes(Model, instances)
+            counts["updated"] += len(instances)
+            return
+
+        updated = 0
+        for changed_fields, changed_instances in group_instances_by_changed_fields(
+            Model, instances, fields
+        ).items():
+            Model.objects.bulk_update(
+                changed_instances, fields=[f for f in fields if f in changed_fields]
+            )
+            self.record_changes(Model, changed_instances)
+            updated += len(changed_instances)
+        counts["updated"] += updated
+        counts["unchanged"] += len(instances) - updated
+
+    def can_upsert(self, Model):
+        """
+        Return whether the instances of a model can be upserted; the backend
+        supports it and the identifiers of the model are unique (together).
+        """
+        if not self.upsert or self.skip_unchanged:
+            return False
+        connection = connections[Model.objects.db]
+        if not getattr(
+            connection.features, "supports_update_conflicts_with_target", False
+        ):
+            return False
+
+        identifiers = self.identifier_mapping.get(Model)
+        if not identifiers:
+            return False
+        # pylint: disable=protected-access
+        try:
+            fields = [Model._meta.get_field(identifier) for identifier in identifiers]
+        except FieldDoesNotExist:  # eg; a field of a related model
+            return False
+        if len(fields) == 1:
+            return fields[0].unique
+        names = {field.name for field in fields}
+        return any(
+            set(unique_together) == names
+            for unique_together in Model._meta.unique_together
+        ) or any(
+            isinstance(constraint, UniqueConstraint)
+            and constraint.condition is None
+            and set(constraint.fields) == names
+            for constraint in Model._meta.constraints
+        )
+
+    def upsert_instances(self, Model, instances, fields):
+        """
+        Insert the instances, or update ``fields`` of the ones that exist, in one
+        query with ``bulk_create(update_conflicts=True)`` on the identifiers of the
+        model. The primary keys are set on the instances.
+
+        Returns False when the instances have to be saved the regular way instead;
+        when some of them are not valid as new rows (eg; only the fields to update
+        are set), or when other unique fields conflict.
+        """
+        if not instances:
+            return True
+
+        identifiers = self.identifier_mapping.get(Model)
+        # pylint: disable=protected-access
+        unique_fields = [Model._meta.get_field(name).name for name in identifiers]
+        update_fields = [field for field in fields if field not in unique_fields]
+        if not update_fields:
+            return False
+
+        unique_instances = {}
+        for instance in instances:
+            unique_instances.setdefault(
+                self.get_identity(instance, identifiers), instance
+            )
+        unique_instances = list(unique_instances.values())
+
+        if self.clean_instances:
+            try:
+                unique_instances = [
+                    self.prepare_instance_for_validation(instance)
+                    for instance in unique_instances
+                ]
+            except ValidationError:
+                return False
+            validator = get_batch_validator(Model)
+            # Conflicts on the identifiers are updates, other unique fields are
+            # checked by the database.
+            if any(validator.validate(unique_instances, validate_unique=False)):
+                return False
+
+        try:
+            with transaction.atomic():
+                Model.objects.bulk_create(
+                    unique_instances,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=update_fields,
+                )
+        except IntegrityError:
+            return False
+
+        # Not all backends (and Django versions) return the primary keys of upserts.
+        missing = [instance for instance in unique_instances if instance.pk is None]
+        if missing:
+            pks = in_bulk(Model._default_manager, missing, identifiers)
+            get_key_values = attrgetter(*identifiers)
+            for instance in missing:
+                key = get_key_values(instance)
+                instance.pk = pks.get(key if isinstance(key, tuple) else (key,))
+
+        self.record_changes(Model, unique_instances)
+        self.assign_pk_to_duplicate_instances(instances, unique_instances)
+        self.cache_created_instances(Model, unique_instances)
+        self.counts[Model._meta.label]["upserted"] += len(unique_instances)
+        return True
+
     def bulk_update_or_create_foreign_keys(self):
         instances_to_create, instances_to_update = self.get_fk_relations
 
         for field, instances in instances_to_create.items():
             validated_fk_instances = self.validate_instances(instances)
-            field.related_model.objects.bulk_create(validated_fk_instances)
+            self.bulk_create(field.related_model, validated_fk_instances)
+            self.cache_created_instances(field.related_model, validated_fk_instances)
             if len(instances) != len(validated_fk_instances):
                 self.assign_pk_to_duplicate_instances(instances, validated_fk_instances)
 
@@ -259,19 +522,32 @@ class ModelMapperContext(dict):
                     instances_to_update = self.validate_instances(
                         instances, fields=fields
                     )
-                    Model.objects.bulk_update(instances_to_update, fields=fields)
+                    self.bulk_update(Model, instances_to_update, fields)
 
     def bulk_update_or_create_instances(self, instances):
+        fields = self.get_fields_to_update(self.Model)
+        if (
+            fields is not None
+            and self.can_upsert(self.Model)
+            and self.upsert_instances(self.Model, instances, fields)
+        ):
+            identifiers = self.identifier_mapping.get(self.Model)
+            self.instance_keys = [
+                self.get_identity(instance, identifiers) for instance in instances
+            ]
+            return
+
         (
             instances_to_create,
             instances_to_update,
             self.instance_keys,
         ) = separate_instances_to_create_and_update(
-            self.Model, instances, self.identifier_mapping
+            self.Model, instances, self.identifier_mapping, self.identifier_cache
         )
 
         validated_create_instances = self.validate_instances(instances_to_create)
-        self.Model.objects.bulk_create(validated_create_instances)
+        self.bulk_create(self.Model, validated_create_instances)
+        self.cache_created_instances(self.Model, validated_create_instances)
         self.assign_pk_to_duplicate_instances(
             instances_to_create, validated_create_instances
         )
@@ -293,14 +569,36 @@ class ModelMapperContext(dict):
                 # This should be removed once support for django 3.2 is dropped
                 # pylint: disable=protected-access
                 instance._prepare_related_fields_for_save("bulk_update")
-            self.Model.objects.bulk_update(validated_instances_to_update, fields=fields)
+            self.bulk_update(self.Model, validated_instances_to_update, fields)
 
     def bulk_update_or_create_one_to_many(self):
         for relation, parent, instances in self.get_all_o2m_instances:
             for instance in instances:
                 setattr(instance, relation.field.name, parent)
 
-        instances_to_create, instances_to_update, identities = self.get_o2m_relations
+        upserted = set()
+        for relation, items in self.one_to_many_items.items():
+            fields = self.get_fields_to_update(relation.related_model)
+            if (
+                (
+                    self.update_related_models_same_type
+                    or relation.related_model != self.Model
+                )
+                and fields is not None
+                and self.can_upsert(relation.related_model)
+                and self.upsert_instances(
+                    relation.related_model,
+                    [instance for _, instances in items for instance in instances],
+                    fields,
+                )
+            ):
+                upserted.add(relation)
+
+        (
+            instances_to_create,
+            instances_to_update,
+            identities,
+        ) = self.get_create_and_update_relations(self.one_to_many_items, upserted)
 
         for relation, instances_to_create in instances_to_create.items():
             if (
@@ -310,7 +608,7 @@ class ModelMapperContext(dict):
                 fields = self.get_fields_to_update(relation.related_model)
                 if fields is not None:
                     instances_to_create = self.validate_instances(instances_to_create)
-                    relation.related_model.objects.bulk_create(instances_to_create)
+                    self.bulk_create(relation.related_model, instances_to_create)
 
         for relation, instances_to_update in instances_to_update.items():
             if (
@@ -322,8 +620,8 @@ class ModelMapperContext(dict):
                     instances_to_update = self.validate_instances(
                         instances_to_update, fields=fields
                     )
-                    relation.related_model.objects.bulk_update(
-                        instances_to_update, fields=fields
+                    self.bulk_update(
+                        relation.related_model, instances_to_update, fields
                     )
 
         if self.delete_related:
@@ -348,10 +646,32 @@ class ModelMapperContext(dict):
 
                         ids_to_keep.update(chunk_ids)
 
-                    base_queryset.exclude(id__in=ids_to_keep).delete()
+                    to_delete = base_queryset.exclude(id__in=ids_to_keep)
+                    self.record_changes(Model, to_delete)
+                    to_delete.delete()
 
     def bulk_update_or_create_many_to_many(self):
-        m2m_to_create, m2m_to_update, _ = self.get_all_m2m_relations
+        upserted = set()
+        for relation, items in self.many_to_many_items.items():
+            fields = self.get_fields_to_update(relation.related_model)
+            if (
+                (
+                    self.update_related_models_same_type
+                    or relation.related_model != self.Model
+                )
+                and fields is not None
+                and self.can_upsert(relation.related_model)
+                and self.upsert_instances(
+                    relation.related_model,
+                    [instance for _, instances in items for instance in instances],
+                    fields,
+                )
+            ):
+                upserted.add(relation)
+
+        m2m_to_create, m2m_to_update, _ = self.get_create_and_update_relations(
+            self.many_to_many_items, upserted
+        )
 
         # Create many to many's
         for relation, instances_to_create in m2m_to_create.items():
@@ -364,8 +684,11 @@ class ModelMapperContext(dict):
                     validated_instances_to_create = self.validate_instances(
                         instances_to_create
                     )
-                    relation.related_model.objects.bulk_create(
-                        validated_instances_to_create
+                    self.bulk_create(
+                        relation.related_model, validated_instances_to_create
+                    )
+                    self.cache_created_instances(
+                        relation.related_model, validated_instances_to_create
                     )
                     if len(instances_to_create) != len(validated_instances_to_create):
                         self.assign_pk_to_duplicate_instances(
@@ -383,8 +706,8 @@ class ModelMapperContext(dict):
                     instances_to_update = self.validate_instances(
                         instances_to_update, fields=fields
                     )
-                    relation.related_model.objects.bulk_update(
-                        instances_to_update, fields=fields
+                    self.bulk_update(
+                        relation.related_model, instances_to_update, fields
                     )
 
         for relation, values in self.many_to_many_items.items():
@@ -428,12 +751,14 @@ class ModelMapperContext(dict):
 
                 # Delete throughs if no instances are passed for the field
                 if self.delete_related:
-                    Through.objects.filter(
+                    to_delete = Through.objects.filter(
                         **{
                             "%s_id__in"
                             % relation.m2m_field_name(): to_delete_throughs_product_ids
                         }
-                    ).all().delete()
+                    )
+                    self.record_changes(Through, to_delete)
+                    to_delete.delete()
 
                 if throughs:
                     # Bulk query the through models to see if some already exist
@@ -453,17 +778,20 @@ class ModelMapperContext(dict):
 
                     # Delete remaining non-existing through models
                     if self.delete_related:
-                        Through.objects.filter(
+                        to_delete = Through.objects.filter(
                             **{
                                 "%s_id__in"
                                 % relation.m2m_field_name(): [
                                     item[0] for item in bulk_troughs.keys()
                                 ]
                             }
-                        ).exclude(id__in=bulk_troughs.values()).delete()
+                        ).exclude(id__in=bulk_troughs.values())
+                        self.record_changes(Through, to_delete)
+                        to_delete.delete()
 
                     # Save only new through models
                     Through.objects.bulk_create(throughs.values())
+                    self.record_changes(Through, throughs.values())
 
     def bulk_save(
         self, instances, fields_to_update, identifier_mapping, clean_instances
@@ -489,6 +817,45 @@ class ProductModelMapperContext(ModelMapperContext):
     product_class_identifier = MODEL_IDENTIFIERS_MAPPING[ProductClass][0]
     product_class_keys = set()
     attributes = defaultdict(list)
+    changed_product_ids = None
+
+    def record_changes(self, Model, instances):
+        """
+        Collect the products that are written or of which related objects are written,
+        their date_updated is touched (see ``get_changed_products``) and their cached
+        resources are invalidated at the end of the chunk; bulk writes don't send
+        signals or set date_updated.
+        """
+        if self.changed_product_ids is None:
+            self.changed_product_ids = set()
+        if Model is Product:
+            attname = "pk"
+        else:
+            # pylint: disable=protected-access
+            attname = next(
+                (
+                    field.attname
+                    for field in Model._meta.fields
+                    if field.many_to_one and field.related_model is Product
+                ),
+                None,
+            )
+            if attname is None:
+                return
+
+        if isinstance(instances, QuerySet):
+            self.changed_product_ids.update(instances.values_list(attname, flat=True))
+        else:
+            self.changed_product_ids.update(
+                getattr(instance, attname) for instance in instances
+            )
+
+    def bulk_update_or_create_many_to_many(self):
+        super().bulk_update_or_create_many_to_many()
+        # The last step of bulk_save, inside of its transaction.
+        touch_products(self.changed_product_ids or ())
+        invalidate_product_resources(self.changed_product_ids or ())
+        self.changed_product_ids = None
 
     def prepare_instance_for_validation(self, instance):
         if hasattr(instance, "attr"):
@@ -556,13 +923,21 @@ class ProductModelMapperContext(ModelMapperContext):
 
         # now save all the attributes in bulk
         if attributes_to_delete and self.delete_related:
-            ProductAttributeValue.objects.filter(pk__in=attributes_to_delete).delete()
+            to_delete = ProductAttributeValue.objects.filter(
+                pk__in=attributes_to_delete
+            )
+            self.record_changes(ProductAttributeValue, to_delete)
+            to_delete.delete()
         if attributes_to_update:
             validated_attributes_to_update = self.validate_instances(
                 attributes_to_update
             )
-            ProductAttributeValue.objects.bulk_update(
-                validated_attributes_to_update, fields_to_be_updated, batch_size=500
+            # Oscar marks every value it sets as dirty, with skip_unchanged only the
+            # values that changed are updated (and their products touched).
+            self.bulk_update(
+                ProductAttributeValue,
+                validated_attributes_to_update,
+                list(fields_to_be_updated),
             )
         if attributes_to_create:
             validated_attributes_to_create = self.validate_instances(
@@ -571,6 +946,7 @@ class ProductModelMapperContext(ModelMapperContext):
             ProductAttributeValue.objects.bulk_create(
                 validated_attributes_to_create, batch_size=500, ignore_conflicts=False
             )
+            self.record_changes(ProductAttributeValue, validated_attributes_to_create)
 
     def fetch_product_class_attributes(self):
         product_classes = ProductClass.objects.filter(
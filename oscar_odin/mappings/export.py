@@ -0,0 +1,217 @@
+"""Sharded export of the catalogue to NDJSON files."""
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+import django
+from django.apps import apps
+from django.db import connections
+from django.db.models import QuerySet
+
+from oscar.core.loading import get_class, get_model
+
+from ..settings import PRODUCTS_TO_RESOURCES_CHUNK_SIZE
+from ..utils import chunked_queryset, primitive_to_json
+
+__all__ = (
+    "ExportShard",
+    "get_export_shards",
+    "export_products_to_ndjson",
+    "export_changed_products_to_ndjson",
+    "merge_ndjson_parts",
+)
+
+ProductModel = get_model("catalogue", "Product")
+
+ProductToResource = get_class("oscar_odin.mappings.catalogue", "ProductToResource")
+product_to_resource_with_strategy = get_class(
+    "oscar_odin.mappings.helpers", "product_to_resource_with_strategy"
+)
+prefetch_product_queryset = get_class(
+    "oscar_odin.mappings.prefetching.prefetch", "prefetch_product_queryset"
+)
+get_changed_products = get_class("oscar_odin.mappings.changes", "get_changed_products")
+
+
+class ExportShard(NamedTuple):
+    """A range of product pks (both inclusive) that is exported to one part file."""
+
+    index: int
+    first_pk: int
+    last_pk: int
+
+
+class ExportTask(NamedTuple):
+    shard: ExportShard
+    query: object
+    path: str
+    include_children: bool
+    product_mapper: object
+    chunk_size: int
+
+
+def get_export_shards(queryset: QuerySet, shards: int) -> List[ExportShard]:
+    """
+    Split the pk range of the queryset in ``shards`` ranges with the same amount of
+    products each. Less shards are returned when there are less products.
+    """
+    pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+    if not pks:
+        return []
+
+    shards = max(1, min(shards, len(pks)))
+    size, remainder = divmod(len(pks), shards)
+    export_shards = []
+    start = 0
+    for index in range(shards):
+        end = start + size + (1 if index < remainder else 0)
+        export_shards.append(ExportShard(index, pks[start], pks[end - 1]))
+        start = end
+    return export_shards
+
+
+def get_part_path(directory: str, shard: ExportShard) -> str:
+    return os.path.join(directory, f"part-{shard.index:05d}.ndjson")
+
+
+def init_export_worker():
+    """Set up Django in worker processes that are spawned instead of forked."""
+    if not apps.ready:
+        django.setup()
+
+
+def export_shard(task: ExportTask) -> int:
+    """Export the products of a shard to its part file, return the amount of products."""
+    queryset = ProductModel.objects.all()
+    queryset.query = task.query
+    queryset = queryset.filter(pk__gte=task.shard.first_pk, pk__lte=task.shard.last_pk)
+    queryset = prefetch_product_queryset(
+        queryset, task.include_children, task.product_mapper
+    )
+
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy()
+
+    count = 0
+    identity_map = {}
+    with open(task.path, "wb") as part:
+        for chunk in chunked_queryset(queryset, task.chunk_size):
+            for primitive in product_to_resource_with_strategy(
+                chunk,
+                stock_strategy,
+                task.include_children,
+                product_mapper=task.product_mapper,
+                context={"primitive": True, "identity_map": identity_map},
+            ):
+                part.write(primitive_to_json(primitive))
+                part.write(b"\n")
+                count += 1
+    return count
+
+
+def merge_ndjson_parts(paths: List[str], destination: str, remove_parts=True):
+    """
+    Concatenate part files into one NDJSON file, in the order of the paths.
+
+    :param paths: The part files to merge.
+    :param destination: The path of the merged file.
+    :param remove_parts: Remove the part files after they are merged.
+    """
+    with open(destination, "wb") as merged:
+        for path in paths:
+            with open(path, "rb") as part:
+                shutil.copyfileobj(part, merged)
+
+    if remove_parts:
+        for path in paths:
+            os.remove(path)
+
+
+def export_products_to_ndjson(
+    queryset: QuerySet,
+    directory: str,
+    workers: Optional[int] = None,
+    shards: Optional[int] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    chunk_size: int = PRODUCTS_TO_RESOURCES_CHUNK_SIZE,
+    merge_to: Optional[str] = None,
+) -> List[str]:
+    """Export a queryset of products to NDJSON files, one product per line.
+
+    The pk range of the queryset is split in shards, every shard is mapped by a
+    worker process with its own database connection and written to its own part
+    file (``part-00000.ndjson``, ...). Products are written in pk order, so the
+    parts can be merged in shard order into one deterministic file.
+
+    Database connections are closed before the worker processes are started, so
+    don't call this inside a transaction. Use ``workers=0`` to export the shards
+    in the current process instead (eg; in tests).
+
+    :param queryset: A queryset of product models.
+    :param directory: The directory to write the part files to.
+    :param workers: The amount of worker processes, defaults to the amount of CPUs.
+    :param shards: The amount of shards, defaults to the amount of workers.
+    :param include_children: Include children of parent products.
+    :param product_mapper: The mapping to use.
+    :param chunk_size: The amount of products a worker fetches and maps at once.
+    :param merge_to: Merge the parts into this file, the parts are removed afterwards.
+    :return: The paths of the part files, or the merged file.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shards is None:
+        shards = max(workers, 1)
+
+    os.makedirs(directory, exist_ok=True)
+    tasks = [
+        ExportTask(
+            shard,
+            queryset.query,
+            get_part_path(directory, shard),
+            include_children,
+            product_mapper,
+            chunk_size,
+        )
+        for shard in get_export_shards(queryset, shards)
+    ]
+
+    if workers:
+        # Forked workers must not share the connections of this process.
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=init_export_worker) as pool:
+            list(pool.map(export_shard, tasks))
+    else:
+        for task in tasks:
+            export_shard(task)
+
+    paths = [task.path for task in tasks]
+    if merge_to is not None:
+        merge_ndjson_parts(paths, merge_to)
+        return [merge_to]
+    return paths
+
+
+def export_changed_products_to_ndjson(
+    queryset: QuerySet,
+    directory: str,
+    since: Optional[datetime],
+    **kwargs,
+) -> Tuple[List[str], datetime]:
+    """Export the products that changed since a watermark to NDJSON files.
+
+    This is the incremental variant of ``export_products_to_ndjson``, the products
+    are selected with ``get_changed_products``. Store the returned watermark and
+    pass it as ``since`` to the next run.
+
+    :param queryset: A queryset of product models.
+    :param directory: The directory to write the part files to.
+    :param since: The watermark of the previous run, None exports all products.
+    :param kwargs: Additional keyword arguments to pass to export_products_to_ndjson.
+    :return: The paths of the files, and the watermark for the next run.
+    """
+    changed_products = get_changed_products(queryset, since)
+    paths = export_products_to_ndjson(changed_products.queryset, directory, **kwargs)
+    return paths, changed_products.watermark
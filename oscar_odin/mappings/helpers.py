@@ -1,4 +1,4 @@
-from typing import Dict, Union, Iterable, Optional, Tuple, List
+from typing import Dict, Union, Iterable, Iterator, Optional, Tuple, List
 
 from django.http import HttpRequest
 from django.db.models import QuerySet
@@ -9,13 +9,16 @@ from oscar.apps.partner.strategy import Default as DefaultStrategy
 
 from . import constants
 from .context import ProductModelMapperContext
-from ..settings import RESOURCES_TO_DB_CHUNK_SIZE
+from ..settings import RESOURCES_TO_DB_CHUNK_SIZE, PRODUCTS_TO_RESOURCES_CHUNK_SIZE
+from ..utils import chunked_queryset, primitive_to_json
 from .prefetching.prefetch import prefetch_product_queryset
 
 ProductModel = get_model("catalogue", "Product")
 
 ProductResource = get_class("oscar_odin.resources.catalogue", "ProductResource")
-resources_to_db = get_class("oscar_odin.mappings.resources", "resources_to_db")
+resources_to_db, resources_to_db_iterator = get_classes(
+    "oscar_odin.mappings.resources", ["resources_to_db", "resources_to_db_iterator"]
+)
 
 ProductToResource, ProductToModel = get_classes(
     "oscar_odin.mappings.catalogue", ["ProductToResource", "ProductToModel"]
@@ -23,6 +26,9 @@ ProductToResource, ProductToModel = get_classes(
 map_queryset, OscarBaseMapping = get_classes(
     "oscar_odin.mappings.common", ["map_queryset", "OscarBaseMapping"]
 )
+product_resource_cache = get_class(
+    "oscar_odin.mappings.cache", "product_resource_cache"
+)
 
 
 def product_to_resource_with_strategy(
@@ -30,6 +36,8 @@ def product_to_resource_with_strategy(
     stock_strategy: DefaultStrategy,
     include_children: bool = False,
     product_mapper: OscarBaseMapping = ProductToResource,
+    context: Optional[Dict] = None,
+    fields: Optional[Iterable[str]] = None,
 ):
     """Map a product model to a resource.
 
@@ -41,14 +49,17 @@ def product_to_resource_with_strategy(
     :param product: A single product model or iterable of product models (eg a QuerySet).
     :param stock_strategy: The current HTTP request
     :param include_children: Include children of parent products.
+    :param context: Additional context to pass to the mapping.
+    :param fields: Only map these fields of the resource, the others are left to their defaults.
     """
-    return product_mapper.apply(
-        product,
-        context={
-            "stock_strategy": stock_strategy,
-            "include_children": include_children,
-        },
-    )
+    context = {
+        **(context or {}),
+        "stock_strategy": stock_strategy,
+        "include_children": include_children,
+    }
+    if fields is not None:
+        context = product_mapper.project(fields, context)
+    return product_mapper.apply(product, context=context)
 
 
 def product_to_resource(
@@ -57,6 +68,7 @@ def product_to_resource(
     user: Optional[AbstractUser] = None,
     include_children: bool = False,
     product_mapper: OscarBaseMapping = ProductToResource,
+    fields: Optional[Iterable[str]] = None,
     **kwargs,
 ) -> Union[ProductResource, Iterable[ProductResource]]:
     """Map a product model to a resource.
@@ -70,13 +82,45 @@ def product_to_resource(
     :param request: The current HTTP request
     :param user: The current user
     :param include_children: Include children of parent products.
+    :param fields: Only map these fields of the resource, the others are left to their defaults.
     :param kwargs: Additional keyword arguments to pass to the strategy selector.
     """
 
     selector_type = get_class("partner.strategy", "Selector")
     stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
     return product_to_resource_with_strategy(
-        product, stock_strategy, include_children, product_mapper=product_mapper
+        product,
+        stock_strategy,
+        include_children,
+        product_mapper=product_mapper,
+        fields=fields,
+    )
+
+
+def cached_product_to_resource(
+    product: Union[ProductModel, Iterable[ProductModel]],
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper: OscarBaseMapping = ProductToResource,
+    **kwargs,
+) -> Union[ProductResource, List[ProductResource]]:
+    """Map a product model to a resource, using the product resource cache.
+
+    This is the cached equivalent of ``product_to_resource``, only the products that
+    are not cached (or changed since they were cached) are mapped. The resources are
+    shared with other callers and should not be modified.
+
+    :param product: A single product model or iterable of product models (eg a QuerySet).
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
+    return product_resource_cache.map(
+        product, stock_strategy, include_children, product_mapper
     )
 
 
@@ -86,6 +130,7 @@ def product_queryset_to_resources(
     user: Optional[AbstractUser] = None,
     include_children: bool = False,
     product_mapper=ProductToResource,
+    fields: Optional[Iterable[str]] = None,
     **kwargs,
 ) -> Iterable[ProductResource]:
     """Map a queryset of product models to a list of resources.
@@ -93,14 +138,22 @@ def product_queryset_to_resources(
     The request and user are optional, but if provided they are supplied to the
     partner strategy selector.
 
+    When ``fields`` is given, only the rules of those fields are applied and the
+    queryset only prefetches (and fetches the columns) that these rules need.
+
     :param queryset: A queryset of product models.
     :param request: The current HTTP request
     :param user: The current user
     :param include_children: Include children of parent products.
+    :param fields: Only map these fields of the resource, the others are left to their defaults.
     :param kwargs: Additional keyword arguments to pass to the strategy selector.
     """
+    if fields is not None:
+        fields = product_mapper.get_projection_fields(fields)
 
-    queryset = prefetch_product_queryset(queryset, include_children)
+    queryset = prefetch_product_queryset(
+        queryset, include_children, product_mapper, fields=fields
+    )
 
     return product_to_resource(
         queryset,
@@ -108,6 +161,125 @@ def product_queryset_to_resources(
         user,
         include_children,
         product_mapper,
+        fields=fields,
+        **kwargs,
+    )
+
+
+def product_queryset_to_resources_iterator(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    chunk_size: int = PRODUCTS_TO_RESOURCES_CHUNK_SIZE,
+    **kwargs,
+) -> Iterator[ProductResource]:
+    """Map a queryset of product models to resources, one chunk at a time.
+
+    This is the streaming variant of ``product_queryset_to_resources``, meant for
+    exporting large catalogues. The queryset is walked in chunks of ``chunk_size``
+    products paginated on the primary key, the registered prefetches are applied
+    to every chunk and each chunk is released before the next one is fetched, so
+    memory usage does not grow with the size of the catalogue.
+
+    The resources are yielded in primary key order, any ordering on the queryset
+    is ignored.
+
+    :param queryset: A queryset of product models.
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param chunk_size: The amount of products to fetch and map at once.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
+
+    queryset = prefetch_product_queryset(queryset, include_children, product_mapper)
+
+    # Related objects shared between products are mapped once for all chunks.
+    identity_map = {}
+    for chunk in chunked_queryset(queryset, chunk_size):
+        yield from product_to_resource_with_strategy(
+            chunk,
+            stock_strategy,
+            include_children,
+            product_mapper=product_mapper,
+            context={"identity_map": identity_map},
+        )
+        # Release the chunk before the next one is fetched.
+        del chunk
+
+
+def product_to_primitive(
+    product: Union[ProductModel, Iterable[ProductModel]],
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper: OscarBaseMapping = ProductToResource,
+    as_json: bool = False,
+    **kwargs,
+) -> Union[Dict, List[Dict], bytes]:
+    """Map a product model directly to a dictionary (or JSON).
+
+    The result is the same as mapping the product(s) with ``product_to_resource``
+    and dumping the resource(s) with the dict codec, but no resources are created
+    in between, which makes it a lot cheaper for bulk API and feed output.
+
+    :param product: A single product model or iterable of product models (eg a QuerySet).
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param as_json: Return JSON encoded bytes instead of dictionaries.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
+    primitive = product_to_resource_with_strategy(
+        product,
+        stock_strategy,
+        include_children,
+        product_mapper=product_mapper,
+        context={"primitive": True},
+    )
+    if not isinstance(primitive, dict):
+        primitive = list(primitive)
+
+    if as_json:
+        return primitive_to_json(primitive)
+    return primitive
+
+
+def product_queryset_to_primitive(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    as_json: bool = False,
+    **kwargs,
+) -> Union[List[Dict], bytes]:
+    """Map a queryset of product models directly to a list of dictionaries (or JSON).
+
+    This is the ``product_queryset_to_resources`` equivalent of ``product_to_primitive``.
+
+    :param queryset: A queryset of product models.
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param as_json: Return JSON encoded bytes instead of dictionaries.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    queryset = prefetch_product_queryset(queryset, include_children, product_mapper)
+
+    return product_to_primitive(
+        queryset,
+        request,
+        user,
+        include_children,
+        product_mapper,
+        as_json,
         **kwargs,
     )
 
@@ -120,12 +292,21 @@ def products_to_db(
     delete_related=False,
     clean_instances=True,
     chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+    identifier_cache=None,
+    skip_unchanged=False,
+    upsert=False,
+    stream=False,
 ) -> Tuple[List[ProductModel], Dict]:
     """Map mulitple products to a model and store them in the database.
 
     The method will first bulk update or create the foreign keys like parent products and productclasses
     After that all the products will be bulk saved.
     At last all related models like images, stockrecords, and related_products can will be saved and set on the product.
+
+    The products can be any iterable, eg; a generator parsing a feed, they're
+    mapped and saved one chunk at a time. With ``stream`` they're validated one chunk
+    at a time as well, so a feed doesn't have to fit in memory, see
+    ``resources_to_db_iterator``.
     """
     return resources_to_db(
         products,
@@ -136,4 +317,44 @@ def products_to_db(
         delete_related=delete_related,
         clean_instances=clean_instances,
         chunk_size=chunk_size,
+        identifier_cache=identifier_cache,
+        skip_unchanged=skip_unchanged,
+        upsert=upsert,
+        stream=stream,
+    )
+
+
+def products_to_db_iterator(
+    products,
+    fields_to_update=constants.ALL_CATALOGUE_FIELDS,
+    identifier_mapping=constants.MODEL_IDENTIFIERS_MAPPING,
+    product_mapper=ProductToModel,
+    delete_related=False,
+    clean_instances=True,
+    chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+    identifier_cache=None,
+    skip_unchanged=False,
+    upsert=False,
+    stream=False,
+) -> Iterator:
+    """Store multiple products in the database one chunk at a time, yielding the
+    saved primary keys and the errors of every chunk as it's saved.
+
+    Use this with ``stream`` to import feeds that don't fit in memory, and to report
+    progress while importing (including the amount of objects created, updated and unchanged with
+    ``skip_unchanged``), see ``resources_to_db_iterator``.
+    """
+    return resources_to_db_iterator(
+        products,
+        fields_to_update,
+        identifier_mapping,
+        model_mapper=product_mapper,
+        context_mapper=ProductModelMapperContext,
+        delete_related=delete_related,
+        clean_instances=clean_instances,
+        chunk_size=chunk_size,
+        identifier_cache=identifier_cache,
+        skip_unchanged=skip_unchanged,
+        upsert=upsert,
+        stream=stream,
     )
@@ -0,0 +1,161 @@
+"""Cache of the primary keys of models by their identifiers."""
+import threading
+import time
+from functools import partial
+from typing import Dict, Hashable, Iterable, Optional
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from ..settings import (
+    IDENTIFIER_CACHE_MODELS,
+    IDENTIFIER_CACHE_PROCESS_SCOPED,
+    IDENTIFIER_CACHE_TIMEOUT,
+)
+
+__all__ = (
+    "IdentifierCache",
+    "shared_identifier_cache",
+    "get_identifier_cache",
+    "connect_identifier_cache_signals",
+)
+
+
+class IdentifierCache:
+    """
+    Cache of primary keys, keyed by model and the values of the identifiers of the
+    model in ``MODEL_IDENTIFIERS_MAPPING``.
+
+    ``resources_to_db`` saves resources one chunk at a time, and reference models
+    like partners, product classes and categories are shared by most chunks. With a
+    cache that lives as long as the run, their primary keys are looked up (or
+    created) once, later chunks only query for keys that weren't seen yet.
+
+    A run's cache can be backed by a ``parent`` cache that lives as long as the
+    process (see ``shared_identifier_cache``). Keys are only added to the parent
+    when the transaction they were found or created in commits, so a rolled back
+    import doesn't leave primary keys of rows that don't exist. Keys in the parent
+    are used for ``timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        models: Iterable[str] = IDENTIFIER_CACHE_MODELS,
+        parent: Optional["IdentifierCache"] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.models = frozenset(models)
+        self.parent = parent
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Dict[Hashable, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def caches(self, Model) -> bool:
+        """Return whether the primary keys of the model are cached."""
+        # pylint: disable=protected-access
+        return Model._meta.label in self.models
+
+    def get_many(self, Model, keys: Iterable[Hashable]) -> Dict[Hashable, object]:
+        """Return a dictionary of key to primary key, of the keys that are cached."""
+        if not self.caches(Model):
+            return {}
+
+        # pylint: disable=protected-access
+        label = Model._meta.label
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            entries = self._entries.get(label, {})
+            for key in keys:
+                entry = entries.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    found[key] = entry[0]
+                else:
+                    missing.append(key)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing and self.parent is not None:
+            parent_found = self.parent.get_many(Model, missing)
+            # Keys of the parent are committed already.
+            self._set_many(label, parent_found)
+            found.update(parent_found)
+        return found
+
+    def set_many(self, Model, pks: Dict[Hashable, object]):
+        """Cache the primary keys of a dictionary of key to primary key."""
+        if not pks or not self.caches(Model):
+            return
+
+        # pylint: disable=protected-access
+        self._set_many(Model._meta.label, pks)
+        if self.parent is not None:
+            transaction.on_commit(partial(self.parent.set_many, Model, dict(pks)))
+
+    def _set_many(self, label: str, pks: Dict[Hashable, object]):
+        expires = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            entries = self._entries.setdefault(label, {})
+            for key, pk in pks.items():
+                if pk is not None:
+                    entries[key] = (pk, expires)
+
+    def clear(self, Model=None):
+        """Remove the primary keys of a model, or of all models."""
+        with self._lock:
+            if Model is None:
+                self._entries.clear()
+                self.hits = 0
+                self.misses = 0
+            else:
+                # pylint: disable=protected-access
+                self._entries.pop(Model._meta.label, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit and miss counters and the amount of cached keys."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": sum(len(entries) for entries in self._entries.values()),
+        }
+
+
+shared_identifier_cache = IdentifierCache(timeout=IDENTIFIER_CACHE_TIMEOUT)
+
+
+def get_identifier_cache() -> IdentifierCache:
+    """
+    Return a new cache for a ``resources_to_db`` run, backed by the shared cache
+    when ``IDENTIFIER_CACHE_PROCESS_SCOPED`` is set.
+    """
+    return IdentifierCache(
+        parent=shared_identifier_cache if IDENTIFIER_CACHE_PROCESS_SCOPED else None
+    )
+
+
+# pylint: disable=unused-argument
+def clear_shared_identifier_cache(sender, **kwargs):
+    """Forget the primary keys of a model when one of its objects is saved or deleted."""
+    shared_identifier_cache.clear(sender)
+
+
+def connect_identifier_cache_signals():
+    """
+    Clear the shared identifier cache of a model when its objects change outside of
+    the imports, eg; an identifier is changed or an object is deleted.
+    """
+    for label in shared_identifier_cache.models:
+        model = apps.get_model(label)
+        for signal in (post_save, post_delete):
+            signal.connect(
+                clear_shared_identifier_cache,
+                sender=model,
+                dispatch_uid=(
+                    f"oscar_odin_identifier_cache_{label}_"
+                    f"{'save' if signal is post_save else 'delete'}"
+                ),
+            )
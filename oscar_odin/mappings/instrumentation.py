@@ -0,0 +1,243 @@
+"""Instrumentation of the queries that mappings do."""
+import logging
+import random
+import re
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from ..exceptions import OscarOdinException
+from ..settings import (
+    QUERY_BUDGET_ACTION,
+    QUERY_BUDGET_METRICS_CALLBACK,
+    QUERY_BUDGET_PER_OBJECT,
+    QUERY_BUDGET_SAMPLE_RATE,
+)
+
+__all__ = (
+    "QueryBudgetExceeded",
+    "QueryRecorder",
+    "RuleQueryStats",
+    "current_query_recorder",
+    "sampled_query_recorder",
+)
+
+logger = logging.getLogger(__name__)
+
+current_query_recorder: ContextVar[Optional["QueryRecorder"]] = ContextVar(
+    "oscar_odin_query_recorder", default=None
+)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)|\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+LOG, RAISE, IGNORE = "log", "raise", "ignore"
+
+
+class QueryBudgetExceeded(OscarOdinException):
+    def __init__(self, violations: List["RuleQueryStats"]):
+        self.violations = violations
+        super().__init__(
+            "Query budget exceeded: "
+            + "; ".join(str(violation) for violation in violations)
+        )
+
+
+def get_query_fingerprint(sql: str) -> str:
+    """Replace the literals in a query, so the same query for other objects matches."""
+    sql = STRING_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    return IN_LIST_RE.sub("(...)", sql)
+
+
+class RuleQueryStats(NamedTuple):
+    """The queries done by a mapping rule, for all the objects it was applied to."""
+
+    mapping: str
+    field: str
+    objects: int
+    queries: int
+    repeated_queries: Dict[str, int]
+
+    @property
+    def queries_per_object(self) -> float:
+        return self.queries / self.objects if self.objects else float(self.queries)
+
+    @property
+    def is_n_plus_one(self) -> bool:
+        """Whether the same query is done for more than one object."""
+        return bool(self.repeated_queries)
+
+    def __str__(self):
+        description = (
+            f"{self.mapping}.{self.field} did {self.queries} queries "
+            f"for {self.objects} objects"
+        )
+        if self.repeated_queries:
+            description += f" ({len(self.repeated_queries)} repeated per object)"
+        return description
+
+
+class RuleRecord:
+    __slots__ = ("queries", "sources", "fingerprint_sources")
+
+    def __init__(self):
+        self.queries = 0
+        self.sources: Set[int] = set()
+        self.fingerprint_sources: Dict[str, Set[int]] = {}
+
+
+class QueryRecorder:
+    """
+    Records the queries issued inside each mapping rule of OscarBaseMapping subclasses.
+
+    Every query is attributed to the mapping class and field of the innermost rule
+    that is being applied, queries outside of a rule (eg; in prepare_batch) are
+    attributed to the mapping with the field "<batch>". Queries that have the same
+    fingerprint for more than ``min_repeats`` objects are reported as n+1 queries.
+
+    When the recorder exits, rules that exceed ``per_object`` queries per object, or
+    that do n+1 queries, are logged or raised depending on ``action``. The stats of
+    all rules are passed to ``metrics_callback`` if given.
+
+    Usage::
+
+        with QueryRecorder(per_object=2, action="raise") as recorder:
+            resources = list(product_queryset_to_resources(Product.objects.all()))
+
+        recorder.get_stats()
+    """
+
+    def __init__(
+        self,
+        per_object: Optional[float] = QUERY_BUDGET_PER_OBJECT,
+        action: str = QUERY_BUDGET_ACTION,
+        min_repeats: int = 2,
+        metrics_callback: Optional[Callable[[List[RuleQueryStats]], None]] = None,
+        using: Optional[List[str]] = None,
+    ):
+        if action not in (LOG, RAISE, IGNORE):
+            raise ValueError(f"Unsupported query budget action: {action}")
+
+        if metrics_callback is None and QUERY_BUDGET_METRICS_CALLBACK:
+            metrics_callback = import_string(QUERY_BUDGET_METRICS_CALLBACK)
+
+        self.per_object = per_object
+        self.action = action
+        self.min_repeats = min_repeats
+        self.metrics_callback = metrics_callback
+        self.using = using
+        self.records: Dict[Tuple[str, str], RuleRecord] = {}
+        self._stack: List[Tuple[Tuple[str, str], int]] = []
+        self._exit_stack = None
+        self._token = None
+
+    def __enter__(self):
+        self._exit_stack = ExitStack()
+        for alias in self.using or connections:
+            self._exit_stack.enter_context(connections[alias].execute_wrapper(self))
+        self._token = current_query_recorder.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        current_query_recorder.reset(self._token)
+        self._exit_stack.close()
+        if exc_type is None:
+            self.check()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._stack:
+            key, source_id = self._stack[-1]
+        else:
+            key, source_id = ("<none>", "<unattributed>"), None
+
+        record = self.records.get(key)
+        if record is None:
+            record = self.records[key] = RuleRecord()
+        record.queries += 1
+        if source_id is not None:
+            record.fingerprint_sources.setdefault(
+                get_query_fingerprint(sql), set()
+            ).add(source_id)
+
+        return execute(sql, params, many, context)
+
+    def enter_rule(self, mapping_type, field: str, source):
+        key = (mapping_type.__qualname__, field)
+        record = self.records.get(key)
+        if record is None:
+            record = self.records[key] = RuleRecord()
+        source_id = id(source)
+        record.sources.add(source_id)
+        self._stack.append((key, source_id))
+
+    def exit_rule(self):
+        self._stack.pop()
+
+    def get_stats(self) -> List[RuleQueryStats]:
+        """Return the query stats of every rule that did queries."""
+        stats = []
+        for (mapping, field), record in self.records.items():
+            if not record.queries:
+                continue
+            stats.append(
+                RuleQueryStats(
+                    mapping,
+                    field,
+                    len(record.sources),
+                    record.queries,
+                    {
+                        fingerprint: len(sources)
+                        for fingerprint, sources in record.fingerprint_sources.items()
+                        if len(sources) >= self.min_repeats
+                    },
+                )
+            )
+        return sorted(stats, key=lambda stat: -stat.queries)
+
+    def get_violations(self) -> List[RuleQueryStats]:
+        """Return the stats of the rules that exceed the budget or do n+1 queries."""
+        return [
+            stat
+            for stat in self.get_stats()
+            if stat.is_n_plus_one
+            or (
+                self.per_object is not None
+                and stat.queries_per_object > self.per_object
+            )
+        ]
+
+    def check(self):
+        """Report the stats and act on the rules that exceed the budget."""
+        if self.metrics_callback is not None:
+            self.metrics_callback(self.get_stats())
+
+        if self.action == IGNORE:
+            return
+
+        violations = self.get_violations()
+        if not violations:
+            return
+
+        if self.action == RAISE:
+            raise QueryBudgetExceeded(violations)
+
+        for violation in violations:
+            logger.warning("Query budget exceeded: %s", violation)
+
+
+def sampled_query_recorder(sample_rate: float = QUERY_BUDGET_SAMPLE_RATE):
+    """
+    Return a query recorder for a fraction (``QUERY_BUDGET_SAMPLE_RATE``) of the calls,
+    so query regressions can be detected in production without recording every run.
+    Returns None when the run is not sampled or a recorder is active already.
+    """
+    if not sample_rate or current_query_recorder.get() is not None:
+        return None
+    if random.random() >= sample_rate:
+        return None
+    return QueryRecorder()
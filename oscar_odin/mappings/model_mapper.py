@@ -53,6 +53,7 @@ class ModelMappingMeta(NonRegisterableMappingMeta):
                 for rule in existing_rules
                 if not is_mapping_rule_excluded(rule, exclude_fields)
             ]
+            cls.compile_mapping_rules(mapping_type)
 
         return mapping_type
 
@@ -2,17 +2,18 @@
 from typing import Any, Dict, Iterable, List, Optional, Union
 
 import odin
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
 from django.http import HttpRequest
 
 from oscar.core.loading import get_model, get_class, get_classes
 
 from decimal import Decimal
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
 
 __all__ = (
     "OrderToResource",
     "order_to_resource",
+    "order_queryset_to_resources",
+    "order_to_primitive",
 )
 
 Selector = get_class("partner.strategy", "Selector")
@@ -27,6 +28,7 @@ ShippingEventModel = get_model("order", "ShippingEvent")
 OrderDiscountModel = get_model("order", "OrderDiscount")
 OrderLineDiscountModel = get_model("order", "OrderLineDiscount")
 SurchargeModel = get_model("order", "Surcharge")
+ProductModel = get_model("catalogue", "Product")
 
 # mappings
 map_queryset, OscarBaseMapping = get_classes(
@@ -40,6 +42,21 @@ BillingAddressToResource, ShippingAddressToResource = get_classes(
     ["BillingAddressToResource", "ShippingAddressToResource"],
 )
 UserToResource = get_class("oscar_odin.mappings.auth", "UserToResource")
+primitive_to_json = get_class("oscar_odin.utils", "primitive_to_json")
+(
+    prefetch_order_queryset,
+    prefetch_product_queryset,
+    get_order_line_queryset,
+    get_order_discount_line_queryset,
+) = get_classes(
+    "oscar_odin.mappings.prefetching.prefetch",
+    [
+        "prefetch_order_queryset",
+        "prefetch_product_queryset",
+        "get_order_line_queryset",
+        "get_order_discount_line_queryset",
+    ],
+)
 
 # resources
 UserResource = get_class("oscar_odin.resources.auth", "UserResource")
@@ -82,6 +99,43 @@ BillingAddressResource, ShippingAddressResource = get_classes(
 )
 
 
+def get_stock_strategy(context: Dict[str, Any]):
+    """Return the stock strategy of the mapping run, it's resolved once per run."""
+    stock_strategy = context.get("stock_strategy")
+    if stock_strategy is None:
+        stock_strategy = context["stock_strategy"] = Selector().strategy()
+    return stock_strategy
+
+
+def map_line_products(lines: List[LineModel], context: Dict[str, Any]):
+    """
+    Map the distinct products of the lines in one prefetched batch, and store the
+    resources in the context by product id so lines of the same product share them.
+    """
+    line_products = context.setdefault("line_products", {})
+
+    # Lines of which the product is prefetched already are skipped.
+    prefetch_related_objects(
+        lines,
+        Prefetch(
+            "product", queryset=prefetch_product_queryset(ProductModel.objects.all())
+        ),
+    )
+
+    products = {}
+    for line in lines:
+        if line.product_id is not None and line.product_id not in line_products:
+            products.setdefault(line.product_id, line.product)
+
+    if products:
+        resources = product_to_resource_with_strategy(
+            list(products.values()),
+            stock_strategy=get_stock_strategy(context),
+            context={"primitive": context.get("primitive", False)},
+        )
+        line_products.update(zip(products, resources))
+
+
 class SurchargeToResource(OscarBaseMapping):
     """Mapping from a surcharge model to a resource."""
 
@@ -98,7 +152,7 @@ class DiscountLineToResource(OscarBaseMapping):
     @odin.assign_field
     def line(self):
         """map line object as resource"""
-        return LineToResource.apply(self.source.line)
+        return LineToResource.apply(self.source.line, context=self.context)
 
 
 class DiscountToResource(OscarBaseMapping):
@@ -142,20 +196,15 @@ class DiscountToResource(OscarBaseMapping):
     @odin.assign_field(to_list=True)
     def discount_lines_per_tax_code(self):
         """get the total discount of all lines for each tax code"""
-        discount_lines = []
-
-        for tax_code in sorted(
-            set(self.source.discount_lines.values_list("line__tax_code", flat=True))
-        ):
-            amount = self.source.discount_lines.filter(
-                line__tax_code=tax_code
-            ).aggregate(amount=Coalesce(Sum("amount"), Decimal(0)))["amount"]
+        amounts = {}
+        for discount_line in self.source.discount_lines.all():
+            tax_code = discount_line.line.tax_code
+            amounts[tax_code] = amounts.get(tax_code, Decimal(0)) + discount_line.amount
 
-            discount_lines.append(
-                DiscountPerTaxCodeResource(amount=amount, tax_code=tax_code)
-            )
-
-        return discount_lines
+        return [
+            DiscountPerTaxCodeResource(amount=amounts[tax_code], tax_code=tax_code)
+            for tax_code in sorted(amounts)
+        ]
 
 
 class ShippingEventToResource(OscarBaseMapping):
@@ -191,17 +240,31 @@ class LineToResource(OscarBaseMapping):
         items = self.source.prices.all()
         return map_queryset(LinePriceToResource, items, context=self.context)
 
+    @classmethod
+    def prepare_batch(cls, sources, context):
+        """Map the products of all lines in the batch at once."""
+        map_line_products(sources, context)
+
     @odin.assign_field(to_list=True)
     def product(self) -> ProductResource:
+        line_products = self.context.get("line_products", {})
+        if self.source.product_id in line_products:
+            return line_products[self.source.product_id]
+
         if self.source.product:
             return product_to_resource_with_strategy(
-                product=self.source.product, stock_strategy=Selector().strategy()
+                product=self.source.product,
+                stock_strategy=get_stock_strategy(self.context),
+                context={"primitive": self.context.get("primitive", False)},
             )
 
     @odin.assign_field
     def attributes(self) -> Dict[str, Any]:
         """Map attributes."""
-        return dict(self.source.attributes.values_list("type", "value"))
+        return {
+            attribute.type: attribute.value
+            for attribute in self.source.attributes.all()
+        }
 
 
 class StatusChangeToResource(OscarBaseMapping):
@@ -224,6 +287,25 @@ class OrderToResource(OscarBaseMapping):
     from_obj = OrderModel
     to_obj = OrderResource
 
+    @classmethod
+    def prepare_batch(cls, sources, context):
+        """
+        Prefetch the lines and discount lines of all orders in the batch, and map the
+        products of the lines at once.
+        """
+        # Orders of which the lines or discount lines are prefetched already are skipped.
+        prefetch_related_objects(
+            sources,
+            Prefetch("lines", queryset=get_order_line_queryset()),
+            Prefetch(
+                "discounts__discount_lines",
+                queryset=get_order_discount_line_queryset(),
+            ),
+        )
+        map_line_products(
+            [line for order in sources for line in order.lines.all()], context
+        )
+
     @odin.assign_field
     def email(self) -> str:
         """Map order email."""
@@ -233,19 +315,23 @@ class OrderToResource(OscarBaseMapping):
     def user(self) -> Optional[UserResource]:
         """Map user."""
         if self.source.user:
-            return UserToResource.apply(self.source.user)
+            return UserToResource.apply(self.source.user, context=self.context)
 
     @odin.assign_field
     def billing_address(self) -> Optional[BillingAddressResource]:
         """Map billing address."""
         if self.source.billing_address:
-            return BillingAddressToResource.apply(self.source.billing_address)
+            return BillingAddressToResource.apply(
+                self.source.billing_address, context=self.context
+            )
 
     @odin.assign_field
     def shipping_address(self) -> Optional[ShippingAddressResource]:
         """Map shipping address."""
         if self.source.shipping_address:
-            return ShippingAddressToResource.apply(self.source.shipping_address)
+            return ShippingAddressToResource.apply(
+                self.source.shipping_address, context=self.context
+            )
 
     @odin.assign_field(to_list=True)
     def lines(self) -> List[LineResource]:
@@ -304,5 +390,49 @@ def order_to_resource(
     """
     return OrderToResource.apply(
         order,
-        context={},
+        context={"stock_strategy": Selector().strategy(request=request)},
     )
+
+
+def order_queryset_to_resources(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+) -> Iterable[OrderResource]:
+    """Map a queryset of order models to a list of resources.
+
+    The operations registered on the order_prefetch_registry are applied to the
+    queryset, so the amount of queries doesn't grow with the amount of orders.
+
+    :param queryset: A queryset of order models.
+    :param request: The current HTTP request
+    """
+    return order_to_resource(prefetch_order_queryset(queryset), request)
+
+
+def order_to_primitive(
+    order: Union[OrderModel, Iterable[OrderModel]],
+    request: Optional[HttpRequest] = None,
+    as_json: bool = False,
+) -> Union[Dict, List[Dict], bytes]:
+    """Map an order model directly to a dictionary (or JSON).
+
+    The result is the same as mapping the order(s) with ``order_to_resource`` and
+    dumping the resource(s) with the dict codec, but no resources are created in between.
+
+    :param order: A single order model or iterable of order models (eg a QuerySet).
+    :param request: The current HTTP request
+    :param as_json: Return JSON encoded bytes instead of dictionaries.
+    """
+    primitive = OrderToResource.apply(
+        order,
+        context={
+            "stock_strategy": Selector().strategy(request=request),
+            "primitive": True,
+        },
+    )
+    if not isinstance(primitive, dict):
+        primitive = list(primitive)
+
+    if as_json:
+        return primitive_to_json(primitive)
+    return primitive
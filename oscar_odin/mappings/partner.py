@@ -1,9 +1,11 @@
 import odin
 
-from oscar.core.loading import get_class, get_model
+from oscar.core.loading import get_class, get_classes, get_model
 
 ModelMapping = get_class("oscar_odin.mappings.model_mapper", "ModelMapping")
-OscarBaseMapping = get_class("oscar_odin.mappings.common", "OscarBaseMapping")
+map_shared, OscarBaseMapping = get_classes(
+    "oscar_odin.mappings.common", ["map_shared", "OscarBaseMapping"]
+)
 
 # resources
 PartnerResource = get_class("oscar_odin.resources.partner", "PartnerResource")
@@ -29,7 +31,7 @@ class StockRecordModelToResource(OscarBaseMapping):
 
     @odin.map_field
     def partner(self, partner):
-        return PartnerModelToResource.apply(partner)
+        return map_shared(PartnerModelToResource, partner, context=self.context)
 
 
 class StockRecordToModel(ModelMapping):
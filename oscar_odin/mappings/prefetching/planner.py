@@ -0,0 +1,387 @@
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Model, Prefetch
+
+from ..common import compile_action
+from .registry import PrefetchRegistry, PrefetchType, prefetch_registry
+
+
+class PrefetchRequirements(NamedTuple):
+    prefetches: tuple
+    select_related: tuple
+    mapping: object
+    children: bool
+    fields: tuple
+
+
+def requires_prefetch(
+    *prefetches: PrefetchType,
+    select_related: Iterable[str] = (),
+    mapping=None,
+    children: bool = False,
+    fields: Iterable[str] = (),
+):
+    """
+    Declare the relations a mapping rule uses, so the prefetch planner can derive them.
+
+    The relations of fields that are mapped directly from the model are found by the
+    planner, this decorator is meant for rules that use model methods (eg; get_all_images).
+
+    Args:
+        prefetches (PrefetchType): The prefetch_related operations the rule needs. Can be
+            lookups, Prefetch objects, or methods that accept a queryset (like the ones
+            registered on the PrefetchRegistry).
+        select_related (Iterable[str]): The select_related operations the rule needs.
+        mapping: The mapping that is applied to the objects of the first lookup (or the
+            first select_related if there are no lookups), its relations are planned too.
+            Can be a callable that returns the mapping, for mappings that map themselves.
+        children (bool): The rule only needs the relations when children are included.
+        fields (Iterable[str]): The model fields the rule reads, besides the select_related
+            relations. Projected querysets only fetch these columns (see get_only_fields).
+    """
+
+    def decorator(func):
+        func.prefetch_requirements = PrefetchRequirements(
+            prefetches, tuple(select_related), mapping, children, tuple(fields)
+        )
+        return func
+
+    return decorator
+
+
+class PrefetchPlan:
+    """The select_related and prefetch_related operations that a mapping needs."""
+
+    def __init__(self):
+        self.select_related: Set[str] = set()
+        self.prefetches: Dict[str, PrefetchType] = {}
+        self.children_prefetches: Dict[str, PrefetchType] = {}
+
+    def add_prefetch(self, prefetch: PrefetchType, children: bool = False):
+        key = PrefetchRegistry.get_key(prefetch)
+        if children:
+            if key not in self.prefetches:
+                self.children_prefetches.setdefault(key, prefetch)
+        else:
+            self.children_prefetches.pop(key, None)
+            self.prefetches.setdefault(key, prefetch)
+
+    def merge(
+        self, registry: PrefetchRegistry, known: Optional["PrefetchPlan"] = None
+    ) -> "PrefetchPlan":
+        """
+        Return a new plan with both the operations of this plan and of the registry.
+
+        Registered operations that are in the ``known`` plan are left out, for plans of a
+        projection these are the operations of the fields that are not projected.
+        """
+        known_select_related = known.select_related if known else set()
+        known_prefetches = (
+            {**known.prefetches, **known.children_prefetches} if known else {}
+        )
+
+        plan = PrefetchPlan()
+        plan.select_related = (
+            set(registry.get_select_related()) - known_select_related
+        ) | self.select_related
+        for key, prefetch in registry.get_prefetches().items():
+            if key not in known_prefetches:
+                plan.add_prefetch(prefetch)
+        for prefetch in self.prefetches.values():
+            plan.add_prefetch(prefetch)
+        for key, prefetch in registry.get_children_prefetches().items():
+            if key not in known_prefetches:
+                plan.add_prefetch(prefetch, children=True)
+        for prefetch in self.children_prefetches.values():
+            plan.add_prefetch(prefetch, children=True)
+        return plan
+
+
+def get_relation(model, field_name: str):
+    """Return the relation field of the model with the given name, or None."""
+    if model is None:
+        return None
+    try:
+        field = model._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def get_lookup_model(model, lookup: str):
+    """Return the model a lookup (eg; "parent__images") ends at, and the last relation."""
+    relation = None
+    for field_name in lookup.split("__"):
+        relation = get_relation(model, field_name)
+        if relation is None:
+            return None, None
+        model = relation.related_model
+    return model, relation
+
+
+def get_back_reference(relation) -> Optional[str]:
+    """
+    Return the name of the field that refers back to the object a reverse relation was
+    followed from. Django sets it when prefetching, so it doesn't have to be planned.
+    """
+    if relation is not None and relation.one_to_many:
+        return relation.field.name
+    return None
+
+
+def is_excluded(prefetch, exclude: Optional[str]) -> bool:
+    """Return whether a lookup follows the excluded (back reference) field."""
+    if exclude is None:
+        return False
+    lookup = prefetch if isinstance(prefetch, str) else prefetch.prefetch_through
+    return lookup.split("__", 1)[0] == exclude
+
+
+def prefix_lookup(prefix: str, lookup: str) -> str:
+    return f"{prefix}__{lookup}" if prefix else lookup
+
+
+def plan_model_field(plan, model, from_field: str, has_action: bool, prefix, children):
+    """
+    Plan the relations of a field that is read directly from the model. Nested field
+    names (eg; "shipping_address.line4") follow foreign keys.
+    """
+    field_names = from_field.split(".")
+    lookup = prefix
+    for index, field_name in enumerate(field_names):
+        relation = get_relation(model, field_name)
+        if relation is None:
+            return
+
+        lookup = prefix_lookup(lookup, field_name)
+        is_last = index == len(field_names) - 1
+        if relation.many_to_one or relation.one_to_one:
+            if prefix:
+                plan.add_prefetch(lookup, children)
+            else:
+                plan.select_related.add(lookup)
+        elif is_last and has_action:
+            # Related managers that are passed on as is are not evaluated by the
+            # mapping, they are only prefetched when an action receives them.
+            plan.add_prefetch(lookup, children)
+        model = relation.related_model
+
+
+def plan_requirements(plan, model, requirements, prefix, children, seen, exclude):
+    if requirements.children and prefix:
+        # Children are only included for the products that are mapped, not for their relations.
+        return
+    children = children or requirements.children
+
+    for prefetch in requirements.prefetches:
+        if isinstance(prefetch, (str, Prefetch)) and is_excluded(prefetch, exclude):
+            continue
+        if isinstance(prefetch, str):
+            plan.add_prefetch(prefix_lookup(prefix, prefetch), children)
+        elif isinstance(prefetch, Prefetch):
+            if prefix:
+                plan.add_prefetch(
+                    Prefetch(
+                        prefix_lookup(prefix, prefetch.prefetch_through),
+                        queryset=prefetch.queryset,
+                        to_attr=prefetch.to_attr,
+                    ),
+                    children,
+                )
+            else:
+                plan.add_prefetch(prefetch, children)
+        elif not prefix:
+            # Prefetch methods operate on the product queryset itself, they receive
+            # include_children and are responsible for nested relations themselves.
+            plan.add_prefetch(prefetch, children)
+
+    for select in requirements.select_related:
+        if is_excluded(select, exclude):
+            continue
+        if prefix:
+            plan.add_prefetch(prefix_lookup(prefix, select), children)
+        else:
+            plan.select_related.add(select)
+
+    nested_mapping = requirements.mapping
+    if nested_mapping is None:
+        return
+    if not isinstance(nested_mapping, type):
+        nested_mapping = nested_mapping()
+
+    lookups = [
+        prefetch if isinstance(prefetch, str) else prefetch.prefetch_through
+        for prefetch in requirements.prefetches
+        if isinstance(prefetch, (str, Prefetch))
+    ] or list(requirements.select_related)
+    if not lookups:
+        return
+
+    nested_model, relation = get_lookup_model(model, lookups[0])
+    plan_mapping(
+        plan,
+        nested_mapping,
+        prefix_lookup(prefix, lookups[0]),
+        children,
+        seen,
+        nested_model,
+        get_back_reference(relation),
+    )
+
+
+def plan_mapping(
+    plan,
+    mapping_type,
+    prefix="",
+    children=False,
+    seen=(),
+    model=None,
+    exclude=None,
+    fields=None,
+):
+    # Mappings that map themselves (eg; the children of products) are planned one level deep.
+    if seen.count(mapping_type) > 1:
+        return
+    seen = (*seen, mapping_type)
+
+    if model is None:
+        model = mapping_type.from_obj
+    if not (isinstance(model, type) and issubclass(model, Model)):
+        return
+
+    for compiled_rule in mapping_type._compiled_rules:  # pylint: disable=W0212
+        if fields is not None and fields.isdisjoint(compiled_rule.to_fields):
+            continue
+
+        rule = compiled_rule.rule
+        action = rule.action
+        if isinstance(action, str):
+            action = getattr(mapping_type, action, None)
+
+        requirements = getattr(action, "prefetch_requirements", None)
+        if requirements is not None:
+            plan_requirements(
+                plan, model, requirements, prefix, children, seen, exclude
+            )
+        elif rule.from_field is not None:
+            for from_field in rule.from_field:
+                if not is_excluded(from_field.replace(".", "__"), exclude):
+                    plan_model_field(
+                        plan,
+                        model,
+                        from_field,
+                        compile_action(mapping_type, rule) is not None,
+                        prefix,
+                        children,
+                    )
+
+
+@lru_cache(maxsize=128)
+def plan_prefetches(
+    mapping_type, fields: Optional[FrozenSet[str]] = None
+) -> PrefetchPlan:
+    """
+    Derive the select_related and prefetch_related operations a mapping needs from
+    its mapping rules and the rules of the mappings it applies to related objects.
+
+    Args:
+        mapping_type: The mapping to plan the prefetches for (eg; ProductToResource).
+        fields (FrozenSet[str]): Only plan the rules that map these fields of the
+            mapping, the mappings of related objects are planned completely.
+
+    Returns:
+        PrefetchPlan: The operations the mapping needs.
+    """
+    plan = PrefetchPlan()
+    plan_mapping(plan, mapping_type, fields=fields)
+    return plan
+
+
+@lru_cache(maxsize=128)
+def get_only_fields(
+    mapping_type, fields: FrozenSet[str], always: Iterable[str] = ()
+) -> Optional[FrozenSet[str]]:
+    """
+    Return the model fields the rules that map the projected fields read, to pass to
+    ``QuerySet.only()``. The select_related relations of the plan are included, as
+    they can't be deferred.
+
+    Fields that are copied from the model are known, rules with an action have to
+    declare the fields they read with ``requires_prefetch(fields=...)``. When a rule
+    doesn't, None is returned and no fields should be deferred, as reading a deferred
+    field does a query per object.
+
+    Args:
+        mapping_type: The mapping that maps the projection (eg; ProductToResource).
+        fields (FrozenSet[str]): The projected fields of the mapping.
+        always (Iterable[str]): Model fields that are read outside of the rules.
+
+    Returns:
+        Optional[FrozenSet[str]]: The model fields to fetch, or None.
+    """
+    model = mapping_type.from_obj
+    only_fields = {model._meta.pk.name, *always}
+    only_fields.update(
+        lookup.split("__", 1)[0]
+        for lookup in plan_prefetches(mapping_type, fields).select_related
+    )
+
+    for compiled_rule in mapping_type._compiled_rules:  # pylint: disable=W0212
+        if fields.isdisjoint(compiled_rule.to_fields):
+            continue
+
+        rule = compiled_rule.rule
+        action = rule.action
+        if isinstance(action, str):
+            action = getattr(mapping_type, action, None)
+
+        requirements = getattr(action, "prefetch_requirements", None)
+        if requirements is not None:
+            only_fields.update(requirements.fields)
+            only_fields.update(
+                select.split("__", 1)[0] for select in requirements.select_related
+            )
+        elif rule.from_field is not None:
+            for from_field in rule.from_field:
+                field_name = from_field.split(".", 1)[0]
+                try:
+                    field = model._meta.get_field(field_name)
+                except FieldDoesNotExist:
+                    return None
+                if field.concrete:
+                    only_fields.add(field_name)
+        else:
+            return None
+
+    return frozenset(only_fields)
+
+
+def get_unused_prefetches(
+    mapping_type, registry: PrefetchRegistry = prefetch_registry
+) -> Dict[str, List[str]]:
+    """
+    Report the registered operations that the mapping doesn't need according to the
+    planner. These are candidates for unregistering, as they cost an extra query
+    each time a queryset is prefetched.
+
+    Args:
+        mapping_type: The mapping to check the registered operations against.
+        registry (PrefetchRegistry): The registry to check.
+
+    Returns:
+        Dict[str, List[str]]: The unused select_related, prefetches and children_prefetches keys.
+    """
+    plan = plan_prefetches(mapping_type)
+    return {
+        "select_related": sorted(
+            set(registry.get_select_related()) - plan.select_related
+        ),
+        "prefetches": sorted(set(registry.get_prefetches()) - set(plan.prefetches)),
+        "children_prefetches": sorted(
+            set(registry.get_children_prefetches())
+            - set(plan.children_prefetches)
+            - set(plan.prefetches)
+        ),
+    }
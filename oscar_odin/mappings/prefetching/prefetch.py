@@ -1,94 +1,207 @@
-from django.db.models import Prefetch
+from typing import Iterable, Optional
+
+from django.db.models import Prefetch, QuerySet
 
 from oscar.core.loading import get_class, get_model
 
-from .registry import prefetch_registry
+from .registry import order_prefetch_registry, prefetch_registry
 
 ProductQuerySet = get_class("catalogue.managers", "ProductQuerySet")
 
 ProductModel = get_model("catalogue", "Product")
+LineModel = get_model("order", "Line")
+
+# The product fields that are read for every product (eg; is_child, get_product_class),
+# also when the product resource is projected on a few fields.
+PRODUCT_ONLY_FIELDS = ("structure", "parent", "product_class")
+OrderLineDiscountModel = get_model("order", "OrderLineDiscount")
+
+
+def apply_prefetches(queryset: ProductQuerySet, prefetches, **callable_kwargs):
+    for prefetch in prefetches.values():
+        if isinstance(prefetch, (str, Prefetch)):
+            queryset = queryset.prefetch_related(prefetch)
+        elif callable(prefetch):
+            queryset = prefetch(queryset, **callable_kwargs)
+    return queryset
 
 
 def prefetch_product_queryset(
-    queryset: ProductQuerySet, include_children: bool = False, **kwargs
+    queryset: ProductQuerySet,
+    include_children: bool = False,
+    product_mapper=None,
+    fields: Optional[Iterable[str]] = None,
+    **kwargs,
 ) -> ProductQuerySet:
     """
     Optimize the product queryset with registered select_related and prefetch_related operations.
 
+    When a product mapper is passed, the operations the prefetch planner derives from
+    its mapping rules are applied too, so custom mappers don't fall back to n+1 queries.
+
+    When the mapping is projected on a set of fields, only the operations of the rules
+    that map those fields are applied (registered operations the planner doesn't know
+    are kept), and the columns are limited with ``only()`` if the rules declare them.
+
     Args:
         queryset (ProductQuerySet): The initial queryset to optimize.
         include_children (bool): Whether to include prefetches for children.
+        product_mapper: The mapping the products will be mapped with.
+        fields (Iterable[str]): The resource fields the products are mapped to, requires
+            a product mapper.
 
     Returns:
         ProductQuerySet: The optimized queryset.
     """
     callable_kwargs = {"include_children": include_children, **kwargs}
 
-    select_related_fields = prefetch_registry.get_select_related()
-    queryset = queryset.select_related(*select_related_fields)
+    only_fields = None
+    if product_mapper is not None and fields is not None:
+        # pylint: disable=import-outside-toplevel
+        from .planner import get_only_fields, plan_prefetches
 
-    prefetches = prefetch_registry.get_prefetches()
-    for prefetch in prefetches.values():
-        if isinstance(prefetch, (str, Prefetch)):
-            queryset = queryset.prefetch_related(prefetch)
-        elif callable(prefetch):
-            queryset = prefetch(queryset, **callable_kwargs)
+        fields = frozenset(fields)
+        plan = plan_prefetches(product_mapper, fields).merge(
+            prefetch_registry, known=plan_prefetches(product_mapper)
+        )
+        select_related_fields = plan.select_related
+        prefetches = plan.prefetches
+        children_prefetches = plan.children_prefetches
+        only_fields = get_only_fields(product_mapper, fields, PRODUCT_ONLY_FIELDS)
+    elif product_mapper is not None:
+        # pylint: disable=import-outside-toplevel
+        from .planner import plan_prefetches
+
+        plan = plan_prefetches(product_mapper).merge(prefetch_registry)
+        select_related_fields = plan.select_related
+        prefetches = plan.prefetches
+        children_prefetches = plan.children_prefetches
+    else:
+        select_related_fields = prefetch_registry.get_select_related()
+        prefetches = prefetch_registry.get_prefetches()
+        children_prefetches = prefetch_registry.get_children_prefetches()
+
+    queryset = queryset.select_related(*select_related_fields)
+    queryset = apply_prefetches(queryset, prefetches, **callable_kwargs)
 
     if include_children:
-        children_prefetches = prefetch_registry.get_children_prefetches()
-        for prefetch in children_prefetches.values():
-            if isinstance(prefetch, (str, Prefetch)):
-                queryset = queryset.prefetch_related(prefetch)
-            elif callable(prefetch):
-                queryset = prefetch(queryset, **callable_kwargs)
+        queryset = apply_prefetches(queryset, children_prefetches, **callable_kwargs)
+
+    if only_fields is not None:
+        queryset = queryset.only(*only_fields)
 
     return queryset
 
 
-def register_default_prefetches():
-    # ProductToResource.product_class -> get_product_class
-    prefetch_registry.register_select_related(["product_class", "parent"])
+# ProducToResource.attributes -> get_attribute_values
+def prefetch_attribute_values(queryset: ProductQuerySet, **kwargs):
+    return queryset.prefetch_attribute_values(
+        include_parent_children_attributes=kwargs.get("include_children", False)
+    )
 
-    # ProductToResource.images -> get_all_images
-    prefetch_registry.register_prefetch("images")
 
-    # ProducToResource.map_stock_price -> fetch_for_product
-    prefetch_registry.register_prefetch("stockrecords")
+# ProductToResource.categories -> get_categories
+# ProductToResource.categories -> get_categories -> looks up the parent categories if child
+def prefetch_browsable_categories(queryset: ProductQuerySet, **kwargs):
+    return queryset.prefetch_browsable_categories()
+
 
-    # This gets prefetches somewhere (.categories.all()), it's not in get_categories as that does
-    # .browsable() and that's where the prefetch_browsable_categories is for. But if we remove this,
-    # the amount of queries will be more again. ToDo: Figure out where this is used and document it.
-    prefetch_registry.register_prefetch("categories")
+# ProductToResource.map_stock_price -> fetch_for_parent -> product.children.public() -> stockrecords
+def prefetch_public_children_stockrecords(queryset: ProductQuerySet, **kwargs):
+    return queryset.prefetch_public_children(
+        queryset=ProductModel.objects.public().prefetch_related("stockrecords")
+    )
 
+
+def register_default_prefetches():
     # The parent and its related fields are prefetched in numerous places in the resource.
     # ProductToResource.product_class -> get_product_class (takes parent product_class if itself has no product_class)
+    prefetch_registry.register_select_related(
+        ["product_class", "parent", "parent__product_class"]
+    )
+
     # ProductToResource.images -> get_all_images (takes parent images if itself has no images)
-    prefetch_registry.register_prefetch("parent__product_class")
+    prefetch_registry.register_prefetch("images")
     prefetch_registry.register_prefetch("parent__images")
 
-    # ProducToResource.attributes -> get_attribute_values
-    def prefetch_attribute_values(queryset: ProductQuerySet, **kwargs):
-        return queryset.prefetch_attribute_values(
-            include_parent_children_attributes=kwargs.get("include_children", False)
-        )
+    # ProducToResource.map_stock_price -> fetch_for_product
+    prefetch_registry.register_prefetch("stockrecords")
 
     prefetch_registry.register_prefetch(prefetch_attribute_values)
-
-    # ProductToResource.categories -> get_categories
-    # ProductToResource.categories -> get_categories -> looks up the parent categories if child
-    def prefetch_browsable_categories(queryset: ProductQuerySet, **kwargs):
-        return queryset.prefetch_browsable_categories()
-
     prefetch_registry.register_prefetch(prefetch_browsable_categories)
-
-    # ProductToResource.map_stock_price -> fetch_for_parent -> product.children.public() -> stockrecords
-    def prefetch_public_children_stockrecords(queryset: ProductQuerySet, **kwargs):
-        return queryset.prefetch_public_children(
-            queryset=ProductModel.objects.public().prefetch_related("stockrecords")
-        )
-
     prefetch_registry.register_prefetch(prefetch_public_children_stockrecords)
 
     # Register children prefetches
+    # ProductToResource.prepare_children maps the prefetched children of a batch of
+    # parents, and fetches them itself when they aren't prefetched.
     prefetch_registry.register_children_prefetch("children__images")
     prefetch_registry.register_children_prefetch("children__stockrecords")
+
+
+def prefetch_order_queryset(queryset: QuerySet, **kwargs) -> QuerySet:
+    """
+    Optimize the order queryset with the select_related and prefetch_related operations
+    registered on the order_prefetch_registry.
+
+    Args:
+        queryset (QuerySet): The initial order queryset to optimize.
+
+    Returns:
+        QuerySet: The optimized queryset.
+    """
+    queryset = queryset.select_related(*order_prefetch_registry.get_select_related())
+    return apply_prefetches(
+        queryset, order_prefetch_registry.get_prefetches(), **kwargs
+    )
+
+
+def get_order_line_queryset():
+    # LineToResource.prices, LineToResource.attributes and LineToResource.product
+    return LineModel.objects.prefetch_related(
+        "prices",
+        "attributes",
+        Prefetch(
+            "product", queryset=prefetch_product_queryset(ProductModel.objects.all())
+        ),
+    )
+
+
+# OrderToResource.lines -> LineToResource
+def prefetch_order_lines(queryset: QuerySet, **kwargs):
+    return queryset.prefetch_related(
+        Prefetch("lines", queryset=get_order_line_queryset())
+    )
+
+
+def get_order_discount_line_queryset():
+    # DiscountLineToResource.line
+    return OrderLineDiscountModel.objects.prefetch_related(
+        Prefetch("line", queryset=get_order_line_queryset())
+    )
+
+
+# OrderToResource.discounts -> DiscountToResource.discount_lines -> DiscountLineToResource.line
+def prefetch_order_discount_lines(queryset: QuerySet, **kwargs):
+    return queryset.prefetch_related(
+        Prefetch(
+            "discounts__discount_lines", queryset=get_order_discount_line_queryset()
+        )
+    )
+
+
+def register_default_order_prefetches():
+    # OrderToResource.user, OrderToResource.billing_address and OrderToResource.shipping_address
+    order_prefetch_registry.register_select_related(
+        ["user", "billing_address__country", "shipping_address__country"]
+    )
+
+    order_prefetch_registry.register_prefetch(prefetch_order_lines)
+    order_prefetch_registry.register_prefetch("notes")
+    order_prefetch_registry.register_prefetch("status_changes")
+    order_prefetch_registry.register_prefetch("discounts")
+    order_prefetch_registry.register_prefetch(prefetch_order_discount_lines)
+    order_prefetch_registry.register_prefetch("surcharges")
+
+    # The event types are mapped to their names
+    order_prefetch_registry.register_prefetch("shipping_events__event_type")
+    order_prefetch_registry.register_prefetch("payment_events__event_type")
@@ -121,6 +121,10 @@ class PrefetchRegistry:
         return list(self.select_related)
 
     def _get_key(self, operation: Union[PrefetchType, SelectRelatedType]) -> str:
+        return self.get_key(operation)
+
+    @staticmethod
+    def get_key(operation: Union[PrefetchType, SelectRelatedType]) -> str:
         """
         Get the key for an operation.
 
@@ -141,3 +145,4 @@ class PrefetchRegistry:
 
 
 prefetch_registry = PrefetchRegistry()
+order_prefetch_registry = PrefetchRegistry()
@@ -1,13 +1,29 @@
+from typing import Dict, List, NamedTuple
+
 from oscar.core.loading import get_class
 
 from ..settings import RESOURCES_TO_DB_CHUNK_SIZE
-from ..utils import chunked
+from ..utils import chunked, iter_resources
 
 ModelMapperContext = get_class("oscar_odin.mappings.context", "ModelMapperContext")
+get_identifier_cache = get_class(
+    "oscar_odin.mappings.identifiers", "get_identifier_cache"
+)
 validate_resources = get_class("oscar_odin.utils", "validate_resources")
 
 
-def resources_to_db(
+class ChunkResult(NamedTuple):
+    """
+    The primary keys saved, the errors and the amount of objects created, updated
+    and unchanged per model label of one chunk of ``resources_to_db``.
+    """
+
+    saved_pks: List
+    errors: List
+    counts: Dict[str, Dict[str, int]]
+
+
+def resources_to_db_iterator(
     resources,
     fields_to_update,
     identifier_mapping,
@@ -19,26 +35,75 @@ def resources_to_db(
     skip_invalid_resources=False,
     error_identifiers=None,
     chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+    identifier_cache=None,
+    skip_unchanged=False,
+    upsert=False,
+    stream=False,
 ):
-    """Map mulitple resources to a model and store them in the database.
+    """Map multiple resources to a model and store them in the database, one chunk at
+    a time, yielding the saved primary keys and the errors of every chunk.
 
-    The method will first bulk update or create the foreign keys
-    After that all the resources will be bulk saved.
-    At last all related models can will be saved and set on the record.
+    The resources can be any iterable, eg; a generator parsing a feed. By default
+    all resources are validated before anything is saved, so unless
+    ``skip_invalid_resources`` is set nothing is saved when any of them is invalid.
+
+    With ``stream`` a chunk is pulled from the iterable, validated, mapped and saved,
+    and released before the next chunk is pulled, so only one chunk of resources is
+    in memory at a time. The resources are validated per chunk then; unless
+    ``skip_invalid_resources`` is set the first chunk with invalid resources stops
+    the pipeline, and the chunks before it are saved already (a partial save, the
+    saved primary keys of those chunks are yielded before the errors).
+
+    The primary keys of reference models (see ``IDENTIFIER_CACHE_MODELS``) are
+    cached by ``identifier_cache`` for the whole run, so they're not looked up again
+    by every chunk. By default every run gets its own cache.
+
+    With ``skip_unchanged`` the objects that exist are compared to the database
+    first, and only the fields that changed of the objects that changed are updated.
+
+    With ``upsert`` the objects of models whose identifiers are unique in the
+    database are inserted or updated with one query (``INSERT ... ON CONFLICT``),
+    instead of being looked up first. When the database doesn't support it, or the
+    objects can't be upserted (eg; they're not valid as new rows), they're saved the
+    regular way. Upserted objects aren't compared to the database, so ``upsert`` and
+    ``skip_unchanged`` can't be combined.
     """
+    if upsert and skip_unchanged:
+        raise ValueError("upsert and skip_unchanged can't be combined")
+
     error_identifiers = error_identifiers or identifier_mapping.get(model_mapper.to_obj)
-    valid_resources, resource_errors = validate_resources(resources, error_identifiers)
-    if not skip_invalid_resources and resource_errors:
-        return [], resource_errors
+    if identifier_cache is None:
+        identifier_cache = get_identifier_cache()
+    resources = iter_resources(resources)
 
-    saved_resources_pks = []
-    errors = []
+    if not stream:
+        resources, resource_errors = validate_resources(resources, error_identifiers)
+        if resource_errors:
+            yield ChunkResult([], resource_errors, {})
+            if not skip_invalid_resources:
+                return
+        chunks = ((chunk, []) for chunk in chunked(resources, chunk_size))
+    else:
+        chunks = (
+            validate_resources(chunk, error_identifiers)
+            for chunk in chunked(resources, chunk_size)
+        )
+
+    for chunk, chunk_errors in chunks:
+        if chunk_errors and not skip_invalid_resources:
+            yield ChunkResult([], chunk_errors, {})
+            return
+        if not chunk:
+            yield ChunkResult([], chunk_errors, {})
+            continue
 
-    for chunk in chunked(valid_resources, chunk_size):
         context = context_mapper(
             model_mapper.to_obj,
             delete_related=delete_related,
             error_identifiers=error_identifiers,
+            identifier_cache=identifier_cache,
+            skip_unchanged=skip_unchanged,
+            upsert=upsert,
         )
 
         if extra_context:
@@ -51,18 +116,80 @@ def resources_to_db(
         except TypeError:  # it is not a list
             instances = [result]
 
-        chunk_saved_resources, chunk_errors = context.bulk_save(
+        chunk_saved_resources, save_errors = context.bulk_save(
             instances,
             fields_to_update,
             identifier_mapping,
             clean_instances,
         )
 
-        # Don't store all the model instances in saved_resources, as this could lead to memory issues.
-        for instance in chunk_saved_resources:
-            saved_resources_pks.append(instance.pk)
+        # Don't yield the model instances, only their primary keys, so the chunk can
+        # be released.
+        yield ChunkResult(
+            [instance.pk for instance in chunk_saved_resources],
+            chunk_errors + save_errors,
+            {
+                label: {name: count for name, count in counts.items() if count}
+                for label, counts in context.counts.items()
+            },
+        )
+
+
+def resources_to_db(
+    resources,
+    fields_to_update,
+    identifier_mapping,
+    model_mapper,
+    context_mapper=ModelMapperContext,
+    extra_context=None,
+    delete_related=False,
+    clean_instances=True,
+    skip_invalid_resources=False,
+    error_identifiers=None,
+    chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+    identifier_cache=None,
+    skip_unchanged=False,
+    upsert=False,
+    stream=False,
+):
+    """Map mulitple resources to a model and store them in the database.
+
+    The method will first bulk update or create the foreign keys
+    After that all the resources will be bulk saved.
+    At last all related models can will be saved and set on the record.
+
+    The resources can be any iterable, they're saved one chunk at a time (see
+    ``resources_to_db_iterator`` to process the result of every chunk as it's saved,
+    and for the partial saves of ``stream``).
+
+    An empty list is returned instead of a queryset when nothing is saved because of
+    errors, eg; invalid resources without ``skip_invalid_resources``.
+    """
+    saved_resources_pks = []
+    errors = []
+
+    for chunk_result in resources_to_db_iterator(
+        resources,
+        fields_to_update,
+        identifier_mapping,
+        model_mapper,
+        context_mapper=context_mapper,
+        extra_context=extra_context,
+        delete_related=delete_related,
+        clean_instances=clean_instances,
+        skip_invalid_resources=skip_invalid_resources,
+        error_identifiers=error_identifiers,
+        chunk_size=chunk_size,
+        identifier_cache=identifier_cache,
+        skip_unchanged=skip_unchanged,
+        upsert=upsert,
+        stream=stream,
+    ):
+        saved_resources_pks.extend(chunk_result.saved_pks)
+        errors.extend(chunk_result.errors)
 
-        errors.extend(chunk_errors)
+    if errors and not saved_resources_pks:
+        return [], errors
 
     saved_resources = model_mapper.to_obj.objects.filter(pk__in=saved_resources_pks)
-    return saved_resources, resource_errors + errors
+    return saved_resources, errors
@@ -0,0 +1,119 @@
+"""Cache of the URLs of files in storages."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+from ..settings import STORAGE_URL_CACHE_SIZE, STORAGE_URL_CACHE_TIMEOUT
+
+__all__ = ("StorageURLCache", "storage_url_cache")
+
+
+class StorageURLCache:
+    """
+    Bounded cache of file URLs, keyed by storage and file name.
+
+    Resolving the URL of a file can be expensive on remote storages (eg; signing a
+    URL for S3), and the same files are mapped over and over again. URLs are kept for
+    ``timeout`` seconds, so signed URLs are refreshed before they expire, and the
+    least recently used URLs are dropped when there are more than ``maxsize``.
+
+    Storages that can resolve many URLs at once can implement a
+    ``url_many(names)`` method that returns a dictionary of name to URL, it's used
+    by ``resolve_many`` to resolve the files of a whole batch at once.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = STORAGE_URL_CACHE_SIZE,
+        timeout: float = STORAGE_URL_CACHE_TIMEOUT,
+    ):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[object, str], Tuple[str, float]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _set(self, key, url: str, now: float):
+        self._entries[key] = (url, now + self.timeout)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_url(self, field_file) -> str:
+        """
+        Return the URL of a FieldFile, like ``field_file.url`` does. A ValueError is
+        raised when there's no file.
+        """
+        name = field_file.name
+        if not name or self.maxsize <= 0:
+            return field_file.url
+
+        storage = field_file.storage
+        key = (storage, name)
+        now = time.monotonic()
+        with self._lock:
+            url = self._get(key, now)
+            if url is not None:
+                self.hits += 1
+                return url
+
+        url = storage.url(name)
+        with self._lock:
+            self.misses += 1
+            self._set(key, url, now)
+        return url
+
+    def resolve_many(self, field_files: Iterable):
+        """
+        Resolve the URLs of files that are not cached yet in one call per storage,
+        for storages that implement ``url_many``. Other storages are left alone,
+        their URLs are resolved (and cached) one by one by ``get_url``.
+        """
+        if self.maxsize <= 0:
+            return
+
+        now = time.monotonic()
+        missing: Dict[object, set] = {}
+        with self._lock:
+            for field_file in field_files:
+                name = field_file.name if field_file else None
+                storage = field_file.storage if name else None
+                if not hasattr(storage, "url_many"):
+                    continue
+                if self._get((storage, name), now) is None:
+                    missing.setdefault(storage, set()).add(name)
+
+        for storage, names in missing.items():
+            urls = storage.url_many(sorted(names))
+            with self._lock:
+                self.misses += len(urls)
+                for name, url in urls.items():
+                    self._set((storage, name), url, now)
+
+    def clear(self):
+        """Remove all URLs and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit and miss counters and the amount of cached URLs."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+storage_url_cache = StorageURLCache()
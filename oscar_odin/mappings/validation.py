@@ -0,0 +1,236 @@
+"""Validation of a batch of model instances."""
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import connections, router
+from django.db.models import Field, Model as DjangoModel
+
+from ..utils import in_bulk
+
+__all__ = ("BatchValidator", "get_batch_validator")
+
+
+class BatchValidator:
+    """
+    Validates model instances like ``full_clean`` does, for a batch of instances
+    at once.
+
+    ``full_clean`` checks the existence of the related object of every foreign key,
+    and the unique fields and unique_together's, of every instance with a query per
+    check. This checks them for the whole batch with one query per foreign key and
+    unique check. The fields to clean and the checks are compiled once per model and
+    excluded fields, see ``get_batch_validator``.
+
+    Models that override ``clean_fields`` or ``validate_unique`` are validated with
+    their own methods, one instance at a time.
+    """
+
+    def __init__(self, Model, exclude: FrozenSet[str] = frozenset()):
+        self.Model = Model
+        self.exclude = exclude
+        # pylint: disable=protected-access
+        self.fields = [
+            field for field in Model._meta.fields if field.name not in exclude
+        ]
+        self.custom_clean_fields = self.overrides(Model, "clean_fields")
+        # Foreign keys with limit_choices_to are checked by their own validate.
+        self.foreign_keys = [
+            field
+            for field in self.fields
+            if field.many_to_one
+            and not field.remote_field.parent_link
+            and not field.remote_field.limit_choices_to
+        ]
+        self.batch_unique = not self.overrides(Model, "validate_unique")
+        unique_checks, self.date_checks = Model()._get_unique_checks(
+            exclude=list(exclude)
+        )
+        self.unique_checks = [
+            (
+                model_class,
+                unique_check,
+                [Model._meta.get_field(name).attname for name in unique_check],
+            )
+            for model_class, unique_check in unique_checks
+        ]
+        self.validate_constraints = bool(Model._meta.constraints) and hasattr(
+            Model, "validate_constraints"
+        )
+
+    @staticmethod
+    def overrides(Model, name) -> bool:
+        """Return whether the model overrides a method of Django's Model."""
+        return getattr(Model, name) is not getattr(DjangoModel, name)
+
+    def clean_fields(self, instance) -> Dict[str, List]:
+        """
+        Clean the fields of an instance, like ``Model.clean_fields`` does, except
+        for the existence of the related objects of foreign keys.
+        """
+        errors = {}
+        for field in self.fields:
+            raw_value = getattr(instance, field.attname)
+            if field.blank and raw_value in field.empty_values:
+                continue
+            try:
+                if field in self.foreign_keys:
+                    value = field.to_python(raw_value)
+                    # Field.validate, without the query of ForeignKey.validate.
+                    Field.validate(field, value, instance)
+                    field.run_validators(value)
+                else:
+                    value = field.clean(raw_value, instance)
+                setattr(instance, field.attname, value)
+            except ValidationError as error:
+                errors[field.name] = error.error_list
+        return errors
+
+    def validate_foreign_keys(self, instances, errors):
+        """
+        Check that the related objects of the foreign keys of all instances exist,
+        with one query per foreign key.
+        """
+        for field in self.foreign_keys:
+            RelatedModel = field.remote_field.model
+            field_name = field.remote_field.field_name
+            values = {
+                getattr(instance, field.attname)
+                for instance, instance_errors in zip(instances, errors)
+                if field.name not in instance_errors
+            }
+            values.discard(None)
+            if not values:
+                continue
+
+            # pylint: disable=protected-access
+            existing = set(
+                RelatedModel._base_manager.using(router.db_for_read(RelatedModel))
+                .filter(**{f"{field_name}__in": values})
+                .values_list(field_name, flat=True)
+            )
+            for instance, instance_errors in zip(instances, errors):
+                value = getattr(instance, field.attname)
+                if value is None or value in existing or field.name in instance_errors:
+                    continue
+                instance_errors[field.name] = ValidationError(
+                    field.error_messages["invalid"],
+                    code="invalid",
+                    params={
+                        "model": RelatedModel._meta.verbose_name,
+                        "pk": value,
+                        "field": field_name,
+                        "value": value,
+                    },
+                ).error_list
+
+    def clean(self, instances) -> List[Dict[str, List]]:
+        """Clean the fields of the instances and the instances themselves."""
+        if self.custom_clean_fields:
+            errors = []
+            for instance in instances:
+                try:
+                    instance.clean_fields(exclude=list(self.exclude))
+                    errors.append({})
+                except ValidationError as error:
+                    errors.append(error.update_error_dict({}))
+        else:
+            errors = [self.clean_fields(instance) for instance in instances]
+            self.validate_foreign_keys(instances, errors)
+
+        for instance, instance_errors in zip(instances, errors):
+            try:
+                instance.clean()
+            except ValidationError as error:
+                error.update_error_dict(instance_errors)
+        return errors
+
+    def validate_unique(self, instances, errors):
+        """
+        Check the unique fields and unique_together's of all instances with one
+        query per check, adding the errors to the errors of the instances.
+        """
+        for model_class, unique_check, attnames in self.unique_checks:
+            # pylint: disable=protected-access
+            pk_check = len(unique_check) == 1 and model_class._meta.pk.attname in (
+                attnames
+            )
+            db = model_class._default_manager.db
+            empty_is_null = connections[db].features.interprets_empty_strings_as_nulls
+
+            to_check = []
+            for instance, instance_errors in zip(instances, errors):
+                if any(name in instance_errors for name in unique_check):
+                    continue
+                if pk_check and not instance._state.adding:
+                    continue
+                values = [getattr(instance, attname) for attname in attnames]
+                if any(
+                    value is None or (value == "" and empty_is_null) for value in values
+                ):
+                    continue
+                to_check.append((instance, instance_errors, tuple(values)))
+
+            if not to_check:
+                continue
+
+            existing = in_bulk(
+                model_class._default_manager,
+                [instance for instance, _, _ in to_check],
+                attnames,
+            )
+            for instance, instance_errors, key in to_check:
+                pk = existing.get(key)
+                if pk is None:
+                    continue
+                if not instance._state.adding and pk == instance.pk:
+                    continue
+                name = unique_check[0] if len(unique_check) == 1 else NON_FIELD_ERRORS
+                instance_errors.setdefault(name, []).append(
+                    instance.unique_error_message(model_class, unique_check)
+                )
+
+    def validate(
+        self, instances, validate_unique: bool = True
+    ) -> List[Optional[ValidationError]]:
+        """Return the ValidationError of every instance, or None if it's valid."""
+        errors = self.clean(instances)
+
+        if validate_unique:
+            if self.batch_unique:
+                self.validate_unique(instances, errors)
+            for instance, instance_errors in zip(instances, errors):
+                exclude = [*self.exclude, *instance_errors]
+                try:
+                    if not self.batch_unique:
+                        instance.validate_unique(exclude=exclude)
+                    elif self.date_checks:
+                        # pylint: disable=protected-access
+                        date_errors = instance._perform_date_checks(
+                            [
+                                check
+                                for check in self.date_checks
+                                if check[2] not in exclude
+                            ]
+                        )
+                        if date_errors:
+                            raise ValidationError(date_errors)
+                except ValidationError as error:
+                    error.update_error_dict(instance_errors)
+
+        if self.validate_constraints:
+            for instance, instance_errors in zip(instances, errors):
+                try:
+                    instance.validate_constraints(
+                        exclude=[*self.exclude, *instance_errors]
+                    )
+                except ValidationError as error:
+                    error.update_error_dict(instance_errors)
+
+        return [ValidationError(error) if error else None for error in errors]
+
+
+@lru_cache(maxsize=None)
+def get_batch_validator(Model, exclude: FrozenSet[str] = frozenset()) -> BatchValidator:
+    """Return the validator of a model, compiled once per model and excluded fields."""
+    return BatchValidator(Model, exclude)
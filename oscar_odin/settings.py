@@ -1,3 +1,53 @@
 from django.conf import settings
 
 RESOURCES_TO_DB_CHUNK_SIZE = getattr(settings, "RESOURCES_TO_DB_CHUNK_SIZE", 500)
+PRODUCTS_TO_RESOURCES_CHUNK_SIZE = getattr(
+    settings, "PRODUCTS_TO_RESOURCES_CHUNK_SIZE", 500
+)
+
+# Maximum amount of product resources kept in memory by the product resource cache.
+PRODUCT_RESOURCE_CACHE_SIZE = getattr(settings, "PRODUCT_RESOURCE_CACHE_SIZE", 1000)
+# Alias of a Django cache that is used as the second tier of the product resource cache.
+PRODUCT_RESOURCE_CACHE_BACKEND = getattr(
+    settings, "PRODUCT_RESOURCE_CACHE_BACKEND", None
+)
+PRODUCT_RESOURCE_CACHE_TIMEOUT = getattr(
+    settings, "PRODUCT_RESOURCE_CACHE_TIMEOUT", 3600
+)
+
+# Maximum amount of queries per object a mapping rule may do in a recorded mapping run.
+QUERY_BUDGET_PER_OBJECT = getattr(settings, "QUERY_BUDGET_PER_OBJECT", None)
+# What to do when the query budget is exceeded; "log", "raise" or "ignore".
+QUERY_BUDGET_ACTION = getattr(settings, "QUERY_BUDGET_ACTION", "log")
+# Fraction of the mapping runs that is recorded, 0 disables the sampling.
+QUERY_BUDGET_SAMPLE_RATE = getattr(settings, "QUERY_BUDGET_SAMPLE_RATE", 0)
+# Dotted path to a callable that receives the query stats of every recorded run.
+QUERY_BUDGET_METRICS_CALLBACK = getattr(settings, "QUERY_BUDGET_METRICS_CALLBACK", None)
+
+# Maximum amount of threads the async entry points map resources in, 0 maps them in
+# Django's thread sensitive sync thread (the connection and transaction of the caller).
+ASYNC_MAPPING_WORKERS = getattr(settings, "ASYNC_MAPPING_WORKERS", 4)
+
+# Maximum amount of file URLs kept by the storage URL cache, 0 disables the cache.
+STORAGE_URL_CACHE_SIZE = getattr(settings, "STORAGE_URL_CACHE_SIZE", 10000)
+# Seconds a cached URL is used, keep this below the expiry of signed URLs.
+STORAGE_URL_CACHE_TIMEOUT = getattr(settings, "STORAGE_URL_CACHE_TIMEOUT", 300)
+
+# Touch the date_updated of products when their images, attribute values or categories
+# change, so the incremental export finds them. This costs an update of the product for
+# every save or delete of those objects.
+TRACK_PRODUCT_CHANGES = getattr(settings, "TRACK_PRODUCT_CHANGES", False)
+
+# Models of which resources_to_db caches the primary keys by their identifiers, so
+# they're looked up once per run instead of once per chunk.
+IDENTIFIER_CACHE_MODELS = getattr(
+    settings,
+    "IDENTIFIER_CACHE_MODELS",
+    ("partner.Partner", "catalogue.ProductClass", "catalogue.Category"),
+)
+# Share the cached primary keys between the runs of a process.
+IDENTIFIER_CACHE_PROCESS_SCOPED = getattr(
+    settings, "IDENTIFIER_CACHE_PROCESS_SCOPED", False
+)
+# Seconds a primary key is used from the cache shared between runs.
+IDENTIFIER_CACHE_TIMEOUT = getattr(settings, "IDENTIFIER_CACHE_TIMEOUT", 300)
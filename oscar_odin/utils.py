@@ -1,18 +1,23 @@
 from collections import defaultdict
+from collections.abc import Iterable
 from functools import reduce
+from itertools import islice
 from operator import attrgetter, itemgetter, or_
 import contextlib
 import time
 import math
 
 from django.db import connection, connections, reset_queries
-from django.db.models import Q
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import BooleanField, Model, Q
+from django.db.models.expressions import RawSQL
 from django.conf import settings
 
+from odin import Resource
+from odin.codecs import json_codec
 from odin.exceptions import ValidationError
-from odin.mapping import MappingResult
 
-from .settings import RESOURCES_TO_DB_CHUNK_SIZE
+from .settings import RESOURCES_TO_DB_CHUNK_SIZE, PRODUCTS_TO_RESOURCES_CHUNK_SIZE
 
 
 def get_filters(instances, field_names):
@@ -35,34 +40,94 @@ def get_query(instances, field_names):
     return query
 
 
-def in_bulk(self, instances, field_names):
+# Backends that support row values, eg; (partner_id, partner_sku) IN ((1, 'a'), ...)
+ROW_VALUE_VENDORS = ("postgresql", "mysql", "sqlite", "oracle")
+
+
+def get_key_lookup(model, keys, field_names, db_connection):
+    """
+    Return a set-based filter on the rows of which the values of ``field_names`` are
+    one of ``keys``, or None when it can't be expressed as one.
+
+    Single column identifiers are filtered with ``__in``. Composite identifiers of
+    local columns are filtered with a row value ``IN`` on backends that support it.
     """
-    Return a dictionary mapping each of the given IDs to the object with
-    that ID. If `id_list` isn't provided, evaluate the entire QuerySet.
+    if len(field_names) == 1:
+        query_field_name = field_names[0].replace(".", "__")
+        return Q(**{f"{query_field_name}__in": [key[0] for key in keys]})
+
+    if db_connection.vendor not in ROW_VALUE_VENDORS:
+        return None
+    try:
+        # pylint: disable=protected-access
+        fields = [model._meta.get_field(name) for name in field_names]
+    except FieldDoesNotExist:  # eg; a field of a related model
+        return None
+    if not all(field.concrete and field.column for field in fields):
+        return None
+
+    quote_name = db_connection.ops.quote_name
+    # pylint: disable=protected-access
+    table = quote_name(model._meta.db_table)
+    columns = ", ".join(f"{table}.{quote_name(field.column)}" for field in fields)
+    row = "(%s)" % ", ".join(["%s"] * len(fields))
+    sql = "(%s) IN (%s)" % (columns, ", ".join([row] * len(keys)))
+    params = [
+        field.get_db_prep_value(value, db_connection)
+        for key in keys
+        for field, value in zip(fields, key)
+    ]
+    return Q(RawSQL(sql, params, output_field=BooleanField()))
+
+
+def in_bulk(self, instances, field_names):
     """
+    Return a dictionary mapping the values of ``field_names`` of the instances to
+    the primary key of the object with those values.
 
-    max_query_params = connections[self.db].features.max_query_params
+    Every batch of instances is looked up with one set-based query (see
+    ``get_key_lookup``), or with a ``Q`` per instance OR-ed together when that's not
+    possible. Keys containing None are always looked up with the latter, to match
+    the objects of which the field IS NULL.
+    """
+    db_connection = connections[self.db]
+    max_query_params = db_connection.features.max_query_params
     query_field_names = [name.replace(".", "__") for name in field_names]
 
     if max_query_params is not None:
         batch_size = math.floor(max_query_params / len(field_names)) - 1
     else:
         batch_size = getattr(settings, "ODIN_BATCH_SIZE", 500)
-
-    if batch_size and batch_size < len(instances):
-        qs = ()
-        for offset in range(0, len(instances), batch_size):
-            batch = instances[offset : offset + batch_size]
-            query = get_query(batch, field_names)
-            qs += tuple(self.filter(query).order_by().values("pk", *query_field_names))
-    else:
-        query = get_query(instances, field_names)
-        qs = self.filter(query).order_by().values("pk", *query_field_names)
+    batch_size = batch_size or max(len(instances), 1)
+
+    get_key_values = attrgetter(*field_names)
+    instances_by_key = {}
+    null_key_instances = []
+    for instance in instances:
+        key = get_key_values(instance)
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = tuple(value.pk if isinstance(value, Model) else value for value in key)
+        if None in key:
+            null_key_instances.append(instance)
+        else:
+            instances_by_key.setdefault(key, instance)
+
+    conditions = []
+    keys = list(instances_by_key)
+    for batch in chunked(keys, batch_size):
+        condition = get_key_lookup(self.model, batch, field_names, db_connection)
+        if condition is None:
+            condition = get_query([instances_by_key[key] for key in batch], field_names)
+        conditions.append(condition)
+    for batch in chunked(null_key_instances, batch_size):
+        conditions.append(get_query(batch, field_names))
 
     object_mapping = defaultdict(tuple)
-    for obj in qs:
-        pk = obj.pop("pk")
-        object_mapping[tuple(obj.values())] = pk
+    for condition in conditions:
+        for obj in self.filter(condition).order_by().values("pk", *query_field_names):
+            pk = obj.pop("pk")
+            object_mapping[tuple(obj.values())] = pk
 
     return object_mapping
 
@@ -93,17 +158,23 @@ class ErrorLog(list):
         self.append(error)
 
 
+def iter_resources(resources):
+    """
+    Return the resources as an iterable, a single resource is wrapped in a list.
+    Iterables (eg; a mapping result or a generator) are returned as is, so they're
+    not consumed here.
+    """
+    if not resources:
+        return []
+    if isinstance(resources, Resource) or not isinstance(resources, Iterable):
+        return [resources]
+    return resources
+
+
 def validate_resources(resources, error_identifiers=None):
     errors = ErrorLog(identifiers=error_identifiers)
     valid_resources = []
-    if not resources:
-        return [], []
-    if not isinstance(resources, (list, tuple)):
-        if isinstance(resources, MappingResult):
-            resources = resources.items
-        else:
-            resources = [resources]
-    for resource in resources:
+    for resource in iter_resources(resources):
         try:
             resource.full_clean()
             valid_resources.append(resource)
@@ -116,11 +187,24 @@ def chunked(iterable, size=RESOURCES_TO_DB_CHUNK_SIZE, startindex=0):
     """
     Divide an interable into chunks of ``size``
 
+    Sequences are sliced, other iterables (eg; generators) are consumed one chunk
+    at a time into lists, so the iterable is never in memory as a whole.
+
     >>> list(chunked("hahahaha", 2))
     ['ha', 'ha', 'ha', 'ha']
     >>> list(chunked([1,2,3,4,5,6,7], 3))
     [[1, 2, 3], [4, 5, 6], [7]]
+    >>> list(chunked(iter(range(5)), 2))
+    [[0, 1], [2, 3], [4]]
     """
+    if not hasattr(iterable, "__getitem__"):
+        iterator = islice(iterable, startindex, None)
+        chunk = list(islice(iterator, size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(iterator, size))
+        return
+
     while True:
         chunk = iterable[startindex : startindex + size]
         chunklen = len(chunk)
@@ -131,6 +215,49 @@ def chunked(iterable, size=RESOURCES_TO_DB_CHUNK_SIZE, startindex=0):
         startindex += size
 
 
+def chunked_queryset(queryset, size=PRODUCTS_TO_RESOURCES_CHUNK_SIZE):
+    """
+    Divide a queryset into lists of at most ``size`` objects.
+
+    The queryset is paginated on its primary key (keyset pagination) instead of
+    using offsets, so every chunk costs the same no matter how deep into the
+    queryset it is. Any select_related / prefetch_related on the queryset is
+    applied to each chunk separately, and a chunk is released as soon as the
+    next one is fetched. Note that the ordering of the queryset is replaced by
+    the primary key ordering.
+    """
+    queryset = queryset.order_by("pk")
+    chunk = list(queryset[:size])
+    while chunk:
+        yield chunk
+        if len(chunk) < size:
+            break
+        last_pk = chunk[-1].pk
+        # Drop the reference to the current chunk before fetching the next one.
+        del chunk
+        chunk = list(queryset.filter(pk__gt=last_pk)[:size])
+
+
+async def achunked_queryset(queryset, size=PRODUCTS_TO_RESOURCES_CHUNK_SIZE):
+    """
+    Async variant of ``chunked_queryset``, the chunks are fetched with the async ORM.
+    """
+    queryset = queryset.order_by("pk")
+    chunk = [obj async for obj in queryset[:size]]
+    while chunk:
+        yield chunk
+        if len(chunk) < size:
+            break
+        last_pk = chunk[-1].pk
+        del chunk
+        chunk = [obj async for obj in queryset.filter(pk__gt=last_pk)[:size]]
+
+
+def primitive_to_json(primitive) -> bytes:
+    """Encode dictionaries created by a primitive mapping into JSON bytes."""
+    return json_codec.dumps(primitive, include_type_field=False).encode()
+
+
 def get_mapped_fields(mapping, *from_field_names):
     keyed_mapping = defaultdict(set)
     exclude_fields = getattr(mapping, "exclude_fields", set())
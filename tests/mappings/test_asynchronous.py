@@ -0,0 +1,90 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from odin.codecs import dict_codec
+
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings import asynchronous, order
+from oscar_odin.mappings.asynchronous import (
+    aorder_queryset_to_resources,
+    aorder_to_resource,
+    aproduct_queryset_to_resources,
+    aproduct_queryset_to_resources_iterator,
+)
+from oscar_odin.mappings.helpers import product_queryset_to_resources
+
+Order = get_model("order", "Order")
+Product = get_model("catalogue", "Product")
+
+
+@sync_to_async
+def sync_map(func, source):
+    resources = func(source)
+    return resources if not hasattr(resources, "__iter__") else list(resources)
+
+
+class TestAsyncProduct(TestCase):
+    fixtures = ["oscar_odin/catalogue"]
+
+    async def test_aproduct_queryset_to_resources(self):
+        queryset = Product.objects.filter(pk__lte=30)
+
+        actual = await aproduct_queryset_to_resources(queryset, chunk_size=7)
+
+        expected = await sync_map(
+            product_queryset_to_resources, queryset.order_by("pk")
+        )
+        self.assertEqual(
+            dict_codec.dump(expected, include_type_field=False),
+            dict_codec.dump(actual, include_type_field=False),
+        )
+
+    async def test_aproduct_queryset_to_resources_iterator(self):
+        queryset = Product.objects.filter(pk__lte=30)
+
+        actual = [
+            resource.upc
+            async for resource in aproduct_queryset_to_resources_iterator(
+                queryset, chunk_size=7
+            )
+        ]
+
+        self.assertEqual(
+            [product.upc async for product in queryset.order_by("pk")], actual
+        )
+
+
+class TestAsyncOrder(TestCase):
+    fixtures = [
+        "oscar_odin/auth",
+        "oscar_odin/catalogue",
+        "oscar_odin/partner",
+        "oscar_odin/offer",
+        "oscar_odin/address",
+        "oscar_odin/order",
+    ]
+
+    # The order isn't prefetched, and executor threads can't see the test transaction.
+    @mock.patch.object(asynchronous, "ASYNC_MAPPING_WORKERS", 0)
+    async def test_aorder_to_resource(self):
+        order_model = await Order.objects.afirst()
+
+        actual = await aorder_to_resource(order_model)
+
+        expected = await sync_map(order.order_to_resource, order_model)
+        self.assertEqual(order_model.number, actual.number)
+        self.assertEqual(
+            dict_codec.dump(expected, include_type_field=False),
+            dict_codec.dump(actual, include_type_field=False),
+        )
+
+    async def test_aorder_queryset_to_resources(self):
+        actual = await aorder_queryset_to_resources(Order.objects.all())
+
+        self.assertEqual(
+            [order_model.number async for order_model in Order.objects.order_by("pk")],
+            [resource.number for resource in actual],
+        )
@@ -0,0 +1,217 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+from oscar.apps.partner.strategy import Default as DefaultStrategy
+
+from oscar_odin.mappings.cache import ProductResourceCache, product_resource_cache
+from oscar_odin.mappings.constants import PRODUCT_TITLE, STOCKRECORD_PRICE
+from oscar_odin.mappings.helpers import (
+    cached_product_to_resource,
+    product_queryset_to_resources,
+    products_to_db,
+)
+from oscar_odin.mappings.partner import PartnerModelToResource
+from oscar_odin.resources.catalogue import ProductClassResource, ProductResource
+from oscar_odin.resources.partner import StockRecordResource
+
+Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+StockRecord = get_model("partner", "StockRecord")
+
+
+class TestProductResourceCache(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        product_resource_cache.clear()
+
+    def test_map__resources_are_cached(self):
+        resource_cache = ProductResourceCache(maxsize=100, cache_alias=None)
+        products = list(Product.objects.filter(pk__in=[1, 2, 3]))
+
+        first = resource_cache.map(products, DefaultStrategy())
+        with self.assertNumQueries(0):
+            second = resource_cache.map(products, DefaultStrategy())
+
+        self.assertEqual([product.upc for product in products], [r.upc for r in first])
+        self.assertEqual([id(r) for r in first], [id(r) for r in second])
+        self.assertEqual({"hits": 3, "misses": 3, "size": 3}, resource_cache.stats())
+
+    def test_map__single_product(self):
+        resource_cache = ProductResourceCache(maxsize=100, cache_alias=None)
+        product = Product.objects.get(pk=1)
+
+        resource = resource_cache.map(product, DefaultStrategy())
+
+        self.assertEqual(product.upc, resource.upc)
+
+    def test_map__changed_product_is_mapped_again(self):
+        resource_cache = ProductResourceCache(maxsize=100, cache_alias=None)
+        product = Product.objects.get(pk=1)
+        resource_cache.map(product, DefaultStrategy())
+
+        product.title = "Changed"
+        product.save()
+        resource = resource_cache.map(product, DefaultStrategy())
+
+        self.assertEqual("Changed", resource.title)
+        self.assertEqual(2, resource_cache.misses)
+
+    def test_map__least_recently_used_entries_are_evicted(self):
+        resource_cache = ProductResourceCache(maxsize=2, cache_alias=None)
+        first, second, third = Product.objects.filter(pk__in=[1, 2, 3])
+
+        resource_cache.map([first, second], DefaultStrategy())
+        resource_cache.map(first, DefaultStrategy())
+        resource_cache.map(third, DefaultStrategy())
+        resource_cache.map([first, second], DefaultStrategy())
+
+        self.assertEqual({"hits": 2, "misses": 4, "size": 2}, resource_cache.stats())
+
+    def test_map__django_cache_tier(self):
+        product = Product.objects.get(pk=1)
+        expected = ProductResourceCache(maxsize=0, cache_alias=None).map(
+            product, DefaultStrategy()
+        )
+
+        ProductResourceCache(maxsize=0, cache_alias="default").map(
+            product, DefaultStrategy()
+        )
+        resource_cache = ProductResourceCache(maxsize=0, cache_alias="default")
+        with self.assertNumQueries(0):
+            resource = resource_cache.map(product, DefaultStrategy())
+
+        self.assertEqual(1, resource_cache.hits)
+        self.assertEqual(expected.upc, resource.upc)
+        self.assertEqual(expected.price, resource.price)
+        self.assertEqual(
+            [image.original for image in expected.images],
+            [image.original for image in resource.images],
+        )
+
+    def test_invalidate__django_cache_tier(self):
+        product = Product.objects.get(pk=1)
+        resource_cache = ProductResourceCache(maxsize=0, cache_alias="default")
+        resource_cache.map(product, DefaultStrategy())
+
+        resource_cache.invalidate([product.pk])
+        resource_cache.map(product, DefaultStrategy())
+
+        self.assertEqual(2, resource_cache.misses)
+
+    def test_cached_product_to_resource__related_changes_invalidate(self):
+        product = Product.objects.get(pk=126)
+        resource = cached_product_to_resource(product)
+        self.assertEqual(resource, cached_product_to_resource(product))
+
+        product.images.first().delete()
+        resource = cached_product_to_resource(product)
+
+        self.assertEqual(product.images.count(), len(resource.images))
+        self.assertEqual(
+            {"hits": 1, "misses": 2, "size": 1}, product_resource_cache.stats()
+        )
+
+    def test_cached_product_to_resource__child_changes_invalidate_parent(self):
+        parent = Product.objects.get(pk=8)
+        cached_product_to_resource(parent, include_children=True)
+
+        attribute_value = ProductAttributeValue.objects.get(product_id=9)
+        attribute_value.value = "Medium"
+        attribute_value.save()
+        resource = cached_product_to_resource(parent, include_children=True)
+
+        self.assertEqual(2, product_resource_cache.misses)
+        self.assertEqual(
+            {"size": "Medium"},
+            next(child for child in resource.children if child.id == 9).attributes,
+        )
+
+    def test_cached_product_to_resource__category_changes_invalidate(self):
+        product = Product.objects.get(pk=126)
+        category = Category.objects.exclude(product=product).first()
+        cached_product_to_resource(product)
+
+        product.categories.add(category)
+        resource = cached_product_to_resource(product)
+
+        self.assertEqual(2, product_resource_cache.misses)
+        self.assertIn(category.pk, [category.id for category in resource.categories])
+
+        category.product_set.remove(product)
+        cached_product_to_resource(product)
+        self.assertEqual(3, product_resource_cache.misses)
+
+        category.product_set.add(product)
+        cached_product_to_resource(product)
+        category.product_set.clear()
+        cached_product_to_resource(product)
+        self.assertEqual(5, product_resource_cache.misses)
+
+    def test_map__local_entries_expire(self):
+        resource_cache = ProductResourceCache(maxsize=100, cache_alias=None, timeout=60)
+        product = Product.objects.get(pk=1)
+
+        with mock.patch("oscar_odin.mappings.cache.time.monotonic", return_value=0):
+            resource_cache.map(product, DefaultStrategy())
+        with mock.patch("oscar_odin.mappings.cache.time.monotonic", return_value=59):
+            resource_cache.map(product, DefaultStrategy())
+        with mock.patch("oscar_odin.mappings.cache.time.monotonic", return_value=61):
+            resource_cache.map(product, DefaultStrategy())
+
+        self.assertEqual({"hits": 1, "misses": 2, "size": 1}, resource_cache.stats())
+
+    def test_map__missing_products_are_prefetched(self):
+        with CaptureQueriesContext(connection) as mapped:
+            ProductResourceCache(maxsize=100, cache_alias=None).map(
+                Product.objects.all(), DefaultStrategy()
+            )
+        with CaptureQueriesContext(connection) as prefetched:
+            list(product_queryset_to_resources(Product.objects.all()))
+
+        # The products are fetched once more, with the prefetches.
+        self.assertEqual(
+            len(prefetched.captured_queries) + 1, len(mapped.captured_queries)
+        )
+
+    def test_cached_product_to_resource__products_to_db_invalidates(self):
+        stockrecord = (
+            StockRecord.objects.filter(product__structure=Product.STANDALONE)
+            .select_related("product__product_class")
+            .first()
+        )
+        product = stockrecord.product
+        resource = cached_product_to_resource(product)
+
+        _, errors = products_to_db(
+            [
+                ProductResource(
+                    upc=product.upc,
+                    title="Imported",
+                    structure=product.structure,
+                    product_class=ProductClassResource(slug=product.product_class.slug),
+                    stockrecords=[
+                        StockRecordResource(
+                            partner=PartnerModelToResource.apply(stockrecord.partner),
+                            partner_sku=stockrecord.partner_sku,
+                            price=resource.price + 1,
+                        )
+                    ],
+                )
+            ],
+            fields_to_update=[PRODUCT_TITLE, STOCKRECORD_PRICE],
+        )
+        self.assertEqual([], errors)
+
+        imported = cached_product_to_resource(product)
+
+        self.assertEqual("Imported", imported.title)
+        self.assertEqual(resource.price + 1, imported.price)
@@ -1,18 +1,51 @@
+from unittest import mock
+
+import odin
 from odin.codecs import dict_codec
 
 from django.test import TestCase
 
 from oscar.core.loading import get_model
+from oscar.apps.partner.strategy import Default as DefaultStrategy
 
 from oscar_odin.mappings import catalogue
 from oscar_odin.mappings.helpers import (
+    product_queryset_to_primitive,
     product_queryset_to_resources,
+    product_queryset_to_resources_iterator,
+    product_to_primitive,
     product_to_resource,
+    product_to_resource_with_strategy,
 )
 
-from oscar_odin.utils import get_mapped_fields
+from oscar_odin.resources.catalogue import ProductResource
+from oscar_odin.utils import get_mapped_fields, primitive_to_json
+
+from . import without_unserializable_values
 
 Product = get_model("catalogue", "Product")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+
+
+class UpperTitleProductToResource(catalogue.ProductToResource):
+    from_obj = Product
+    to_obj = ProductResource
+
+    @odin.assign_field
+    def title(self) -> str:
+        return self.source.title.upper()
+
+
+class UppercaseOptionsToResource(catalogue.ProductToResource):
+    from_obj = Product
+    to_obj = ProductResource
+
+    @classmethod
+    def get_attribute_value_converter(cls, attribute):
+        converter = super().get_attribute_value_converter(attribute)
+        if attribute.code == "size":
+            return lambda item: converter(item).upper()
+        return converter
 
 
 class TestProduct(TestCase):
@@ -65,7 +98,7 @@ class TestProduct(TestCase):
         # For future reference; It's fine if this test fails after some changes.
         # However, the query shouldn't increase too much, if it does, it means you got a
         # n+1 query problem and that should be fixed instead by prefetching, annotating etc.
-        with self.assertNumQueries(14):
+        with self.assertNumQueries(13):
             resources = product_queryset_to_resources(queryset, include_children=False)
             dict_codec.dump(resources, include_type_field=False)
 
@@ -74,10 +107,308 @@ class TestProduct(TestCase):
         self.assertEqual(queryset.count(), 210)
 
         # It should only go up by a few queries.
-        with self.assertNumQueries(20):
+        with self.assertNumQueries(19):
             resources = product_queryset_to_resources(queryset, include_children=True)
             dict_codec.dump(resources, include_type_field=False)
 
+    def test_queryset_to_resources_include_children__mapped_in_one_batch(self):
+        queryset = Product.objects.filter(pk__in=[1, 5, 8])
+
+        with mock.patch.object(
+            catalogue, "get_stock_prices", wraps=catalogue.get_stock_prices
+        ) as get_stock_prices:
+            resources = list(
+                product_queryset_to_resources(queryset, include_children=True)
+            )
+
+        # Once for the parents and once for all their children.
+        self.assertEqual(2, get_stock_prices.call_count)
+        for resource in resources:
+            expected = product_to_resource(
+                Product.objects.get(pk=resource.id), include_children=True
+            )
+            self.assertEqual(
+                dict_codec.dump(expected.children, include_type_field=False),
+                dict_codec.dump(resource.children, include_type_field=False),
+            )
+
+    def test_include_children__custom_product_mapper(self):
+        parent = Product.objects.get(pk=8)
+
+        for resources in (
+            product_queryset_to_resources(
+                Product.objects.filter(pk=parent.pk),
+                include_children=True,
+                product_mapper=UpperTitleProductToResource,
+            ),
+            product_to_resource_with_strategy(
+                [parent],
+                DefaultStrategy(),
+                include_children=True,
+                product_mapper=UpperTitleProductToResource,
+            ),
+        ):
+            (resource,) = resources
+            self.assertTrue(resource.children)
+            for child in resource.children:
+                self.assertEqual(child.title.upper(), child.title)
+
+    def test_queryset_to_resources_iterator(self):
+        queryset = Product.objects.all()
+
+        resources = list(
+            product_queryset_to_resources_iterator(queryset, chunk_size=50)
+        )
+
+        self.assertEqual(
+            list(queryset.order_by("pk").values_list("pk", flat=True)),
+            [resource.id for resource in resources],
+        )
+        self.assertEqual(
+            dict_codec.dump(
+                product_queryset_to_resources(queryset.order_by("pk")),
+                include_type_field=False,
+            ),
+            dict_codec.dump(resources, include_type_field=False),
+        )
+
+    def test_queryset_to_resources_iterator_num_queries(self):
+        queryset = Product.objects.all()
+
+        # Every chunk is fetched and prefetched on its own, so the queries depend
+        # on the chunk size rather than on the amount of products.
+        iterator = product_queryset_to_resources_iterator(queryset, chunk_size=50)
+        with self.assertNumQueries(13):
+            first_chunk = [next(iterator) for _ in range(50)]
+        with self.assertNumQueries(7):
+            second_chunk = [next(iterator) for _ in range(50)]
+
+        self.assertEqual(50, len(first_chunk))
+        self.assertEqual(50, len(second_chunk))
+        self.assertEqual(110, len(list(iterator)))
+
+    def test_product_to_resource_with_strategy__prices_are_resolved_in_batch(self):
+        class BatchStrategy(DefaultStrategy):
+            batches = []
+
+            def fetch_for_products(self, products):
+                self.batches.append(products)
+                return {
+                    product.pk: (
+                        self.fetch_for_parent(product)
+                        if product.is_parent
+                        else self.fetch_for_product(product)
+                    )
+                    for product in products
+                }
+
+        queryset = Product.objects.all()
+        stock_strategy = BatchStrategy()
+
+        resources = list(product_to_resource_with_strategy(queryset, stock_strategy))
+
+        self.assertEqual(1, len(BatchStrategy.batches))
+        self.assertEqual(queryset.count(), len(BatchStrategy.batches[0]))
+        self.assertEqual(
+            dict_codec.dump(product_to_resource(queryset), include_type_field=False),
+            dict_codec.dump(resources, include_type_field=False),
+        )
+
+    def test_get_stock_prices__default_strategy_is_resolved_in_batch(self):
+        products = list(Product.objects.all())
+        stock_strategy = DefaultStrategy()
+        expected = {
+            product.pk: catalogue.purchase_info_to_stock_price(
+                catalogue.fetch_purchase_info(product, stock_strategy)
+            )
+            for product in Product.objects.all()
+        }
+
+        with mock.patch.object(
+            catalogue,
+            "fetch_first_stockrecord_purchase_infos",
+            wraps=catalogue.fetch_first_stockrecord_purchase_infos,
+        ) as fetch_purchase_infos:
+            # The stock records of the products, and the public children of the
+            # parents with their stock records.
+            with self.assertNumQueries(3):
+                stock_prices = catalogue.get_stock_prices(products, stock_strategy)
+
+        self.assertEqual(1, fetch_purchase_infos.call_count)
+        self.assertEqual(expected, stock_prices)
+
+    def test_product_to_primitive(self):
+        product = Product.objects.get(id=1)
+
+        expected = dict_codec.dump(
+            product_to_resource(product), include_type_field=False
+        )
+        actual = product_to_primitive(product)
+
+        self.assertIsInstance(actual, dict)
+        self.assertEqual(*without_unserializable_values(expected, actual))
+
+    def test_product_to_primitive__include_children(self):
+        product = Product.objects.get(id=8)
+
+        expected = dict_codec.dump(
+            product_to_resource(product, include_children=True),
+            include_type_field=False,
+        )
+        actual = product_to_primitive(product, include_children=True)
+
+        self.assertEqual(*without_unserializable_values(expected, actual))
+
+    def test_queryset_to_primitive(self):
+        queryset = Product.objects.all()
+
+        expected = dict_codec.dump(
+            product_queryset_to_resources(queryset), include_type_field=False
+        )
+        actual = product_queryset_to_primitive(queryset)
+
+        self.assertEqual(queryset.count(), len(actual))
+        self.assertEqual(*without_unserializable_values(expected, actual))
+
+    def test_queryset_to_primitive__as_json(self):
+        queryset = Product.objects.all()
+
+        actual = product_queryset_to_primitive(queryset, as_json=True)
+
+        self.assertIsInstance(actual, bytes)
+        self.assertEqual(
+            primitive_to_json(product_queryset_to_primitive(queryset)), actual
+        )
+
+    def test_prefetch_attribute_options(self):
+        attribute_values = list(
+            ProductAttributeValue.objects.select_related("attribute").order_by("pk")
+        )
+
+        with self.assertNumQueries(1):
+            catalogue.prefetch_attribute_options(attribute_values)
+
+        with self.assertNumQueries(0):
+            values = [
+                catalogue.ProductToResource._attribute_value_to_native_type(item)
+                for item in attribute_values
+            ]
+
+        self.assertEqual(["Small", "Medium", "Large", "Small", "Medium"], values[:5])
+        self.assertEqual(["Berta", True], values[-2:])
+
+    def test_product_to_resource__attribute_value_converter(self):
+        product = Product.objects.get(id=2)
+
+        resource = product_to_resource(
+            product, product_mapper=UppercaseOptionsToResource
+        )
+
+        self.assertEqual({"size": "SMALL"}, resource.attributes)
+        item = ProductAttributeValue.objects.get(product=product)
+        self.assertEqual(
+            "SMALL", UppercaseOptionsToResource._attribute_value_to_native_type(item)
+        )
+
+    def test_product_to_resource__attribute_value_converters_per_mapping(self):
+        product = Product.objects.get(id=2)
+        context = {"stock_strategy": DefaultStrategy()}
+
+        resource = catalogue.ProductToResource.apply(product, context=context)
+        upper_resource = UppercaseOptionsToResource.apply(product, context=context)
+
+        self.assertEqual({"size": "Small"}, resource.attributes)
+        self.assertEqual({"size": "SMALL"}, upper_resource.attributes)
+
+    def test_product_to_resource__overridden_attribute_value_to_native_type(self):
+        class ReversedValuesToResource(catalogue.ProductToResource):
+            from_obj = catalogue.ProductModel
+            to_obj = catalogue.ProductResource
+
+            @staticmethod
+            def _attribute_value_to_native_type(item):
+                return catalogue.ProductToResource._attribute_value_to_native_type(
+                    item
+                )[::-1]
+
+        product = Product.objects.get(id=2)
+
+        resource = product_to_resource(product, product_mapper=ReversedValuesToResource)
+
+        self.assertEqual({"size": "llamS"}, resource.attributes)
+
+    def test_queryset_to_resources__shared_resources_are_mapped_once(self):
+        resources = list(product_queryset_to_resources(Product.objects.all()))
+
+        product_classes = {
+            resource.product_class.slug: resource.product_class
+            for resource in resources
+        }
+        for resource in resources:
+            self.assertIs(
+                product_classes[resource.product_class.slug], resource.product_class
+            )
+
+        categories = {}
+        for resource in resources:
+            for category in resource.categories:
+                self.assertIs(categories.setdefault(category.id, category), category)
+
+    def test_queryset_to_resources_iterator__shared_resources_are_mapped_once(self):
+        first, second = product_queryset_to_resources_iterator(
+            Product.objects.filter(pk__in=[1, 2]), chunk_size=1
+        )
+
+        self.assertIs(first.product_class, second.product_class)
+
+    def test_queryset_to_resources__fields(self):
+        queryset = Product.objects.all()
+        fields = ["id", "title", "upc", "price", "currency"]
+
+        with self.assertNumQueries(4):
+            resources = list(product_queryset_to_resources(queryset, fields=fields))
+
+        expected = {
+            resource.id: resource
+            for resource in product_queryset_to_resources(queryset)
+        }
+        self.assertEqual(queryset.count(), len(resources))
+        for resource in resources:
+            for field in fields:
+                self.assertEqual(
+                    getattr(expected[resource.id], field), getattr(resource, field)
+                )
+            self.assertEqual([], resource.images)
+            self.assertIsNone(resource.product_class)
+
+    def test_queryset_to_resources__fields_only_fetches_their_columns(self):
+        with self.assertNumQueries(1) as context:
+            list(product_queryset_to_resources(Product.objects.all(), fields=["upc"]))
+
+        sql = context.captured_queries[0]["sql"]
+        self.assertIn('"upc"', sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_queryset_to_resources__fields_include_children(self):
+        queryset = Product.objects.filter(pk__in=[1, 5, 8])
+
+        resources = product_queryset_to_resources(
+            queryset, include_children=True, fields=["id", "title", "children"]
+        )
+
+        for resource in resources:
+            product = Product.objects.get(pk=resource.id)
+            if product.is_parent:
+                self.assertEqual(
+                    sorted(child.get_title() for child in product.children.all()),
+                    sorted(child.title for child in resource.children),
+                )
+                self.assertEqual([], resource.children[0].images)
+
+    def test_product_to_resource__unknown_fields(self):
+        with self.assertRaises(ValueError):
+            product_to_resource(Product.objects.get(pk=1), fields=["title", "foo"])
+
     def test_get_mapped_fields(self):
         product_to_model_fields = get_mapped_fields(catalogue.ProductToModel)
         self.assertListEqual(
@@ -0,0 +1,220 @@
+import os
+import tempfile
+from decimal import Decimal as D
+
+from django.db.models.signals import post_delete
+from django.test import TestCase
+from django.utils import timezone
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.changes import (
+    get_changed_products,
+    touch_product_of_instance,
+)
+from oscar_odin.mappings.export import export_changed_products_to_ndjson
+from oscar_odin.mappings.helpers import products_to_db
+from oscar_odin.mappings.partner import PartnerModelToResource
+from oscar_odin.resources.catalogue import ProductClassResource, ProductResource
+from oscar_odin.resources.partner import StockRecordResource
+
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+Category = get_model("catalogue", "Category")
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+
+
+class TestChangedProducts(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        self.since = timezone.now()
+
+    def get_changed_pks(self, since=None):
+        changed_products = get_changed_products(
+            Product.objects.all(), since or self.since
+        )
+        return set(changed_products.queryset.values_list("pk", flat=True))
+
+    def test_nothing_changed(self):
+        self.assertEqual(set(), self.get_changed_pks())
+
+    def test_all_products_without_watermark(self):
+        changed_products = get_changed_products(Product.objects.all())
+
+        self.assertEqual(Product.objects.count(), changed_products.queryset.count())
+        self.assertGreaterEqual(changed_products.watermark, self.since)
+
+    def test_product_changed(self):
+        product = Product.objects.filter(structure=Product.STANDALONE).first()
+        product.save()
+
+        self.assertEqual({product.pk}, self.get_changed_pks())
+
+    def test_stockrecord_changed(self):
+        stockrecord = StockRecord.objects.filter(product__parent=None).first()
+        stockrecord.save()
+
+        self.assertEqual({stockrecord.product_id}, self.get_changed_pks())
+
+    def test_stockrecord_deleted(self):
+        stockrecord = StockRecord.objects.filter(product__parent=None).first()
+        stockrecord.delete()
+
+        self.assertEqual({stockrecord.product_id}, self.get_changed_pks())
+
+    def test_attribute_value_changed(self):
+        product = Product.objects.filter(
+            structure=Product.STANDALONE, attribute_values__isnull=False
+        ).first()
+        attribute_value = product.attribute_values.first()
+        attribute_value.save()
+
+        self.assertEqual({product.pk}, self.get_changed_pks())
+
+    def test_category_added(self):
+        product = Product.objects.filter(structure=Product.STANDALONE).first()
+        product.categories.add(Category.objects.exclude(product=product).first())
+
+        self.assertEqual({product.pk}, self.get_changed_pks())
+
+    def test_category_removed__reverse(self):
+        product = Product.objects.filter(
+            structure=Product.STANDALONE, categories__isnull=False
+        ).first()
+        product.categories.first().product_set.remove(product)
+
+        self.assertEqual({product.pk}, self.get_changed_pks())
+
+    def test_child_changed_includes_parent(self):
+        child = Product.objects.filter(structure=Product.CHILD).first()
+        child.save()
+
+        self.assertEqual({child.pk, child.parent_id}, self.get_changed_pks())
+
+    def test_parent_changed_includes_children(self):
+        parent = Product.objects.filter(structure=Product.PARENT).first()
+        parent.save()
+
+        self.assertEqual(
+            {parent.pk, *parent.children.values_list("pk", flat=True)},
+            self.get_changed_pks(),
+        )
+
+    def test_watermark(self):
+        product = Product.objects.filter(structure=Product.STANDALONE).first()
+        product.save()
+        changed_products = get_changed_products(Product.objects.all(), self.since)
+
+        self.assertEqual({product.pk}, self.get_changed_pks())
+        self.assertEqual(set(), self.get_changed_pks(changed_products.watermark))
+
+    def test_export_changed_products_to_ndjson(self):
+        product = Product.objects.filter(structure=Product.STANDALONE).first()
+        product.save()
+
+        with tempfile.TemporaryDirectory() as directory:
+            merge_to = os.path.join(directory, "changes.ndjson")
+            paths, watermark = export_changed_products_to_ndjson(
+                Product.objects.all(),
+                directory,
+                self.since,
+                workers=0,
+                merge_to=merge_to,
+            )
+
+            with open(paths[0], "rb") as merged:
+                self.assertEqual(1, len(merged.readlines()))
+        self.assertGreater(watermark, self.since)
+
+
+class TestImportedProductChanges(TestCase):
+    def setUp(self):
+        super().setUp()
+        product_class = ProductClass.objects.create(
+            name="Klaas", slug="klaas", requires_shipping=True, track_stock=True
+        )
+        ProductAttribute.objects.create(
+            name="Henk",
+            code="henk",
+            type=ProductAttribute.TEXT,
+            product_class=product_class,
+        )
+        self.partner = PartnerModelToResource.apply(
+            Partner.objects.create(name="klaas")
+        )
+        self.import_products("Product", D("10"))
+        self.since = timezone.now()
+
+    def import_products(self, title, price, henk="Klaas", **kwargs):
+        _, errors = products_to_db(
+            [
+                ProductResource(
+                    upc=f"product-{i}",
+                    title=f"{title} {i}",
+                    slug=f"product-{i}",
+                    structure=Product.STANDALONE,
+                    product_class=ProductClassResource(slug="klaas"),
+                    stockrecords=[
+                        StockRecordResource(
+                            partner=self.partner,
+                            partner_sku=f"sku-{i}",
+                            price=price if i == 0 else D("20"),
+                            currency="EUR",
+                        )
+                    ],
+                    attributes={"henk": henk if i == 0 else "Klaas"},
+                )
+                for i in range(2)
+            ],
+            **kwargs,
+        )
+        self.assertEqual([], errors)
+
+    def get_changed_upcs(self):
+        changed_products = get_changed_products(Product.objects.all(), self.since)
+        return set(changed_products.queryset.values_list("upc", flat=True))
+
+    def test_title_changed(self):
+        self.import_products("New title", D("10"))
+
+        self.assertEqual({"product-0", "product-1"}, self.get_changed_upcs())
+
+    def test_price_changed(self):
+        self.import_products("Product", D("12"), skip_unchanged=True)
+
+        self.assertEqual({"product-0"}, self.get_changed_upcs())
+
+    def test_upsert(self):
+        self.import_products("Product", D("12"), upsert=True)
+
+        self.assertEqual({"product-0", "product-1"}, self.get_changed_upcs())
+
+    def test_attribute_deleted(self):
+        # Without TRACK_PRODUCT_CHANGES, deleted values don't touch their products.
+        dispatch_uid = (
+            "oscar_odin_product_changes_catalogue.ProductAttributeValue_delete"
+        )
+        post_delete.disconnect(sender=ProductAttributeValue, dispatch_uid=dispatch_uid)
+        self.addCleanup(
+            post_delete.connect,
+            touch_product_of_instance,
+            sender=ProductAttributeValue,
+            dispatch_uid=dispatch_uid,
+        )
+
+        self.import_products(
+            "Product", D("10"), henk=None, delete_related=True, skip_unchanged=True
+        )
+
+        self.assertEqual(1, ProductAttributeValue.objects.count())
+        self.assertEqual({"product-0"}, self.get_changed_upcs())
+
+    def test_unchanged(self):
+        self.import_products("Product", D("10"), skip_unchanged=True)
+
+        self.assertEqual(set(), self.get_changed_upcs())
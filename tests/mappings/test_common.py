@@ -0,0 +1,137 @@
+from unittest import mock
+
+import odin
+from odin.exceptions import MappingExecutionError
+
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.inheritable import Resource
+from oscar_odin.mappings.common import OscarBaseMapping
+
+StockRecord = get_model("partner", "StockRecord")
+
+
+class SourceResource(Resource):
+    title = odin.StringField()
+    subtitle = odin.StringField(null=True)
+    first_name = odin.StringField()
+    last_name = odin.StringField()
+
+
+class TargetResource(Resource):
+    title = odin.StringField()
+    subtitle = odin.StringField(default="default subtitle")
+    full_name = odin.StringField()
+    initials = odin.StringField()
+
+
+class SourceToTarget(OscarBaseMapping):
+    from_obj = SourceResource
+    to_obj = TargetResource
+
+    mappings = (odin.define(from_field="subtitle", skip_if_none=True),)
+
+    @odin.map_field(
+        from_field=("first_name", "last_name"), to_field=("full_name", "initials")
+    )
+    def full_name(self, first_name, last_name):
+        return f"{first_name} {last_name}", f"{first_name[0]}{last_name[0]}"
+
+
+class BrokenSourceToTarget(OscarBaseMapping):
+    from_obj = SourceResource
+    to_obj = TargetResource
+
+    @odin.map_field(from_field=("first_name", "last_name"), to_field="full_name")
+    def full_name(self, first_name, last_name):
+        return first_name, last_name
+
+
+class UpperSourceToTarget(SourceToTarget):
+    from_obj = SourceResource
+    to_obj = TargetResource
+
+    def _apply_rule(self, mapping_rule):
+        return {
+            name: value.upper() if isinstance(value, str) else value
+            for name, value in super()._apply_rule(mapping_rule).items()
+        }
+
+
+class CompiledMappingRuleTestCase(TestCase):
+    def test_mapping_rules_are_compiled(self):
+        self.assertEqual(
+            [rule for rule in SourceToTarget._mapping_rules],
+            [compiled_rule.rule for compiled_rule in SourceToTarget._compiled_rules],
+        )
+
+    def test_compiled_rules(self):
+        source = SourceResource(
+            title="title", subtitle=None, first_name="Jan", last_name="Jansen"
+        )
+
+        target = SourceToTarget.apply(source)
+
+        self.assertEqual("title", target.title)
+        self.assertEqual("default subtitle", target.subtitle)
+        self.assertEqual("Jan Jansen", target.full_name)
+        self.assertEqual("JJ", target.initials)
+
+    def test_overridden_apply_rule(self):
+        source = SourceResource(
+            title="title", subtitle=None, first_name="Jan", last_name="Jansen"
+        )
+
+        target = UpperSourceToTarget.apply(source)
+
+        self.assertEqual("TITLE", target.title)
+        self.assertEqual("default subtitle", target.subtitle)
+        self.assertEqual("JAN JANSEN", target.full_name)
+        self.assertEqual("JJ", target.initials)
+
+    def test_apply_rule_uses_compiled_rules(self):
+        source = SourceResource(
+            title="title", subtitle=None, first_name="Jan", last_name="Jansen"
+        )
+
+        with mock.patch(
+            "oscar_odin.mappings.common.compile_mapping_rule"
+        ) as compile_mapping_rule:
+            target = UpperSourceToTarget.apply(source)
+
+        compile_mapping_rule.assert_not_called()
+        self.assertEqual("JAN JANSEN", target.full_name)
+
+    def test_compiled_rules_wrong_amount_of_values(self):
+        source = SourceResource(
+            title="title", subtitle=None, first_name="Jan", last_name="Jansen"
+        )
+
+        with self.assertRaises(MappingExecutionError):
+            BrokenSourceToTarget.apply(source)
+
+
+class StockRecordResource(Resource):
+    partner_sku = odin.StringField()
+    partner_name = odin.StringField(null=True)
+
+
+class StockRecordToResource(OscarBaseMapping):
+    from_obj = StockRecord
+    to_obj = StockRecordResource
+
+    @odin.map_field(from_field="partner", to_field="partner_name")
+    def partner_name(self, partner):
+        return partner.name if partner is not None else None
+
+
+class RelatedObjectDoesNotExistTestCase(TestCase):
+    def test_missing_relation_maps_to_none(self):
+        stockrecord = StockRecord(partner_sku="sku")
+
+        resource = StockRecordToResource.apply(stockrecord)
+
+        self.assertEqual("sku", resource.partner_sku)
+        self.assertIsNone(resource.partner_name)
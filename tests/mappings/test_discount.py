@@ -1,5 +1,7 @@
 from decimal import Decimal
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from oscar.core.loading import get_model
 
 from oscar_odin.mappings import order
@@ -59,3 +61,26 @@ class TestDiscount(TestCase):
         actual = order.order_to_resource(order_obj)
 
         self.assertEqual([], actual.discounts)
+
+    def test_discount_lines_per_tax_code_num_queries(self):
+        with CaptureQueriesContext(connection) as single:
+            list(order.order_queryset_to_resources(Order.objects.filter(number=100022)))
+
+        # Discounts, their lines and the tax codes of the lines come from the prefetches.
+        with self.assertNumQueries(len(single)):
+            resources = list(
+                order.order_queryset_to_resources(
+                    Order.objects.filter(number__in=[100022, 100023])
+                )
+            )
+
+        resource = next(
+            resource for resource in resources if resource.number == "100022"
+        )
+        self.assertEqual(
+            [Decimal("3.49"), Decimal("1.49")],
+            [
+                discount.amount
+                for discount in resource.discounts[0].discount_lines_per_tax_code
+            ],
+        )
@@ -0,0 +1,88 @@
+import json
+import multiprocessing
+import os
+import tempfile
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.export import export_products_to_ndjson, get_export_shards
+from oscar_odin.mappings.helpers import product_queryset_to_primitive
+
+Product = get_model("catalogue", "Product")
+
+
+class TestExport(TestCase):
+    fixtures = ["oscar_odin/catalogue"]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_get_export_shards(self):
+        queryset = Product.objects.filter(pk__lte=10)
+
+        shards = get_export_shards(queryset, 3)
+
+        self.assertEqual([(0, 1, 4), (1, 5, 7), (2, 8, 10)], shards)
+        self.assertEqual(1, len(get_export_shards(queryset.filter(pk=1), 3)))
+        self.assertEqual([], get_export_shards(queryset.none(), 3))
+
+    def test_export_products_to_ndjson(self):
+        queryset = Product.objects.filter(pk__lte=30)
+
+        paths = export_products_to_ndjson(
+            queryset, self.directory.name, workers=0, shards=3, chunk_size=4
+        )
+
+        self.assertEqual(
+            ["part-00000.ndjson", "part-00001.ndjson", "part-00002.ndjson"],
+            [os.path.basename(path) for path in paths],
+        )
+        with open(paths[0], "rb") as part:
+            self.assertEqual(10, len(part.readlines()))
+
+    def test_export_products_to_ndjson__merge(self):
+        queryset = Product.objects.filter(pk__lte=30).order_by("-pk")
+        merge_to = os.path.join(self.directory.name, "catalogue.ndjson")
+
+        paths = export_products_to_ndjson(
+            queryset, self.directory.name, workers=0, shards=3, merge_to=merge_to
+        )
+
+        self.assertEqual([merge_to], paths)
+        self.assertEqual(["catalogue.ndjson"], os.listdir(self.directory.name))
+        with open(merge_to, "rb") as merged:
+            actual = [json.loads(line) for line in merged]
+        expected = json.loads(
+            product_queryset_to_primitive(queryset.order_by("pk"), as_json=True)
+        )
+        self.assertEqual(expected, actual)
+
+    # The workers only see the in-memory test database when they're forked.
+    @skipUnless(multiprocessing.get_start_method() == "fork", "workers aren't forked")
+    def test_export_products_to_ndjson__workers(self):
+        queryset = Product.objects.filter(pk__lte=30).order_by("-pk")
+        serial_path = os.path.join(self.directory.name, "serial.ndjson")
+        parallel_path = os.path.join(self.directory.name, "parallel.ndjson")
+        export_products_to_ndjson(
+            queryset, self.directory.name, workers=0, shards=3, merge_to=serial_path
+        )
+
+        paths = export_products_to_ndjson(
+            queryset,
+            self.directory.name,
+            workers=2,
+            shards=3,
+            chunk_size=4,
+            merge_to=parallel_path,
+        )
+
+        self.assertEqual([parallel_path], paths)
+        with open(serial_path, "rb") as serial, open(parallel_path, "rb") as parallel:
+            expected = serial.readlines()
+            self.assertEqual(30, len(expected))
+            self.assertEqual(expected, parallel.readlines())
@@ -0,0 +1,130 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.helpers import products_to_db
+from oscar_odin.mappings.identifiers import IdentifierCache, shared_identifier_cache
+from oscar_odin.utils import in_bulk
+from oscar_odin.resources.catalogue import (
+    CategoryResource,
+    ProductClassResource,
+    ProductResource,
+)
+
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+Category = get_model("catalogue", "Category")
+
+
+class TestIdentifierCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        Category.add_root(name="Shared", slug="shared", is_public=True, code="shared")
+        shared_identifier_cache.clear()
+
+    def get_product_resources(self, amount, version=""):
+        for i in range(amount):
+            yield ProductResource(
+                upc=f"product-{version}{i}",
+                slug=f"product-{version}{i}",
+                title=f"Product {i}",
+                structure=Product.STANDALONE,
+                product_class=ProductClassResource(
+                    slug="shared",
+                    name="Shared",
+                    requires_shipping=True,
+                    track_stock=True,
+                ),
+                categories=[CategoryResource(code="shared")],
+            )
+
+    def count_product_class_lookups(self, *args, **kwargs):
+        with mock.patch(
+            "oscar_odin.mappings.context.in_bulk", wraps=in_bulk
+        ) as in_bulk_mock:
+            _, errors = products_to_db(*args, **kwargs)
+        self.assertEqual([], errors)
+        return sum(
+            1
+            for call in in_bulk_mock.call_args_list
+            if call.args[0].model is ProductClass
+        )
+
+    def test_get_many(self):
+        cache = IdentifierCache()
+        cache.set_many(ProductClass, {("shared",): 1})
+        cache.set_many(Product, {("upc",): 2})
+
+        self.assertEqual(
+            {("shared",): 1}, cache.get_many(ProductClass, [("shared",), ("other",)])
+        )
+        # Products are not a reference model.
+        self.assertEqual({}, cache.get_many(Product, [("upc",)]))
+        self.assertEqual({"hits": 1, "misses": 1, "size": 1}, cache.stats())
+
+    def test_lookups_once_per_run(self):
+        lookups = self.count_product_class_lookups(
+            self.get_product_resources(6), chunk_size=2
+        )
+
+        # The product class is looked up and created by the first chunk, later chunks
+        # find it in the cache.
+        self.assertEqual(1, lookups)
+        self.assertEqual(1, ProductClass.objects.count())
+        self.assertEqual(6, Product.objects.filter(categories__code="shared").count())
+
+    def test_lookups_per_run(self):
+        ProductClass.objects.create(slug="shared", name="Shared")
+
+        self.assertEqual(
+            1,
+            self.count_product_class_lookups(
+                self.get_product_resources(6), chunk_size=2
+            ),
+        )
+        self.assertEqual(
+            1,
+            self.count_product_class_lookups(
+                self.get_product_resources(6, version="b"), chunk_size=2
+            ),
+        )
+
+    def test_shared_cache(self):
+        ProductClass.objects.create(slug="shared", name="Shared")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first_run = self.count_product_class_lookups(
+                self.get_product_resources(2),
+                identifier_cache=IdentifierCache(parent=shared_identifier_cache),
+            )
+        second_run = self.count_product_class_lookups(
+            self.get_product_resources(2, version="b"),
+            identifier_cache=IdentifierCache(parent=shared_identifier_cache),
+        )
+
+        self.assertEqual((1, 0), (first_run, second_run))
+
+    def test_shared_cache_not_committed(self):
+        ProductClass.objects.create(slug="shared", name="Shared")
+
+        with self.captureOnCommitCallbacks(execute=False):
+            self.count_product_class_lookups(
+                self.get_product_resources(2),
+                identifier_cache=IdentifierCache(parent=shared_identifier_cache),
+            )
+
+        self.assertEqual(
+            {}, shared_identifier_cache.get_many(ProductClass, [("shared",)])
+        )
+
+    def test_shared_cache_cleared_on_delete(self):
+        product_class = ProductClass.objects.create(slug="other", name="Other")
+        shared_identifier_cache.set_many(ProductClass, {("other",): product_class.pk})
+
+        product_class.delete()
+
+        self.assertEqual(
+            {}, shared_identifier_cache.get_many(ProductClass, [("other",)])
+        )
@@ -0,0 +1,125 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.helpers import (
+    product_queryset_to_resources,
+    product_to_resource,
+)
+from oscar_odin.mappings.instrumentation import (
+    QueryBudgetExceeded,
+    QueryRecorder,
+    current_query_recorder,
+    get_query_fingerprint,
+    sampled_query_recorder,
+)
+
+Product = get_model("catalogue", "Product")
+
+
+class TestQueryRecorder(TestCase):
+    fixtures = ["oscar_odin/catalogue"]
+
+    def test_get_query_fingerprint(self):
+        self.assertEqual(
+            get_query_fingerprint('SELECT * FROM "a" WHERE "id" IN (%s, %s, %s)'),
+            get_query_fingerprint('SELECT * FROM "a" WHERE "id" IN (%s, %s)'),
+        )
+        self.assertEqual(
+            "SELECT * FROM a WHERE id = ? AND title = ?",
+            get_query_fingerprint("SELECT * FROM a WHERE id = 12 AND title = 'x'"),
+        )
+
+    def test_queries_are_attributed_to_rules(self):
+        products = list(Product.objects.filter(parent=None)[:5])
+
+        with QueryRecorder(action="ignore") as recorder:
+            list(product_to_resource(products))
+
+        stats = {(stat.mapping, stat.field): stat for stat in recorder.get_stats()}
+        images = stats[("ProductToResource", "images")]
+        self.assertEqual(5, images.objects)
+        self.assertTrue(images.is_n_plus_one)
+
+    def test_raise__n_plus_one(self):
+        products = list(Product.objects.filter(parent=None)[:5])
+
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with QueryRecorder(action="raise"):
+                list(product_to_resource(products))
+
+        self.assertIn(
+            ("ProductToResource", "images"),
+            [(stat.mapping, stat.field) for stat in context.exception.violations],
+        )
+
+    def test_raise__per_object_budget(self):
+        product = Product.objects.get(pk=1)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            with QueryRecorder(per_object=0, action="raise"):
+                product_to_resource(product)
+
+    def test_prefetched_queryset_has_no_violations(self):
+        with QueryRecorder(action="raise") as recorder:
+            product_queryset_to_resources(Product.objects.all())
+
+        self.assertEqual([], recorder.get_violations())
+
+    def test_metrics_callback(self):
+        callback = mock.Mock()
+
+        with QueryRecorder(action="ignore", metrics_callback=callback) as recorder:
+            product_to_resource(Product.objects.get(pk=1))
+
+        callback.assert_called_once_with(recorder.get_stats())
+
+    def test_sampled_query_recorder(self):
+        self.assertIsNone(sampled_query_recorder(0))
+        self.assertIsInstance(sampled_query_recorder(1), QueryRecorder)
+
+        with QueryRecorder(action="ignore"):
+            self.assertIsNone(sampled_query_recorder(1))
+
+    def test_sampled_mapping_run_is_recorded(self):
+        products = list(Product.objects.filter(parent=None)[:5])
+
+        def sample():
+            if current_query_recorder.get() is None:
+                return QueryRecorder(action="raise")
+            return None
+
+        with mock.patch(
+            "oscar_odin.mappings.common.sampled_query_recorder", side_effect=sample
+        ):
+            with self.assertRaises(QueryBudgetExceeded):
+                product_to_resource(products)
+
+    def test_mapping_run_is_sampled_once(self):
+        products = list(Product.objects.filter(parent=None)[:5])
+
+        with mock.patch(
+            "oscar_odin.mappings.common.sampled_query_recorder", return_value=None
+        ) as sample:
+            resources = list(product_to_resource(products))
+
+        self.assertEqual(5, len(resources))
+        sample.assert_called_once_with()
+
+    def test_sampled_mapping_run_keeps_mapping_result(self):
+        products = list(Product.objects.filter(parent=None)[:5])
+        expected = product_to_resource(products)
+
+        with mock.patch(
+            "oscar_odin.mappings.common.sampled_query_recorder",
+            side_effect=lambda: QueryRecorder(action="ignore"),
+        ):
+            result = product_to_resource(products)
+
+        self.assertIs(type(expected), type(result))
+        self.assertEqual(
+            [resource.upc for resource in expected],
+            [resource.upc for resource in result],
+        )
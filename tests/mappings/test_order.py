@@ -1,9 +1,23 @@
+from unittest import mock
+
+from odin.codecs import dict_codec
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from oscar.core.loading import get_model
 
 from oscar_odin.mappings import order
 
+from . import without_unserializable_values
+
 Order = get_model("order", "Order")
+OrderNote = get_model("order", "OrderNote")
+OrderStatusChange = get_model("order", "OrderStatusChange")
+ShippingEvent = get_model("order", "ShippingEvent")
+ShippingEventType = get_model("order", "ShippingEventType")
+PaymentEvent = get_model("order", "PaymentEvent")
+PaymentEventType = get_model("order", "PaymentEventType")
 
 
 class TestOrder(TestCase):
@@ -23,3 +37,141 @@ class TestOrder(TestCase):
 
         self.assertEqual(order_model.number, actual.number)
         self.assertEqual(order_model.lines.first().product.upc, actual.lines[0].upc)
+
+    def test_mapping__model_to_primitive(self):
+        order_model = Order.objects.first()
+
+        expected = dict_codec.dump(
+            order.order_to_resource(order_model), include_type_field=False
+        )
+        actual = order.order_to_primitive(order_model)
+
+        self.assertIsInstance(actual, dict)
+        self.assertEqual(*without_unserializable_values(expected, actual))
+
+    def test_mapping__model_to_primitive_as_json(self):
+        order_model = Order.objects.first()
+
+        actual = order.order_to_primitive(order_model, as_json=True)
+
+        self.assertIsInstance(actual, bytes)
+        self.assertIn(order_model.number.encode(), actual)
+
+    def copy_order(self, order_model, number):
+        lines = list(order_model.lines.all())
+        prices = list(order_model.line_prices.all())
+        attributes = [list(line.attributes.all()) for line in lines]
+        discounts = list(order_model.discounts.all())
+
+        order_model.pk = None
+        order_model.number = number
+        order_model.save()
+
+        for line, line_attributes in zip(lines, attributes):
+            line_prices = [price for price in prices if price.line_id == line.pk]
+            line.pk = None
+            line.order = order_model
+            line.save()
+            for price in line_prices:
+                price.pk = None
+                price.order = order_model
+                price.line = line
+                price.save()
+            for attribute in line_attributes:
+                attribute.pk = None
+                attribute.line = line
+                attribute.save()
+
+        for discount in discounts:
+            discount.pk = None
+            discount.order = order_model
+            discount.save()
+
+        return order_model
+
+    def add_order_history(self, order_model):
+        OrderNote.objects.create(order=order_model, message="Call before delivery")
+        OrderStatusChange.objects.create(
+            order=order_model, old_status="Pending", new_status="Shipped"
+        )
+        shipping_event = ShippingEvent.objects.create(
+            order=order_model,
+            event_type=ShippingEventType.objects.get_or_create(name="Shipped")[0],
+        )
+        PaymentEvent.objects.create(
+            order=order_model,
+            amount=order_model.total_incl_tax,
+            event_type=PaymentEventType.objects.get_or_create(name="Paid")[0],
+            shipping_event=shipping_event,
+        )
+
+    def test_queryset_to_resources(self):
+        order_model = Order.objects.first()
+
+        actual = list(order.order_queryset_to_resources(Order.objects.all()))
+
+        self.assertEqual(
+            dict_codec.dump(
+                order.order_to_resource(order_model), include_type_field=False
+            ),
+            dict_codec.dump(actual[0], include_type_field=False),
+        )
+
+    def test_queryset_to_resources_num_queries(self):
+        order_model = Order.objects.first()
+        self.add_order_history(order_model)
+        with CaptureQueriesContext(connection) as single:
+            list(order.order_queryset_to_resources(Order.objects.all()))
+
+        for number in ("100002", "100003", "100004"):
+            self.add_order_history(
+                self.copy_order(Order.objects.get(pk=order_model.pk), number)
+            )
+        self.assertEqual(4, Order.objects.count())
+
+        with self.assertNumQueries(len(single)):
+            resources = list(order.order_queryset_to_resources(Order.objects.all()))
+
+        self.assertEqual(4, len(resources))
+        for resource in resources:
+            self.assertEqual(1, len(resource.notes))
+            self.assertEqual(1, len(resource.status_changes))
+            self.assertEqual(1, len(resource.shipping_events))
+            self.assertEqual(1, len(resource.payment_events))
+
+    def test_queryset_to_resources__products_are_mapped_once(self):
+        order_model = Order.objects.first()
+        self.copy_order(Order.objects.get(pk=order_model.pk), "100002")
+
+        with mock.patch.object(
+            order,
+            "product_to_resource_with_strategy",
+            wraps=order.product_to_resource_with_strategy,
+        ) as product_to_resource_with_strategy:
+            first, second = order.order_queryset_to_resources(
+                Order.objects.order_by("pk")
+            )
+
+        product_to_resource_with_strategy.assert_called_once()
+        self.assertEqual(2, len(first.lines))
+        for first_line, second_line in zip(first.lines, second.lines):
+            self.assertIs(first_line.product, second_line.product)
+
+    def test_order_to_resource__lines_are_prefetched(self):
+        order_model = Order.objects.first()
+        for number in ("100002", "100003", "100004"):
+            self.copy_order(Order.objects.get(pk=order_model.pk), number)
+        orders = list(Order.objects.all())
+
+        with CaptureQueriesContext(connection) as context:
+            resources = list(order.order_to_resource(orders))
+
+        self.assertEqual(4, len(resources))
+        for table in ("order_line", "order_orderlinediscount"):
+            self.assertEqual(
+                1,
+                sum(
+                    f'FROM "{table}"' in query["sql"]
+                    for query in context.captured_queries
+                ),
+            )
@@ -0,0 +1,155 @@
+from typing import List, Optional
+
+import odin
+from django.test import TestCase
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings import catalogue
+from oscar_odin.mappings.helpers import product_queryset_to_resources
+from oscar_odin.mappings.prefetching.planner import (
+    get_only_fields,
+    get_unused_prefetches,
+    plan_prefetches,
+    requires_prefetch,
+)
+from oscar_odin.mappings.prefetching.prefetch import prefetch_attribute_values
+from oscar_odin.mappings.prefetching.registry import PrefetchRegistry
+from oscar_odin.resources.catalogue import ProductResource
+
+Product = get_model("catalogue", "Product")
+
+
+class RecommendedProductsResource(ProductResource):
+    recommended_upcs: Optional[List[str]] = None
+
+
+class RecommendedProductsToResource(catalogue.ProductToResource):
+    from_obj = Product
+    to_obj = RecommendedProductsResource
+
+    @odin.map_list_field(from_field="recommended_products")
+    def recommended_upcs(self, values) -> List[str]:
+        return [product.upc for product in values.all()]
+
+
+class ProductCategoriesResource(ProductResource):
+    category_names: Optional[List[str]] = None
+
+
+class ProductCategoriesToResource(catalogue.ProductToResource):
+    from_obj = Product
+    to_obj = ProductCategoriesResource
+
+    @odin.assign_field(to_list=True)
+    @requires_prefetch("categories")
+    def category_names(self) -> List[str]:
+        return [category.name for category in self.source.categories.all()]
+
+
+class MetaDescriptionToResource(catalogue.ProductToResource):
+    from_obj = Product
+    to_obj = ProductResource
+
+    @odin.assign_field
+    def description(self) -> str:
+        return self.source.get_meta_description()
+
+
+class PrefetchedChildrenToResource(catalogue.ProductToResource):
+    from_obj = Product
+    to_obj = ProductResource
+
+    @odin.assign_field
+    @requires_prefetch("children", mapping=catalogue.ProductToResource, children=True)
+    def children(self):
+        return super().children()
+
+
+class TestPrefetchPlanner(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def test_plan_prefetches(self):
+        plan = plan_prefetches(catalogue.ProductToResource)
+
+        self.assertEqual(
+            {"parent", "product_class", "parent__product_class"}, plan.select_related
+        )
+        self.assertIn("images", plan.prefetches)
+        self.assertIn("parent__images", plan.prefetches)
+        self.assertIn("stockrecords", plan.prefetches)
+        self.assertIn("prefetch_attribute_values", plan.prefetches)
+        # Related managers that are passed on as is don't need to be prefetched
+        self.assertNotIn("recommended_products", plan.prefetches)
+        # The children are fetched and prefetched by ProductToResource.prepare_children
+        self.assertEqual({}, plan.children_prefetches)
+
+    def test_plan_prefetches__children(self):
+        plan = plan_prefetches(PrefetchedChildrenToResource)
+
+        self.assertIn("children__images", plan.children_prefetches)
+        # The children refer back to their parent, that doesn't need to be prefetched
+        self.assertNotIn("children__parent__images", plan.children_prefetches)
+
+    def test_plan_prefetches__fields(self):
+        plan = plan_prefetches(
+            catalogue.ProductToResource, frozenset(["title", "images"])
+        )
+
+        self.assertEqual({"parent"}, plan.select_related)
+        self.assertEqual(["images", "parent__images"], sorted(plan.prefetches))
+
+    def test_get_only_fields(self):
+        self.assertEqual(
+            {"id", "title", "upc", "parent"},
+            get_only_fields(catalogue.ProductToResource, frozenset(["title", "upc"])),
+        )
+        # The rule doesn't declare the fields it reads
+        self.assertIsNone(
+            get_only_fields(MetaDescriptionToResource, frozenset(["description"]))
+        )
+
+    def test_plan_prefetches__related_manager_with_action(self):
+        plan = plan_prefetches(RecommendedProductsToResource)
+
+        self.assertIn("recommended_products", plan.prefetches)
+
+    def test_get_unused_prefetches(self):
+        registry = PrefetchRegistry()
+        registry.register_select_related(["parent", "product_class"])
+        registry.register_prefetch("images")
+        registry.register_prefetch("categories")
+        registry.register_prefetch(prefetch_attribute_values)
+        registry.register_children_prefetch("children__categories")
+
+        unused = get_unused_prefetches(catalogue.ProductToResource, registry)
+
+        self.assertEqual(
+            {
+                "select_related": [],
+                "prefetches": ["categories"],
+                "children_prefetches": ["children__categories"],
+            },
+            unused,
+        )
+        self.assertEqual(
+            [],
+            get_unused_prefetches(ProductCategoriesToResource, registry)["prefetches"],
+        )
+
+    def test_queryset_to_resources__custom_mapper_num_queries(self):
+        queryset = Product.objects.all()
+
+        # The default mapping does 13 queries, the custom rule adds one prefetch.
+        with self.assertNumQueries(14):
+            resources = product_queryset_to_resources(
+                queryset, product_mapper=RecommendedProductsToResource
+            )
+
+        self.assertEqual(210, len(resources))
+
+        with self.assertNumQueries(14):
+            resources = product_queryset_to_resources(
+                queryset, product_mapper=ProductCategoriesToResource
+            )
+
+        self.assertTrue(any(resource.category_names for resource in resources))
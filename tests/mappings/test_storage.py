@@ -0,0 +1,116 @@
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.helpers import product_queryset_to_resources
+from oscar_odin.mappings.storage import StorageURLCache, storage_url_cache
+
+Product = get_model("catalogue", "Product")
+ProductImage = get_model("catalogue", "ProductImage")
+
+
+class CountingStorage(FileSystemStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, base_url="/media/", **kwargs)
+        self.url_calls = 0
+
+    def url(self, name):
+        self.url_calls += 1
+        return super().url(name)
+
+
+class BatchStorage(CountingStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url_many_calls = 0
+
+    def url_many(self, names):
+        self.url_many_calls += 1
+        return {name: f"/signed/{name}" for name in names}
+
+
+class TestStorageURLCache(TestCase):
+    fixtures = ["oscar_odin/catalogue"]
+
+    def setUp(self):
+        storage_url_cache.clear()
+        self.addCleanup(storage_url_cache.clear)
+
+    def get_image(self, storage):
+        field = ProductImage._meta.get_field("original")
+        with mock.patch.object(field, "storage", storage):
+            return ProductImage.objects.first().original
+
+    def test_get_url__is_cached(self):
+        storage = CountingStorage()
+        image = self.get_image(storage)
+        cache = StorageURLCache(maxsize=10, timeout=60)
+
+        self.assertEqual(image.url, cache.get_url(image))
+        self.assertEqual(image.url, cache.get_url(image))
+
+        self.assertEqual(3, storage.url_calls)
+        self.assertEqual({"hits": 1, "misses": 1, "size": 1}, cache.stats())
+
+    def test_get_url__expired(self):
+        storage = CountingStorage()
+        image = self.get_image(storage)
+        cache = StorageURLCache(maxsize=10, timeout=0)
+
+        cache.get_url(image)
+        cache.get_url(image)
+
+        self.assertEqual(2, storage.url_calls)
+
+    def test_get_url__bounded(self):
+        storage = CountingStorage()
+        images = [image.original for image in ProductImage.objects.all()[:3]]
+        for image in images:
+            image.storage = storage
+        cache = StorageURLCache(maxsize=2, timeout=60)
+
+        for image in images:
+            cache.get_url(image)
+        cache.get_url(images[0])
+
+        self.assertEqual(4, storage.url_calls)
+        self.assertEqual(2, cache.stats()["size"])
+
+    def test_get_url__no_file(self):
+        image = ProductImage.objects.first().original
+        image.name = None
+
+        with self.assertRaises(ValueError):
+            StorageURLCache().get_url(image)
+
+    def test_resolve_many(self):
+        storage = BatchStorage()
+        images = [image.original for image in ProductImage.objects.all()[:3]]
+        for image in images:
+            image.storage = storage
+        cache = StorageURLCache(maxsize=10, timeout=60)
+
+        cache.resolve_many(images)
+        cache.resolve_many(images)
+        urls = [cache.get_url(image) for image in images]
+
+        self.assertEqual(1, storage.url_many_calls)
+        self.assertEqual(0, storage.url_calls)
+        self.assertEqual([f"/signed/{image.name}" for image in images], urls)
+
+    def test_mapping_resolves_images_in_batch(self):
+        storage = BatchStorage()
+        field = ProductImage._meta.get_field("original")
+        with mock.patch.object(field, "storage", storage):
+            resources = product_queryset_to_resources(
+                Product.objects.filter(images__isnull=False).distinct()
+            )
+
+        self.assertEqual(1, storage.url_many_calls)
+        self.assertEqual(0, storage.url_calls)
+        for resource in resources:
+            for image in resource.images:
+                self.assertTrue(image.original.startswith("/signed/"))
@@ -0,0 +1,109 @@
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.validation import get_batch_validator
+
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+StockRecord = get_model("partner", "StockRecord")
+
+
+class TestBatchValidator(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        self.product_class = ProductClass.objects.first()
+
+    def get_product(self, upc, **kwargs):
+        kwargs.setdefault("title", upc)
+        return Product(
+            upc=upc,
+            slug=upc,
+            structure=Product.STANDALONE,
+            product_class=self.product_class,
+            **kwargs,
+        )
+
+    def test_valid(self):
+        stockrecord = StockRecord.objects.first()
+        stockrecords = [
+            StockRecord(
+                product=product,
+                partner=stockrecord.partner,
+                partner_sku=f"new-{product.pk}",
+                price=10,
+            )
+            for product in Product.objects.all()
+        ]
+
+        # One query per foreign key (product and partner) and one for the unique
+        # together of partner and partner_sku.
+        with self.assertNumQueries(3):
+            errors = get_batch_validator(StockRecord).validate(stockrecords)
+
+        self.assertEqual([None] * len(stockrecords), errors)
+
+    def test_missing_foreign_key(self):
+        stockrecord = StockRecord.objects.first()
+        missing = StockRecord(
+            product_id=12345,
+            partner=stockrecord.partner,
+            partner_sku="missing",
+            price=10,
+        )
+
+        (error,) = get_batch_validator(StockRecord).validate([missing])
+
+        with self.assertRaises(ValidationError) as full_clean_error:
+            missing.full_clean()
+        self.assertEqual(full_clean_error.exception.message_dict, error.message_dict)
+
+    def test_same_errors_as_full_clean(self):
+        existing = Product.objects.filter(structure=Product.STANDALONE).first()
+        Product.objects.filter(pk=existing.pk).update(upc="existing")
+        products = [
+            self.get_product("existing"),
+            self.get_product("too-long", title="x" * 300),
+            self.get_product("new"),
+        ]
+
+        errors = get_batch_validator(Product).validate(products)
+
+        for product, error in zip(products, errors):
+            try:
+                product.full_clean()
+            except ValidationError as full_clean_error:
+                self.assertEqual(full_clean_error.message_dict, error.message_dict)
+            else:
+                self.assertIsNone(error)
+        self.assertIn("upc", errors[0].message_dict)
+        self.assertIn("title", errors[1].message_dict)
+
+    def test_update_is_not_a_conflict(self):
+        stockrecord = StockRecord.objects.first()
+        stockrecord.price = 12
+
+        errors = get_batch_validator(StockRecord).validate(
+            [
+                stockrecord,
+                StockRecord(
+                    product=stockrecord.product,
+                    partner=stockrecord.partner,
+                    partner_sku=stockrecord.partner_sku,
+                    price=10,
+                ),
+            ]
+        )
+
+        self.assertIsNone(errors[0])
+        self.assertIn(NON_FIELD_ERRORS, errors[1].message_dict)
+
+    def test_exclude(self):
+        product = self.get_product("x" * 100, title="x" * 300)
+
+        (error,) = get_batch_validator(Product, frozenset(["upc"])).validate([product])
+
+        self.assertEqual(["title"], list(error.message_dict))
@@ -8,7 +8,7 @@ from django.test import TestCase
 
 from oscar.core.loading import get_model
 
-from oscar_odin.mappings.helpers import products_to_db
+from oscar_odin.mappings.helpers import products_to_db, products_to_db_iterator
 from oscar_odin.resources.catalogue import (
     ProductResource,
     ProductImageResource,
@@ -30,7 +30,11 @@ from oscar_odin.mappings.constants import (
     PRODUCT_IS_DISCOUNTABLE,
     PRODUCTCLASS_REQUIRESSHIPPING,
     MODEL_IDENTIFIERS_MAPPING,
+    ALL_CATALOGUE_FIELDS,
 )
+from oscar_odin.mappings.catalogue import ProductToModel
+from oscar_odin.mappings.context import ProductModelMapperContext
+from oscar_odin.mappings.resources import resources_to_db
 from oscar_odin.mappings.partner import PartnerModelToResource
 
 Product = get_model("catalogue", "Product")
@@ -478,6 +482,109 @@ class MultipleProductReverseTest(TestCase):
 
         self.assertEqual(Product.objects.count(), 2)
 
+    def get_product_resources(self, amount, invalid=()):
+        product_class = ProductClassResource(slug="klaas", name="Klaas")
+        for i in range(amount):
+            yield ProductResource(
+                upc=f"generated-{i}",
+                title=f"Generated {i}",
+                slug=f"generated-{i}",
+                structure=Product.STANDALONE,
+                product_class=product_class,
+                # A price without a partner and currency is invalid.
+                price=D("10") if i in invalid else None,
+            )
+
+    def test_create_products_from_generator(self):
+        saved, errors = products_to_db(self.get_product_resources(5), chunk_size=2)
+
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(saved.count(), 5)
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_products_to_db_iterator(self):
+        results = products_to_db_iterator(
+            self.get_product_resources(5), chunk_size=2, stream=True
+        )
+
+        chunk_result = next(results)
+        # Only the first chunk is pulled from the generator and saved.
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(
+            set(chunk_result.saved_pks),
+            set(Product.objects.values_list("pk", flat=True)),
+        )
+        self.assertEqual([2, 1], [len(result.saved_pks) for result in results])
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_generator_with_invalid_products(self):
+        results = list(
+            products_to_db_iterator(
+                self.get_product_resources(6, invalid=[3]), chunk_size=2
+            )
+        )
+
+        # All products are validated up front, nothing is saved.
+        self.assertEqual([0], [len(result.saved_pks) for result in results])
+        self.assertEqual(1, len(results[0].errors))
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_stream_generator_with_invalid_products(self):
+        results = list(
+            products_to_db_iterator(
+                self.get_product_resources(6, invalid=[3]), chunk_size=2, stream=True
+            )
+        )
+
+        # The chunk with the invalid product stops the import, the chunk before it
+        # is saved already.
+        self.assertEqual([2, 0], [len(result.saved_pks) for result in results])
+        self.assertEqual(1, len(results[1].errors))
+        self.assertEqual(
+            set(results[0].saved_pks),
+            set(Product.objects.values_list("pk", flat=True)),
+        )
+
+    def test_list_with_invalid_products(self):
+        saved, errors = products_to_db(
+            list(self.get_product_resources(6, invalid=[3])), chunk_size=2
+        )
+
+        # Nothing is saved, an empty list is returned.
+        self.assertEqual([], saved)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_stream_list_with_invalid_products(self):
+        saved, errors = products_to_db(
+            list(self.get_product_resources(6, invalid=[3])), chunk_size=2, stream=True
+        )
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(
+            set(saved.values_list("pk", flat=True)),
+            set(Product.objects.values_list("pk", flat=True)),
+        )
+
+    def test_generator_skip_invalid_products(self):
+        _, errors = resources_to_db(
+            self.get_product_resources(6, invalid=[1, 3]),
+            ALL_CATALOGUE_FIELDS,
+            MODEL_IDENTIFIERS_MAPPING,
+            model_mapper=ProductToModel,
+            context_mapper=ProductModelMapperContext,
+            skip_invalid_resources=True,
+            chunk_size=2,
+            stream=True,
+        )
+
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(
+            set(Product.objects.values_list("upc", flat=True)),
+            {"generated-0", "generated-2", "generated-4", "generated-5"},
+        )
+
     def test_creating_product_class_without_instance_full_clean(self):
         ProductClass.objects.all().delete()
         product_class = ProductClassResource(
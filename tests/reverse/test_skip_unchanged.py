@@ -0,0 +1,122 @@
+from decimal import Decimal as D
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.helpers import products_to_db_iterator
+from oscar_odin.mappings.partner import PartnerModelToResource
+from oscar_odin.resources.catalogue import ProductClassResource, ProductResource
+from oscar_odin.resources.partner import StockRecordResource
+
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+
+
+class SkipUnchangedTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        ProductClass.objects.create(
+            name="Klaas", slug="klaas", requires_shipping=True, track_stock=True
+        )
+        self.partner = PartnerModelToResource.apply(
+            Partner.objects.create(name="klaas")
+        )
+
+    def get_product_resources(self, prices):
+        return [
+            ProductResource(
+                upc=f"product-{i}",
+                title=f"Product {i}",
+                slug=f"product-{i}",
+                structure=Product.STANDALONE,
+                product_class=ProductClassResource(slug="klaas"),
+                stockrecords=[
+                    StockRecordResource(
+                        partner=self.partner,
+                        partner_sku=f"sku-{i}",
+                        price=price,
+                        num_in_stock=2,
+                        currency="EUR",
+                    )
+                ],
+            )
+            for i, price in enumerate(prices)
+        ]
+
+    def save(self, resources, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            results = list(products_to_db_iterator(resources, **kwargs))
+        for result in results:
+            self.assertEqual([], result.errors)
+        updates = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        return results[0].counts, updates
+
+    def test_unchanged(self):
+        self.save(self.get_product_resources([D("10"), D("20")]))
+
+        counts, updates = self.save(
+            self.get_product_resources([D("10.00"), D("20")]), skip_unchanged=True
+        )
+
+        self.assertEqual([], updates)
+        self.assertEqual(
+            {"unchanged": 2},
+            counts[Product._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual(
+            {"unchanged": 2},
+            counts[StockRecord._meta.label],  # pylint: disable=protected-access
+        )
+
+    def test_changed(self):
+        self.save(self.get_product_resources([D("10"), D("20")]))
+
+        counts, updates = self.save(
+            self.get_product_resources([D("10"), D("25")]), skip_unchanged=True
+        )
+
+        # Only the price of the stock record that changed is updated, and the
+        # date_updated of its product is touched.
+        stockrecord_updates = [
+            sql for sql in updates if sql.startswith('UPDATE "partner_stockrecord"')
+        ]
+        self.assertEqual(2, len(updates))
+        self.assertEqual(1, len(stockrecord_updates))
+        self.assertIn('"price"', stockrecord_updates[0])
+        self.assertNotIn('"num_in_stock"', stockrecord_updates[0])
+        self.assertEqual(
+            {"updated": 1, "unchanged": 1},
+            counts[StockRecord._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual(
+            [D("10"), D("25")],
+            list(
+                StockRecord.objects.order_by("partner_sku").values_list(
+                    "price", flat=True
+                )
+            ),
+        )
+
+    def test_without_skip_unchanged(self):
+        counts, _ = self.save(self.get_product_resources([D("10"), D("20")]))
+        self.assertEqual(
+            {"created": 2},
+            counts[Product._meta.label],  # pylint: disable=protected-access
+        )
+
+        counts, updates = self.save(self.get_product_resources([D("10"), D("20")]))
+
+        self.assertTrue(updates)
+        self.assertEqual(
+            {"updated": 2},
+            counts[Product._meta.label],  # pylint: disable=protected-access
+        )
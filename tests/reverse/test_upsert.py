@@ -0,0 +1,183 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.constants import PRODUCT_TITLE, STOCKRECORD_PRICE
+from oscar_odin.mappings.helpers import products_to_db_iterator
+from oscar_odin.mappings.partner import PartnerModelToResource
+from oscar_odin.resources.catalogue import ProductClassResource, ProductResource
+from oscar_odin.resources.partner import StockRecordResource
+
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+
+
+class UpsertTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        ProductClass.objects.create(
+            name="Klaas", slug="klaas", requires_shipping=True, track_stock=True
+        )
+        self.partner = PartnerModelToResource.apply(
+            Partner.objects.create(name="klaas")
+        )
+
+    def get_product_resources(self, prices):
+        return [
+            ProductResource(
+                upc=f"product-{i}",
+                title=f"Product {i}",
+                slug=f"product-{i}",
+                structure=Product.STANDALONE,
+                product_class=ProductClassResource(slug="klaas"),
+                stockrecords=[
+                    StockRecordResource(
+                        partner=self.partner,
+                        partner_sku=f"sku-{i}",
+                        price=price,
+                        num_in_stock=2,
+                        currency="EUR",
+                    )
+                ],
+            )
+            for i, price in enumerate(prices)
+        ]
+
+    def save(self, resources, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            results = list(products_to_db_iterator(resources, **kwargs))
+        for result in results:
+            self.assertEqual([], result.errors)
+        upserts = [
+            query["sql"]
+            for query in context.captured_queries
+            if "ON CONFLICT" in query["sql"]
+        ]
+        return results[0], upserts
+
+    def get_prices(self):
+        return list(
+            StockRecord.objects.order_by("partner_sku").values_list("price", flat=True)
+        )
+
+    def test_upsert(self):
+        result, upserts = self.save(
+            self.get_product_resources([D("10"), D("20")]), upsert=True
+        )
+
+        self.assertEqual(2, len(upserts))
+        self.assertEqual(
+            {"upserted": 2},
+            result.counts[Product._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual(
+            set(result.saved_pks), set(Product.objects.values_list("pk", flat=True))
+        )
+        self.assertEqual([D("10"), D("20")], self.get_prices())
+
+        result, upserts = self.save(
+            self.get_product_resources([D("10"), D("25"), D("30")]), upsert=True
+        )
+
+        self.assertEqual(2, len(upserts))
+        self.assertEqual(3, Product.objects.count())
+        self.assertEqual(
+            {"upserted": 3},
+            result.counts[StockRecord._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual([D("10"), D("25"), D("30")], self.get_prices())
+        self.assertEqual(
+            set(result.saved_pks), set(Product.objects.values_list("pk", flat=True))
+        )
+
+    def test_not_supported(self):
+        with mock.patch.object(
+            connection.features, "supports_update_conflicts_with_target", False
+        ):
+            result, upserts = self.save(
+                self.get_product_resources([D("10"), D("20")]), upsert=True
+            )
+
+        self.assertEqual([], upserts)
+        self.assertEqual(
+            {"created": 2},
+            result.counts[Product._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual([D("10"), D("20")], self.get_prices())
+
+    def test_partial_resources(self):
+        self.save(self.get_product_resources([D("10"), D("20")]))
+
+        # Only the prices are updated, the other fields of the stock records are
+        # kept.
+        result, upserts = self.save(
+            [
+                ProductResource(
+                    upc=f"product-{i}",
+                    stockrecords=[
+                        StockRecordResource(
+                            partner=self.partner, partner_sku=f"sku-{i}", price=price
+                        )
+                    ],
+                )
+                for i, price in enumerate([D("15"), D("25")])
+            ],
+            fields_to_update=[STOCKRECORD_PRICE],
+            upsert=True,
+        )
+
+        self.assertEqual(1, len(upserts))
+        self.assertIn('DO UPDATE SET "price"', upserts[0])
+        self.assertEqual(
+            {"upserted": 2},
+            result.counts[StockRecord._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual([D("15"), D("25")], self.get_prices())
+        self.assertEqual(
+            [2, 2], list(StockRecord.objects.values_list("num_in_stock", flat=True))
+        )
+
+    def test_not_valid_as_new_rows(self):
+        self.save(self.get_product_resources([D("10"), D("20")]))
+
+        # Products without a slug can't be created, they're updated the regular way.
+        result, upserts = self.save(
+            [
+                ProductResource(
+                    upc=f"product-{i}",
+                    title=f"New title {i}",
+                    structure=Product.STANDALONE,
+                    product_class=ProductClassResource(slug="klaas"),
+                )
+                for i in range(2)
+            ],
+            fields_to_update=[PRODUCT_TITLE],
+            upsert=True,
+        )
+
+        self.assertEqual([], upserts)
+        self.assertEqual(
+            {"updated": 2},
+            result.counts[Product._meta.label],  # pylint: disable=protected-access
+        )
+        self.assertEqual(
+            ["New title 0", "New title 1"],
+            list(Product.objects.order_by("upc").values_list("title", flat=True)),
+        )
+
+    def test_skip_unchanged(self):
+        with self.assertRaises(ValueError):
+            self.save(
+                self.get_product_resources([D("10"), D("20")]),
+                upsert=True,
+                skip_unchanged=True,
+            )
+
+        self.assertEqual(0, Product.objects.count())
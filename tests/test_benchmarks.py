@@ -0,0 +1,68 @@
+import io
+
+from django.test import TestCase
+from odin.codecs import dict_codec
+
+from oscar.core.loading import get_model
+
+from benchmarks.generator import (
+    CatalogueShape,
+    generate_catalogue,
+    generate_product_resources,
+)
+from benchmarks.run import run_benchmarks
+from oscar_odin.mappings.helpers import products_to_db
+
+Product = get_model("catalogue", "Product")
+StockRecord = get_model("partner", "StockRecord")
+Line = get_model("order", "Line")
+
+SHAPE = CatalogueShape(
+    standalone_products=4,
+    parent_products=2,
+    variants_per_parent=2,
+    categories=4,
+    orders=2,
+    lines_per_order=2,
+)
+
+
+class TestBenchmarks(TestCase):
+    def test_generate_catalogue(self):
+        generate_catalogue(SHAPE)
+
+        self.assertEqual(SHAPE.products, Product.objects.count())
+        self.assertEqual(
+            (
+                SHAPE.standalone_products
+                + SHAPE.parent_products * SHAPE.variants_per_parent
+            )
+            * SHAPE.stockrecords_per_product,
+            StockRecord.objects.count(),
+        )
+        self.assertEqual(SHAPE.orders * SHAPE.lines_per_order, Line.objects.count())
+
+    def test_generate_product_resources(self):
+        generate_catalogue(SHAPE)
+
+        # The same shape generates the same resources.
+        self.assertEqual(
+            dict_codec.dump(
+                generate_product_resources(SHAPE), include_type_field=False
+            ),
+            dict_codec.dump(
+                generate_product_resources(SHAPE), include_type_field=False
+            ),
+        )
+        _, errors = products_to_db(generate_product_resources(SHAPE))
+        self.assertEqual([], errors)
+
+    def test_run_benchmarks(self):
+        generate_catalogue(SHAPE)
+
+        results = run_benchmarks(SHAPE, repeat=1, stream=io.StringIO())
+
+        for result in results:
+            self.assertEqual(1, len(result["durations"]))
+            self.assertGreater(result["queries"], 0)
+            self.assertGreater(result["peak_memory"], 0)
@@ -125,3 +125,6 @@ STATIC_URL = "/static/"
 STATIC_ROOT = "static"
 
 ROOT_URLCONF = "urls"
+
+# Touch products when their images, attribute values or categories change.
+TRACK_PRODUCT_CHANGES = True
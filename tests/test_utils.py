@@ -0,0 +1,131 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.utils import in_bulk
+
+Product = get_model("catalogue", "Product")
+ProductCategory = get_model("catalogue", "ProductCategory")
+StockRecord = get_model("partner", "StockRecord")
+
+
+class TestInBulk(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        for product in Product.objects.all():
+            Product.objects.filter(pk=product.pk).update(upc=f"upc-{product.pk}")
+        stockrecord = StockRecord.objects.first()
+        for product in Product.objects.exclude(stockrecords=stockrecord)[:4]:
+            StockRecord.objects.create(
+                product=product,
+                partner=stockrecord.partner,
+                partner_sku=f"sku-{product.pk}",
+                price=stockrecord.price,
+            )
+
+    def test_single_field(self):
+        products = list(Product.objects.all()[:5])
+        instances = [Product(upc=product.upc) for product in products]
+        instances.append(Product(upc="does-not-exist"))
+
+        with self.assertNumQueries(1):
+            mapping = in_bulk(Product.objects, instances, ("upc",))
+
+        self.assertEqual(
+            {(product.upc,): product.pk for product in products}, dict(mapping)
+        )
+
+    def test_composite_fields(self):
+        stockrecords = list(StockRecord.objects.all()[:5])
+        instances = [
+            StockRecord(partner_id=stockrecord.partner_id, partner_sku=sku)
+            for stockrecord in stockrecords
+            for sku in (stockrecord.partner_sku, "does-not-exist")
+        ]
+
+        with self.assertNumQueries(1) as context:
+            mapping = in_bulk(
+                StockRecord.objects, instances, ("partner_id", "partner_sku")
+            )
+
+        self.assertIn(" IN ((", context.captured_queries[0]["sql"])
+        self.assertEqual(
+            {
+                (stockrecord.partner_id, stockrecord.partner_sku): stockrecord.pk
+                for stockrecord in stockrecords
+            },
+            dict(mapping),
+        )
+
+    def test_composite_fields__fallback(self):
+        stockrecords = list(StockRecord.objects.all()[:5])
+        instances = [
+            StockRecord(
+                partner=stockrecord.partner, partner_sku=stockrecord.partner_sku
+            )
+            for stockrecord in stockrecords
+        ]
+
+        with mock.patch("oscar_odin.utils.ROW_VALUE_VENDORS", ()):
+            with self.assertNumQueries(1) as context:
+                mapping = in_bulk(
+                    StockRecord.objects, instances, ("partner_id", "partner_sku")
+                )
+
+        self.assertIn(" OR ", context.captured_queries[0]["sql"])
+        self.assertEqual(
+            {
+                (stockrecord.partner_id, stockrecord.partner_sku): stockrecord.pk
+                for stockrecord in stockrecords
+            },
+            dict(mapping),
+        )
+
+    def test_related_instances(self):
+        product_categories = list(ProductCategory.objects.all()[:5])
+        instances = [
+            ProductCategory(
+                product=product_category.product, category=product_category.category
+            )
+            for product_category in product_categories
+        ]
+
+        mapping = in_bulk(ProductCategory.objects, instances, ("product", "category"))
+
+        self.assertEqual(
+            {
+                (
+                    product_category.product_id,
+                    product_category.category_id,
+                ): product_category.pk
+                for product_category in product_categories
+            },
+            dict(mapping),
+        )
+
+    def test_null_values(self):
+        product = Product.objects.filter(structure=Product.PARENT).first()
+        Product.objects.filter(pk=product.pk).update(upc=None)
+
+        with self.assertNumQueries(1) as context:
+            mapping = in_bulk(Product.objects, [Product(upc=None)], ("upc",))
+
+        self.assertIn("IS NULL", context.captured_queries[0]["sql"])
+        # The upc is a NullCharField, it's read from the database as an empty string.
+        self.assertEqual([product.pk], list(mapping.values()))
+
+    def test_batches(self):
+        products = list(Product.objects.all()[:5])
+        instances = [Product(upc=product.upc) for product in products]
+
+        with self.settings(ODIN_BATCH_SIZE=2), mock.patch(
+            "django.db.backends.sqlite3.features.DatabaseFeatures.max_query_params", 3
+        ):
+            with self.assertNumQueries(3):
+                mapping = in_bulk(Product.objects, instances, ("upc",))
+
+        self.assertEqual(len(products), len(mapping))